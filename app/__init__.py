@@ -1,13 +1,21 @@
 from quart import Quart
 from quart_cors import cors
 from config import Config
-from sqlalchemy import create_engine
+from sqlalchemy import create_engine, event
+from sqlalchemy.engine import make_url
+from sqlalchemy.pool import QueuePool, AsyncAdaptedQueuePool
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker
 from sqlalchemy.orm import scoped_session, sessionmaker, declarative_base
 from argon2 import PasswordHasher
 from argon2.exceptions import VerifyMismatchError, InvalidHashError
 import jwt
 from datetime import datetime, timedelta, timezone
 from functools import wraps
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+import asyncio
+import threading
+import time
+import uuid
 
 
 app = Quart(
@@ -33,32 +41,215 @@ app = cors(
     allow_credentials=True,
 )
 
+# Async drivers (see requirements.txt) matching each sync backend
+ASYNC_DRIVERS = {
+    "sqlite": "aiosqlite",
+    "postgresql": "asyncpg",
+    "mysql": "aiomysql",
+}
+
+
+def async_database_uri(uri):
+    """Map a sync database URI onto the async driver for the same backend"""
+    url = make_url(uri)
+    backend = url.get_backend_name()
+    if backend in ASYNC_DRIVERS:
+        url = url.set(drivername=f"{backend}+{ASYNC_DRIVERS[backend]}")
+    return url
+
+
+# asyncio task ids that have a scoped session, see _session_scope()
+_scoped_tasks = set()
+
+
+def _release_task_session(task):
+    """Close the session of a finished task so ids can't be reused with it"""
+    key = id(task)
+    _scoped_tasks.discard(key)
+    session = db_session.registry.registry.pop(key, None)
+    if session is not None:
+        session.close()
+
+
+def _session_scope():
+    """
+    Scope sessions to the current asyncio task. Quart serves every request as
+    its own task on the event loop thread, so a per-thread scope would share
+    one session and transaction between interleaved requests. Code running
+    outside the event loop (worker threads, scripts) keeps a per-thread session.
+    """
+    try:
+        task = asyncio.current_task()
+    except RuntimeError:
+        task = None
+
+    if task is None:
+        return threading.get_ident()
+
+    key = id(task)
+    if key not in _scoped_tasks:
+        _scoped_tasks.add(key)
+        task.add_done_callback(_release_task_session)
+    return key
+
+
+# Pool settings used when the matching DB_POOL_* variable isn't set. Servers
+# close idle connections (MySQL after wait_timeout, proxies sooner), so those
+# get pinged on checkout and recycled before they go stale.
+POOL_DEFAULTS = {
+    "sqlite": {
+        "pool_size": 5,
+        "max_overflow": 10,
+        "pool_recycle": -1,
+        "pool_pre_ping": False,
+    },
+    "postgresql": {
+        "pool_size": 10,
+        "max_overflow": 20,
+        "pool_recycle": 1800,
+        "pool_pre_ping": True,
+    },
+    "mysql": {
+        "pool_size": 10,
+        "max_overflow": 20,
+        "pool_recycle": 3600,
+        "pool_pre_ping": True,
+    },
+}
+
+
+def engine_options(uri, config=Config, is_async=False):
+    """Keyword arguments for create_engine() built from the DB_POOL_* settings"""
+    url = make_url(uri)
+    backend = url.get_backend_name()
+    options = {"pool_timeout": config.DB_POOL_TIMEOUT}
+
+    if backend == "sqlite":
+        # In-memory SQLite uses a single shared connection, not a sized pool
+        if url.database in (None, "", ":memory:"):
+            return {}
+        # aiosqlite defaults to NullPool, which reconnects (and re-runs the
+        # pragmas) for every session
+        options["poolclass"] = AsyncAdaptedQueuePool if is_async else QueuePool
+
+    defaults = POOL_DEFAULTS.get(backend, POOL_DEFAULTS["postgresql"])
+    for key, setting, cast in (
+        ("pool_size", config.DB_POOL_SIZE, int),
+        ("max_overflow", config.DB_MAX_OVERFLOW, int),
+        ("pool_recycle", config.DB_POOL_RECYCLE, int),
+        ("pool_pre_ping", config.DB_POOL_PRE_PING, lambda v: v.lower() == "true"),
+    ):
+        options[key] = defaults[key] if setting is None else cast(setting)
+    return options
+
+
+def _set_sqlite_pragmas(dbapi_connection, connection_record):
+    """
+    WAL lets readers run while a note is being written, and synchronous=NORMAL
+    is safe under WAL. busy_timeout makes writers queue for the lock instead
+    of failing straight away with "database is locked".
+    """
+    cursor = dbapi_connection.cursor()
+    cursor.execute(f"PRAGMA journal_mode={Config.SQLITE_JOURNAL_MODE}")
+    cursor.execute(f"PRAGMA synchronous={Config.SQLITE_SYNCHRONOUS}")
+    cursor.execute(f"PRAGMA busy_timeout={int(Config.SQLITE_BUSY_TIMEOUT_MS)}")
+    cursor.execute(f"PRAGMA mmap_size={int(Config.SQLITE_MMAP_SIZE)}")
+    cursor.close()
+
+
+class PoolMonitor:
+    """Tracks checkouts from an engine's connection pool for sizing it under load"""
+
+    def __init__(self, name, engine):
+        self.name = name
+        self.engine = engine
+        self.checkouts = 0
+        self.connects = 0
+        self.max_checked_out = 0
+        event.listen(engine, "connect", self._on_connect)
+        event.listen(engine, "checkout", self._on_checkout)
+
+    def _on_connect(self, dbapi_connection, connection_record):
+        self.connects += 1
+
+    def _on_checkout(self, dbapi_connection, connection_record, connection_proxy):
+        self.checkouts += 1
+        checked_out = self._call("checkedout")
+        if checked_out is not None:
+            self.max_checked_out = max(self.max_checked_out, checked_out)
+
+    def _call(self, method):
+        # Only QueuePool reports checked out/overflow counts
+        func = getattr(self.engine.pool, method, None)
+        return func() if func else None
+
+    @property
+    def stats(self):
+        overflow = self._call("overflow")
+        return {
+            "pool": type(self.engine.pool).__name__,
+            "size": self._call("size"),
+            "checked_out": self._call("checkedout"),
+            "checked_in": self._call("checkedin"),
+            "overflow": max(0, overflow) if overflow is not None else None,
+            "max_checked_out": self.max_checked_out,
+            "checkouts": self.checkouts,
+            "connects": self.connects,
+        }
+
+
 # Setup SQLAlchemy directly (pure SQLAlchemy without Flask-SQLAlchemy)
-engine = create_engine(Config.SQLALCHEMY_DATABASE_URI)
-db_session = scoped_session(sessionmaker(bind=engine))
+engine = create_engine(
+    Config.SQLALCHEMY_DATABASE_URI,
+    **engine_options(Config.SQLALCHEMY_DATABASE_URI),
+)
+db_session = scoped_session(sessionmaker(bind=engine), scopefunc=_session_scope)
 Base = declarative_base()
 Base.query = db_session.query_property()
 
+# Async engine for routes that shouldn't block the event loop on queries
+_async_uri = Config.SQLALCHEMY_ASYNC_DATABASE_URI or async_database_uri(
+    Config.SQLALCHEMY_DATABASE_URI
+)
+async_engine = create_async_engine(
+    _async_uri, **engine_options(_async_uri, is_async=True)
+)
+
+for _engine in (engine, async_engine.sync_engine):
+    if _engine.dialect.name == "sqlite":
+        event.listen(_engine, "connect", _set_sqlite_pragmas)
+
+pool_monitors = [
+    PoolMonitor("sync", engine),
+    PoolMonitor("async", async_engine.sync_engine),
+]
+# Objects stay loaded after commit; lazy loads aren't possible in async code
+async_session = async_sessionmaker(async_engine, expire_on_commit=False)
+
 
 class DatabaseWrapper:
     """Wrapper providing Flask-SQLAlchemy-like interface for Quart"""
 
-    def __init__(self, engine, session, base):
+    def __init__(self, engine, session, base, async_engine=None, async_session=None):
         self.engine = engine
         self.session = session
         self.Model = base
         self.metadata = base.metadata
+        self.async_engine = async_engine
+        self.async_session = async_session
 
     def create_all(self):
         self.metadata.create_all(self.engine)
 
 
-db = DatabaseWrapper(engine, db_session, Base)
+db = DatabaseWrapper(engine, db_session, Base, async_engine, async_session)
 
 
 # Session cleanup after each request
+# Async so it runs in the request's task; Quart would run a sync teardown
+# function in a worker thread, which has a different session scope
 @app.teardown_appcontext
-def shutdown_session(exception=None):
+async def shutdown_session(exception=None):
     """Remove the database session at the end of each request."""
     db_session.remove()
 
@@ -87,6 +278,82 @@ class Argon2Wrapper:
 argon2 = Argon2Wrapper(password_hasher)
 
 
+class CryptoExecutor:
+    """Runs CPU-bound crypto in a worker pool so it doesn't stall the event loop"""
+
+    def __init__(self, name, max_workers, use_processes=False):
+        self.name = name
+        self.max_workers = max(1, max_workers)
+        self.use_processes = use_processes
+        self._pool = None
+        self.in_flight = 0
+        self.completed = 0
+        self.total_latency = 0.0
+        self.max_latency = 0.0
+
+    def _get_pool(self):
+        if self._pool is None:
+            pool_class = (
+                ProcessPoolExecutor if self.use_processes else ThreadPoolExecutor
+            )
+            self._pool = pool_class(max_workers=self.max_workers)
+        return self._pool
+
+    async def run(self, func, *args):
+        loop = asyncio.get_running_loop()
+        start = time.perf_counter()
+        self.in_flight += 1
+        try:
+            return await loop.run_in_executor(self._get_pool(), func, *args)
+        finally:
+            latency = time.perf_counter() - start
+            self.in_flight -= 1
+            self.completed += 1
+            self.total_latency += latency
+            self.max_latency = max(self.max_latency, latency)
+
+    @property
+    def stats(self):
+        return {
+            "workers": self.max_workers,
+            "kind": "process" if self.use_processes else "thread",
+            "in_flight": self.in_flight,
+            "queue_depth": max(0, self.in_flight - self.max_workers),
+            "completed": self.completed,
+            "avg_latency_ms": (
+                self.total_latency / self.completed * 1000 if self.completed else 0.0
+            ),
+            "max_latency_ms": self.max_latency * 1000,
+        }
+
+
+crypto_executor = CryptoExecutor("aes", Config.CRYPTO_WORKERS)
+password_executor = CryptoExecutor(
+    "argon2",
+    Config.PASSWORD_HASH_WORKERS,
+    use_processes=Config.PASSWORD_HASH_EXECUTOR == "process",
+)
+
+
+# Module-level so they can be pickled into a process pool
+def _hash_password(password):
+    return argon2.generate_password_hash(password)
+
+
+def _check_password(hash, password):
+    return argon2.check_password_hash(hash, password)
+
+
+async def generate_password_hash_async(password):
+    """Hash a password on the password executor"""
+    return await password_executor.run(_hash_password, password)
+
+
+async def check_password_hash_async(hash, password):
+    """Verify a password on the password executor"""
+    return await password_executor.run(_check_password, hash, password)
+
+
 class JWTManager:
     """Custom JWT manager for Quart using PyJWT"""
 
@@ -105,12 +372,14 @@ class JWTManager:
         if expires:
             self.token_expires = expires
 
-    def create_access_token(self, identity):
+    def create_access_token(self, identity, user_id=None):
         payload = {
             "sub": identity,
             "iat": datetime.now(timezone.utc),
             "exp": datetime.now(timezone.utc) + self.token_expires,
         }
+        if user_id is not None:
+            payload["uid"] = str(user_id)
         return jwt.encode(payload, self.secret_key, algorithm=self.algorithm)
 
     def decode_token(self, token):
@@ -126,9 +395,9 @@ class JWTManager:
 jwt_manager = JWTManager(app)
 
 
-def create_access_token(identity):
-    """Create a JWT access token"""
-    return jwt_manager.create_access_token(identity)
+def create_access_token(identity, user_id=None):
+    """Create a JWT access token, carrying the user's uuid when given"""
+    return jwt_manager.create_access_token(identity, user_id)
 
 
 def get_jwt_identity():
@@ -138,6 +407,45 @@ def get_jwt_identity():
     return getattr(g, "jwt_identity", None)
 
 
+def _load_current_user(payload):
+    """Resolve the token's user once per request and keep it on g"""
+    from quart import g
+    from app.models import User, load_user, user_cache
+
+    g.jwt_identity = payload.get("sub")
+    user_id = payload.get("uid")
+
+    if user_id:
+        try:
+            g.current_user = load_user(db.session, uuid.UUID(user_id))
+        except ValueError:
+            g.current_user = None
+    elif g.jwt_identity:
+        # Tokens issued before the uid claim was added
+        g.current_user = User.query.filter_by(username=g.jwt_identity.lower()).first()
+        if g.current_user:
+            user_cache.put(g.current_user)
+    else:
+        g.current_user = None
+
+
+def get_current_user():
+    """The authenticated user, loaded by jwt_required() into the scoped session"""
+    from quart import g
+
+    return getattr(g, "current_user", None)
+
+
+async def get_current_user_async(session):
+    """The authenticated user, attached to the given AsyncSession"""
+    from app.models import load_user_async
+
+    user = get_current_user()
+    if user is None:
+        return None
+    return await load_user_async(session, user.uuid)
+
+
 def jwt_required():
     """Decorator to require JWT authentication for a route"""
 
@@ -156,7 +464,7 @@ def jwt_required():
             if not payload:
                 abort(401)
 
-            g.jwt_identity = payload.get("sub")
+            _load_current_user(payload)
             return await f(*args, **kwargs)
 
         return decorated_function
@@ -178,8 +486,8 @@ def verify_jwt_in_request():
     if not payload:
         raise Exception("Invalid or expired token")
 
-    g.jwt_identity = payload.get("sub")
+    _load_current_user(payload)
     return payload
 
 
-from app import routes, models
+from app import routes, models, jobs, image_variants, search_index, label_index
@@ -0,0 +1,230 @@
+"""
+Resized variants of uploaded images (/uploads/<path>?w=640), generated on
+demand in a worker pool and kept in a size-bounded LRU cache on disk under
+UPLOAD_FOLDER/.variants. Pillow is optional; without it the original file
+is served.
+"""
+
+import asyncio
+import logging
+import os
+import threading
+from collections import OrderedDict
+
+from sqlalchemy import event
+
+from app import app, CryptoExecutor
+from app.models import Upload
+
+try:
+    from PIL import Image, ImageOps
+except ImportError:
+    Image = None
+
+logger = logging.getLogger(__name__)
+
+VARIANT_DIR = ".variants"
+VARIANT_FORMAT = "webp"
+VARIANT_MIMETYPE = "image/webp"
+RESIZABLE_EXTENSIONS = {"png", "jpg", "jpeg", "gif", "webp"}
+
+image_executor = CryptoExecutor("image", app.config["IMAGE_WORKERS"])
+
+
+def snap_width(requested):
+    """The smallest configured width covering requested, capped at the largest"""
+    widths = app.config["IMAGE_VARIANT_WIDTHS"]
+    for width in widths:
+        if width >= requested:
+            return width
+    return widths[-1]
+
+
+def _render_variant(source, target, width, quality):
+    """
+    Write source scaled down to width as WebP at target. Returns the size of
+    the written file, or None when the original should be served instead
+    (already narrow enough, animated, or not decodable).
+    """
+    with Image.open(source) as image:
+        if getattr(image, "is_animated", False):
+            return None
+        # Both sides, so rotated (EXIF orientation) photos still come out wide
+        # enough; lets JPEG decode at a reduced scale
+        if min(image.size) > width:
+            image.draft("RGB", (width, width))
+        image = ImageOps.exif_transpose(image)
+        if image.width <= width:
+            return None
+        image.thumbnail((width, image.height), Image.LANCZOS)
+        if image.mode not in ("RGB", "RGBA"):
+            has_alpha = "A" in image.mode or "transparency" in image.info
+            image = image.convert("RGBA" if has_alpha else "RGB")
+
+        os.makedirs(os.path.dirname(target), exist_ok=True)
+        temp_path = f"{target}.{threading.get_ident()}.part"
+        try:
+            image.save(temp_path, VARIANT_FORMAT, quality=quality, method=4)
+            os.replace(temp_path, target)
+        except BaseException:
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+            raise
+    return os.path.getsize(target)
+
+
+class VariantCache:
+    """
+    Generated variant files, evicted least recently used first once their
+    total size passes max_bytes. The order lives in memory and is seeded from
+    file mtimes when the cache is first used, so it roughly survives restarts.
+    """
+
+    def __init__(self, max_bytes):
+        self.max_bytes = max_bytes
+        self._entries = OrderedDict()  # variant path -> size in bytes
+        self._total = 0
+        self._root = None
+        self._lock = threading.Lock()
+        self._pending = {}  # variant path -> task rendering it
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.errors = 0
+
+    @staticmethod
+    def root():
+        return os.path.join(app.config["UPLOAD_FOLDER"], VARIANT_DIR)
+
+    def variant_path(self, upload_path, width):
+        """
+        Where the width variant of /uploads/<user>/<file> is cached. The
+        quality is part of the name (and so of the ETag), since variants are
+        served as immutable.
+        """
+        quality = app.config["IMAGE_VARIANT_QUALITY"]
+        return f"{self._variant_prefix(upload_path)}{width}.q{quality}.{VARIANT_FORMAT}"
+
+    def _variant_prefix(self, upload_path):
+        relative = upload_path.replace("/uploads/", "", 1)
+        return os.path.join(self.root(), f"{relative}.w")
+
+    def _load(self):
+        """Index the variants already on disk (called with the lock held)"""
+        root = self.root()
+        if self._root == root:
+            return
+        found = []
+        for dirpath, _, filenames in os.walk(root):
+            for name in filenames:
+                if name.endswith(f".{VARIANT_FORMAT}"):
+                    stat = os.stat(os.path.join(dirpath, name))
+                    found.append(
+                        (stat.st_mtime, os.path.join(dirpath, name), stat.st_size)
+                    )
+        found.sort()
+        self._entries = OrderedDict((path, size) for _, path, size in found)
+        self._total = sum(size for _, _, size in found)
+        self._root = root
+        self._evict()
+
+    def _lookup(self, path):
+        with self._lock:
+            self._load()
+            if path in self._entries:
+                self._entries.move_to_end(path)
+                self.hits += 1
+                return True
+            self.misses += 1
+            return False
+
+    def _add(self, path, size):
+        with self._lock:
+            self._total += size - self._entries.pop(path, 0)
+            self._entries[path] = size
+            self._evict()
+
+    def _evict(self):
+        while self._total > self.max_bytes and len(self._entries) > 1:
+            path, size = self._entries.popitem(last=False)
+            self._total -= size
+            self.evictions += 1
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+
+    def _render(self, source, path, width):
+        size = _render_variant(source, path, width, app.config["IMAGE_VARIANT_QUALITY"])
+        if size is not None:
+            self._add(path, size)
+        return size
+
+    async def get(self, upload_path, source, requested_width):
+        """
+        Path of a cached variant of the upload at source, rendering it in the
+        image pool if needed. None means the original should be served.
+        """
+        if Image is None or requested_width <= 0:
+            return None
+        if os.path.splitext(source)[1].lower().lstrip(".") not in RESIZABLE_EXTENSIONS:
+            return None
+
+        width = snap_width(requested_width)
+        path = self.variant_path(upload_path, width)
+        if await asyncio.to_thread(self._lookup, path):
+            return path
+
+        # Concurrent requests for the same variant share one render
+        task = self._pending.get(path)
+        if task is None:
+            task = asyncio.ensure_future(
+                image_executor.run(self._render, source, path, width)
+            )
+            self._pending[path] = task
+            task.add_done_callback(lambda _: self._pending.pop(path, None))
+        try:
+            size = await asyncio.shield(task)
+        except Exception as e:
+            self.errors += 1
+            logger.warning(f"Could not resize {upload_path}: {e}")
+            return None
+        return path if size is not None else None
+
+    def invalidate(self, upload_path):
+        """Drop every cached variant of an upload, whatever its width and quality"""
+        prefix = self._variant_prefix(upload_path)
+        with self._lock:
+            self._load()
+            for path in [path for path in self._entries if path.startswith(prefix)]:
+                self._total -= self._entries.pop(path)
+                try:
+                    os.remove(path)
+                except FileNotFoundError:
+                    pass
+
+    @property
+    def stats(self):
+        return {
+            "enabled": Image is not None,
+            "files": len(self._entries),
+            "bytes": self._total,
+            "max_bytes": self.max_bytes,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "errors": self.errors,
+        }
+
+
+variant_cache = VariantCache(app.config["IMAGE_VARIANT_CACHE_MB"] * 1024 * 1024)
+
+
+def invalidate_upload_variants(mapper, connection, target):
+    try:
+        variant_cache.invalidate(target.path)
+    except OSError as e:
+        logger.warning(f"Could not remove variants of {target.path}: {e}")
+
+
+event.listen(Upload, "after_delete", invalidate_upload_variants)
@@ -0,0 +1,437 @@
+"""
+Background maintenance jobs started with the server.
+"""
+
+import asyncio
+import datetime
+import logging
+import os
+
+from sqlalchemy import select, update, delete, insert, func, or_
+
+from app import app, db
+from app.image_variants import variant_cache
+from app.search_index import search_index
+from app.models import (
+    User,
+    Note,
+    Meta,
+    Upload,
+    FreedUpload,
+    upload_is_orphan,
+    ENCRYPTION_V3_MARKER,
+    MARKER_SIZE,
+    FORMAT_V3,
+    detect_encryption_format,
+    aes_encrypt,
+    aes_decrypt,
+    aes_decrypt_many,
+    count_words,
+    sync_note_tokens,
+)
+
+logger = logging.getLogger(__name__)
+
+
+def _not_v3(column):
+    return func.substr(column, 1, MARKER_SIZE) != ENCRYPTION_V3_MARKER
+
+
+def reencrypt_notes_batch(batch_size, after=None):
+    """
+    Rewrite up to batch_size notes whose body or title is not in the v3 format.
+
+    Returns (rewritten_count, last_uuid); last_uuid is None when the table has
+    been exhausted. Rows are selected by format, so an interrupted run resumes
+    where it left off; the uuid cursor only skips rows that could not be
+    decrypted during this run.
+    """
+    notes = Note.__table__
+    query = select(notes.c.uuid, notes.c.data, notes.c.title).where(
+        or_(_not_v3(notes.c.data), _not_v3(notes.c.title))
+    )
+    if after is not None:
+        query = query.where(notes.c.uuid > after)
+    query = query.order_by(notes.c.uuid).limit(batch_size)
+
+    rewritten = 0
+    with db.engine.begin() as conn:
+        rows = conn.execute(query).all()
+        for row in rows:
+            values = {}
+            for column in ("data", "title"):
+                value = getattr(row, column)
+                if value is None or detect_encryption_format(value) == FORMAT_V3:
+                    continue
+                plain = aes_decrypt(value)
+                if isinstance(plain, str):
+                    values[column] = aes_encrypt(plain)
+                else:
+                    logger.warning(
+                        f"Skipping note {row.uuid} {column}: could not be decoded"
+                    )
+
+            if not values:
+                continue
+
+            # Only rewrite if nobody saved the note in the meantime
+            result = conn.execute(
+                update(notes)
+                .where(
+                    notes.c.uuid == row.uuid,
+                    notes.c.data.is_not_distinct_from(row.data),
+                    notes.c.title == row.title,
+                )
+                .values(**values)
+            )
+            rewritten += result.rowcount
+
+    last_uuid = rows[-1].uuid if len(rows) == batch_size else None
+    return rewritten, last_uuid
+
+
+def reencrypt_meta_batch(batch_size, after=None):
+    """
+    Rewrite up to batch_size meta rows whose name is not in the v3 format.
+
+    Task rows keep name_compare equal to name so before_update_task does not
+    mistake the rewrite for a rename. Same return value as
+    reencrypt_notes_batch().
+    """
+    meta = Meta.__table__
+    query = select(meta.c.uuid, meta.c.name, meta.c.name_compare).where(
+        _not_v3(meta.c.name)
+    )
+    if after is not None:
+        query = query.where(meta.c.uuid > after)
+    query = query.order_by(meta.c.uuid).limit(batch_size)
+
+    rewritten = 0
+    with db.engine.begin() as conn:
+        rows = conn.execute(query).all()
+        for row in rows:
+            name = aes_decrypt(row.name)
+            if not isinstance(name, str):
+                logger.warning(f"Skipping meta {row.uuid}: name could not be decoded")
+                continue
+
+            encrypted = aes_encrypt(name)
+            values = {"name": encrypted}
+            if row.name_compare == row.name:
+                values["name_compare"] = encrypted
+
+            result = conn.execute(
+                update(meta)
+                .where(meta.c.uuid == row.uuid, meta.c.name == row.name)
+                .values(**values)
+            )
+            rewritten += result.rowcount
+
+    last_uuid = rows[-1].uuid if len(rows) == batch_size else None
+    return rewritten, last_uuid
+
+
+async def reencrypt_legacy_records():
+    """
+    Walk note and meta rows in throttled batches, rewriting every value that
+    is not yet in the v3 format. Runs until both tables are exhausted.
+    """
+    batch_size = app.config["REENCRYPT_BATCH_SIZE"]
+    interval = app.config["REENCRYPT_INTERVAL_SECONDS"]
+
+    for label, run_batch in (
+        ("notes", reencrypt_notes_batch),
+        ("meta", reencrypt_meta_batch),
+    ):
+        total = 0
+        after = None
+        while True:
+            try:
+                rewritten, after = await asyncio.to_thread(run_batch, batch_size, after)
+            except Exception as e:
+                logger.warning(f"Re-encryption of {label} stopped: {e}")
+                break
+
+            total += rewritten
+            if after is None:
+                break
+            await asyncio.sleep(interval)
+
+        if total:
+            logger.info(f"Re-encrypted {total} legacy {label} rows")
+
+
+def index_notes_batch(batch_size):
+    """
+    Write the search tokens of up to batch_size notes whose words are not
+    indexed (tokens_indexed is NULL or false).
+
+    Returns (indexed_count, user_ids, more); more is False once no unindexed
+    notes are left. Each note is only indexed if nobody saved it in the
+    meantime; a save indexes it anyway.
+    """
+    notes = Note.__table__
+    query = (
+        select(notes.c.uuid, notes.c.user_id, notes.c.data)
+        .where(notes.c.tokens_indexed.is_not(True))
+        .limit(batch_size)
+    )
+
+    indexed = 0
+    user_ids = set()
+    with db.engine.begin() as conn:
+        rows = conn.execute(query).all()
+        texts = aes_decrypt_many([row.data for row in rows])
+        for row, text in zip(rows, texts):
+            if not isinstance(text, str):
+                logger.warning(f"Note {row.uuid} could not be decoded; not indexed")
+                text = ""
+            word_counts = count_words(text)
+            result = conn.execute(
+                update(notes)
+                .where(
+                    notes.c.uuid == row.uuid,
+                    notes.c.data.is_not_distinct_from(row.data),
+                )
+                .values(tokens_indexed=True, word_count=sum(word_counts.values()))
+            )
+            if not result.rowcount:
+                continue
+            sync_note_tokens(conn, row.user_id, row.uuid, word_counts)
+            indexed += 1
+            user_ids.add(row.user_id)
+
+    return indexed, user_ids, len(rows) == batch_size
+
+
+async def index_unindexed_notes():
+    """
+    Write the search tokens of notes saved before the search index existed,
+    in throttled batches. Until a note is indexed, searches decrypt and check
+    it along with the candidates from the index.
+    """
+    batch_size = app.config["SEARCH_INDEX_BATCH_SIZE"]
+    interval = app.config["SEARCH_INDEX_INTERVAL_SECONDS"]
+
+    total = 0
+    while True:
+        try:
+            indexed, user_ids, more = await asyncio.to_thread(
+                index_notes_batch, batch_size
+            )
+        except Exception as e:
+            logger.warning(f"Search index backfill stopped: {e}")
+            break
+
+        # Their words were added outside a session; reload them on next search
+        for user_id in user_ids:
+            search_index.invalidate(user_id)
+        total += indexed
+        if not more:
+            break
+        await asyncio.sleep(interval)
+
+    if total:
+        logger.info(f"Indexed the words of {total} notes for search")
+
+
+# Outcome of the upload garbage collector, reported by /api/metrics
+upload_gc_stats = {
+    "runs": 0,
+    "last_run_at": None,
+    "last_run_freed": 0,
+    "freed_files": 0,
+    "freed_bytes": 0,
+}
+
+
+UPLOAD_GC_SCAN_BATCH_SIZE = 200
+
+
+def _mentioned_uploads(conn, user_id, paths):
+    """
+    The paths whose file name appears in the body of one of a user's notes,
+    or all of them if a body can't be decrypted. Bodies are read a batch at
+    a time and the scan stops once every path has been found.
+    """
+    names = {path: path.rsplit("/", 1)[-1] for path in paths}
+    notes = Note.__table__
+    mentioned = set()
+    after = None
+    while len(mentioned) < len(names):
+        query = select(notes.c.uuid, notes.c.data).where(
+            notes.c.user_id == user_id, notes.c.data.is_not(None)
+        )
+        if after is not None:
+            query = query.where(notes.c.uuid > after)
+        rows = conn.execute(
+            query.order_by(notes.c.uuid).limit(UPLOAD_GC_SCAN_BATCH_SIZE)
+        ).all()
+        if not rows:
+            break
+        for row, text in zip(rows, aes_decrypt_many([row.data for row in rows])):
+            if not isinstance(text, str):
+                logger.warning(
+                    f"Note {row.uuid} could not be decrypted; "
+                    f"keeping the uploads of user {user_id}"
+                )
+                return set(names)
+            mentioned.update(path for path, name in names.items() if name in text)
+        after = rows[-1].uuid
+    return mentioned
+
+
+def collect_orphan_uploads(user_id, cutoff, limit):
+    """
+    Delete up to limit of a user's uploads that no note references and that
+    have not been referenced since cutoff, recording each in freed_upload.
+
+    Before anything is deleted, the user's note bodies are searched for the
+    file names of the candidates: one a note still mentions is kept, and its
+    grace period restarted, even though note_upload_ref has no row for it.
+    Each row is deleted with the orphan and grace conditions repeated, so an
+    upload a note picked up again in the meantime is left alone. Returns the
+    list of FreedUpload values recorded.
+    """
+    uploads = Upload.__table__
+    last_seen = func.coalesce(uploads.c.last_seen_at, uploads.c.created_at)
+    collectable = (
+        uploads.c.user_id == user_id,
+        upload_is_orphan(),
+        last_seen < cutoff,
+    )
+
+    freed = []
+    with db.engine.begin() as conn:
+        query = select(uploads.c.uuid, uploads.c.path, uploads.c.size, last_seen)
+        if limit is not None:
+            query = query.limit(limit)
+        candidates = conn.execute(query.where(*collectable)).all()
+
+        mentioned = set()
+        if candidates:
+            mentioned = _mentioned_uploads(
+                conn, user_id, {row.path for row in candidates}
+            )
+        if mentioned:
+            logger.warning(
+                f"Kept {len(mentioned)} uploads of user {user_id} that notes "
+                f"mention without a reference: {sorted(mentioned)}"
+            )
+            conn.execute(
+                update(uploads)
+                .where(uploads.c.user_id == user_id, uploads.c.path.in_(mentioned))
+                .values(last_seen_at=datetime.datetime.utcnow())
+            )
+
+        for row in candidates:
+            if row.path in mentioned:
+                continue
+            result = conn.execute(
+                delete(uploads).where(uploads.c.uuid == row.uuid, *collectable)
+            )
+            if result.rowcount:
+                freed.append(
+                    {
+                        "user_id": user_id,
+                        "path": row.path,
+                        "size": row.size,
+                        "last_seen_at": row[3],
+                        "freed_at": datetime.datetime.utcnow(),
+                    }
+                )
+        if freed:
+            conn.execute(insert(FreedUpload.__table__), freed)
+
+    # Only once the rows are gone, so a failed commit never loses a file
+    for entry in freed:
+        file_path = os.path.join(
+            app.config["UPLOAD_FOLDER"], entry["path"].replace("/uploads/", "", 1)
+        )
+        try:
+            os.remove(file_path)
+        except FileNotFoundError:
+            pass
+        except OSError as e:
+            logger.warning(f"Could not delete orphaned upload {file_path}: {e}")
+        try:
+            variant_cache.invalidate(entry["path"])
+        except OSError as e:
+            logger.warning(f"Could not delete variants of {entry['path']}: {e}")
+
+    return freed
+
+
+def prune_freed_uploads(before):
+    """Forget freed_upload records older than before"""
+    with db.engine.begin() as conn:
+        conn.execute(delete(FreedUpload.__table__).where(FreedUpload.freed_at < before))
+
+
+def list_user_ids(after, limit):
+    query = select(User.__table__.c.uuid).order_by(User.__table__.c.uuid).limit(limit)
+    if after is not None:
+        query = query.where(User.__table__.c.uuid > after)
+    with db.engine.connect() as conn:
+        return conn.execute(query).scalars().all()
+
+
+async def collect_orphan_uploads_run(after=None):
+    """
+    One pass of the upload garbage collector: walk users from after in uuid
+    order, freeing orphans older than the grace period until
+    UPLOAD_GC_BATCH_SIZE uploads have been freed. Returns the uuid to resume
+    from, or None once every user has been visited.
+    """
+    budget = app.config["UPLOAD_GC_BATCH_SIZE"]
+    now = datetime.datetime.utcnow()
+    cutoff = now - datetime.timedelta(hours=app.config["UPLOAD_GC_GRACE_HOURS"])
+
+    freed = []
+    while len(freed) < budget:
+        user_ids = await asyncio.to_thread(list_user_ids, after, 100)
+        if not user_ids:
+            after = None
+            break
+        for user_id in user_ids:
+            after = user_id
+            freed += await asyncio.to_thread(
+                collect_orphan_uploads, user_id, cutoff, budget - len(freed)
+            )
+            if len(freed) >= budget:
+                break
+
+    await asyncio.to_thread(
+        prune_freed_uploads,
+        now - datetime.timedelta(days=app.config["UPLOAD_GC_LOG_DAYS"]),
+    )
+
+    upload_gc_stats["runs"] += 1
+    upload_gc_stats["last_run_at"] = now
+    upload_gc_stats["last_run_freed"] = len(freed)
+    upload_gc_stats["freed_files"] += len(freed)
+    upload_gc_stats["freed_bytes"] += sum(entry["size"] or 0 for entry in freed)
+    if freed:
+        logger.info(f"Upload GC freed {len(freed)} orphaned uploads")
+    return after
+
+
+async def collect_orphan_uploads_forever():
+    """Run the upload garbage collector every UPLOAD_GC_INTERVAL_SECONDS"""
+    after = None
+    while True:
+        try:
+            after = await collect_orphan_uploads_run(after)
+        except Exception as e:
+            logger.warning(f"Upload GC run failed: {e}")
+        await asyncio.sleep(app.config["UPLOAD_GC_INTERVAL_SECONDS"])
+
+
+@app.before_serving
+async def start_background_jobs():
+    if app.config["REENCRYPT_LEGACY"]:
+        app.add_background_task(reencrypt_legacy_records)
+    if app.config["UPLOAD_GC"]:
+        app.add_background_task(collect_orphan_uploads_forever)
+    if app.config["SEARCH_INDEX_BACKFILL"]:
+        app.add_background_task(index_unindexed_notes)
@@ -0,0 +1,162 @@
+"""
+Tag and project names of each user, sorted for prefix lookups, with the
+notes they label. A user's names are read from meta and decrypted in one go
+on first use; hierarchical tag filters in /api/search and
+/api/tags/complete are then answered with binary searches instead of
+decrypting every meta row. A user's entry is dropped when a commit changes
+their tags or projects, and rebuilt on next use.
+"""
+
+import bisect
+import logging
+import threading
+from collections import OrderedDict
+from itertools import islice
+
+from sqlalchemy import event, select
+from sqlalchemy.orm import Session
+
+from app import db, crypto_executor
+from app.models import Meta, LABEL_KINDS, aes_decrypt_many
+
+logger = logging.getLogger(__name__)
+
+MAX_USERS = 1024
+
+
+class Labels:
+    """The names of one kind of label of a user, sorted case-insensitively"""
+
+    def __init__(self, names):
+        """names: (name, note uuid) pairs, one per meta row"""
+        notes = {}
+        for name, note_id in names:
+            notes.setdefault(name, set()).add(note_id)
+
+        entries = sorted((name.lower(), name) for name in notes)
+        self._keys = [key for key, _ in entries]
+        self._names = [name for _, name in entries]
+        self._notes = [notes[name] for name in self._names]
+
+    def __len__(self):
+        return len(self._names)
+
+    def _prefixed(self, prefix):
+        """Positions of the names starting with prefix (lowercase)"""
+        position = bisect.bisect_left(self._keys, prefix)
+        while position < len(self._keys) and self._keys[position].startswith(prefix):
+            yield position
+            position += 1
+
+    def complete(self, prefix, limit):
+        """Up to limit (name, note count) pairs for the names starting with prefix"""
+        return [
+            (self._names[position], len(self._notes[position]))
+            for position in islice(self._prefixed(prefix.lower()), limit)
+        ]
+
+    def notes(self, name, nested=False):
+        """
+        Notes labelled name, ignoring case. With nested, also the notes
+        labelled with its children: home matches home/family, home/tech...
+        """
+        key = name.lower()
+        found = set()
+        for position in self._prefixed(key):
+            # Equal keys sort before longer ones
+            if self._keys[position] != key:
+                break
+            found |= self._notes[position]
+        if nested:
+            for position in self._prefixed(key + "/"):
+                found |= self._notes[position]
+        return found
+
+
+class LabelIndexCache:
+    """
+    Per-user dicts of kind -> Labels, least recently used first out once
+    there are more than max_users.
+    """
+
+    def __init__(self, max_users):
+        self.max_users = max_users
+        self._indexes = OrderedDict()  # user uuid -> {kind: Labels}
+        self._generations = {}  # user uuid -> number of invalidations
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.loads = 0
+        self.invalidations = 0
+
+    def _load(self, user_id):
+        """Read and decrypt a user's tag and project names (runs in a worker)"""
+        meta = Meta.__table__
+        with db.engine.connect() as conn:
+            rows = conn.execute(
+                select(meta.c.note_id, meta.c.kind, meta.c.name).where(
+                    meta.c.user_id == user_id, meta.c.kind.in_(LABEL_KINDS)
+                )
+            ).all()
+
+        names = aes_decrypt_many([row.name for row in rows])
+        pairs = {kind: [] for kind in LABEL_KINDS}
+        for row, name in zip(rows, names):
+            if isinstance(name, str):
+                pairs[row.kind].append((name, row.note_id))
+            else:
+                logger.warning(f"Meta name of note {row.note_id} could not be decoded")
+        return {kind: Labels(kind_pairs) for kind, kind_pairs in pairs.items()}
+
+    async def get(self, user_id):
+        """A user's dict of kind -> Labels, loading it in the crypto pool if needed"""
+        with self._lock:
+            labels = self._indexes.get(user_id)
+            if labels is not None:
+                self._indexes.move_to_end(user_id)
+                self.hits += 1
+                return labels
+            generation = self._generations.get(user_id, 0)
+
+        labels = await crypto_executor.run(self._load, user_id)
+
+        with self._lock:
+            self.loads += 1
+            # Unless the user's labels changed while this load was reading
+            if self._generations.get(user_id, 0) == generation:
+                self._indexes[user_id] = labels
+                self._indexes.move_to_end(user_id)
+                while len(self._indexes) > self.max_users:
+                    self._indexes.popitem(last=False)
+        return labels
+
+    def invalidate(self, user_id):
+        """Drop a user's labels, e.g. after notes were written outside a session"""
+        with self._lock:
+            self._indexes.pop(user_id, None)
+            self._generations[user_id] = self._generations.get(user_id, 0) + 1
+            self.invalidations += 1
+
+    @property
+    def stats(self):
+        return {
+            "users": len(self._indexes),
+            "hits": self.hits,
+            "loads": self.loads,
+            "invalidations": self.invalidations,
+        }
+
+
+label_index = LabelIndexCache(MAX_USERS)
+
+
+def invalidate_committed_labels(session):
+    for user_id in session.info.pop("label_users", ()):
+        label_index.invalidate(user_id)
+
+
+def discard_committed_labels(session):
+    session.info.pop("label_users", None)
+
+
+event.listen(Session, "after_commit", invalidate_committed_labels)
+event.listen(Session, "after_rollback", discard_committed_labels)
@@ -8,21 +8,41 @@ from sqlalchemy import (
     DateTime,
     LargeBinary,
     ForeignKey,
+    Index,
     event,
     text,
+    select,
+    insert,
+    update,
+    delete,
+    bindparam,
+    exists,
 )
 from sqlalchemy.sql import func
-from sqlalchemy.orm import relationship
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from sqlalchemy.dialects.postgresql import insert as postgresql_insert
+from sqlalchemy.orm import relationship, object_session, make_transient_to_detached
+from sqlalchemy.orm.util import identity_key
 from sqlalchemy.ext.hybrid import hybrid_property
-from sqlalchemy.orm.attributes import InstrumentedAttribute
+from sqlalchemy.orm.attributes import (
+    InstrumentedAttribute,
+    set_committed_value,
+    get_history,
+)
 from Crypto.Cipher import AES
 from Crypto.Random import get_random_bytes
 import binascii
+import hashlib
+import hmac
+import json
 import uuid
 import frontmatter
+from collections import Counter, namedtuple
+from urllib.parse import unquote
 import re
 import datetime
 import logging
+import time
 
 logger = logging.getLogger(__name__)
 
@@ -35,6 +55,11 @@ IV_SIZE = 16
 ENCRYPTION_V2_MARKER = b"\x00\x01\x02\x03"
 MARKER_SIZE = len(ENCRYPTION_V2_MARKER)
 
+# Magic bytes for the v3 format (AES-256-CTR + HMAC-SHA256, random nonce)
+ENCRYPTION_V3_MARKER = b"\x00\x01\x02\x04"
+NONCE_SIZE = 12
+TAG_SIZE = 16
+
 _encryption_key = app.config["DB_ENCRYPTION_KEY"]
 
 # Ensure key is bytes
@@ -47,15 +72,155 @@ _encryption_key = (_encryption_key + b"\0" * 32)[:32]
 # Legacy IV derived from key (for backwards compatibility with old data)
 _legacy_iv = _encryption_key[:16]
 
+# Separate key for authenticating v3 ciphertexts (encrypt-then-MAC)
+_mac_key = hmac.new(_encryption_key, b"dailynotes-v3-mac", hashlib.sha256).digest()
+
+
+def _v3_tag(header, ciphertext):
+    return hmac.new(_mac_key, header + ciphertext, hashlib.sha256).digest()[:TAG_SIZE]
+
+
+# Key for blind indexes over encrypted values (e.g. note titles)
+_index_key = hmac.new(
+    _encryption_key, b"dailynotes-title-index", hashlib.sha256
+).digest()
+
+
+def make_title_index(user_id, title):
+    """
+    Keyed HMAC of a note title, scoped to its owner.
+
+    Stored in Note.title_index so notes can be looked up by title with one
+    indexed equality probe while the title itself uses randomized encryption.
+    Including the user id keeps equal titles of different users unlinkable.
+    """
+    if not isinstance(user_id, uuid.UUID):
+        user_id = uuid.UUID(str(user_id))
+    if isinstance(title, str):
+        title = title.encode("utf-8")
+
+    return hmac.new(
+        _index_key, user_id.bytes + b"\x00" + title, hashlib.sha256
+    ).hexdigest()
+
+
+# Key for search tokens, kept separate from the title index key
+_token_key = hmac.new(
+    _encryption_key, b"dailynotes-search-token", hashlib.sha256
+).digest()
+
+# Words of a note body as the search index sees them
+WORD_PATTERN = re.compile(r"\w+")
+
+
+def tokenize(text):
+    """The distinct lowercased words of text"""
+    return set(WORD_PATTERN.findall(text.lower())) if text else set()
+
+
+def count_words(text):
+    """Occurrences of each lowercased word of text"""
+    return Counter(WORD_PATTERN.findall(text.lower())) if text else Counter()
+
+
+def make_search_token(user_id, word):
+    """
+    Keyed HMAC of a word, scoped to its owner and truncated to 128 bits.
+    The search index tables store these instead of the words, so the
+    database can match words without ever seeing them.
+    """
+    if not isinstance(user_id, uuid.UUID):
+        user_id = uuid.UUID(str(user_id))
+
+    return hmac.new(
+        _token_key, user_id.bytes + b"\x00" + word.encode("utf-8"), hashlib.sha256
+    ).hexdigest()[:32]
+
+
+# Key for note digests, kept separate from the title index key
+_digest_key = hmac.new(
+    _encryption_key, b"dailynotes-note-digest", hashlib.sha256
+).digest()
+
+
+def make_content_digest(user_id, text):
+    """
+    Keyed HMAC of a note body, stored in Note.content_digest so a save that
+    resends the stored body can be detected without decrypting it.
+    """
+    if not isinstance(user_id, uuid.UUID):
+        user_id = uuid.UUID(str(user_id))
+    if isinstance(text, str):
+        text = text.encode("utf-8")
+
+    return hmac.new(
+        _digest_key, b"content\x00" + user_id.bytes + (text or b""), hashlib.sha256
+    ).hexdigest()
+
+
+def make_meta_digest(user_id, parsed):
+    """
+    Keyed HMAC of the tags, projects, tasks (with columns) and upload paths
+    extracted from a note, stored in Note.meta_digest. Edits that leave it
+    unchanged don't need the note's meta or upload refs reconciled.
+    """
+    if not isinstance(user_id, uuid.UUID):
+        user_id = uuid.UUID(str(user_id))
+
+    canonical = json.dumps(
+        [
+            sorted(parsed.tags),
+            sorted(parsed.projects),
+            sorted(parsed.task_columns.items()),
+            sorted(parsed.uploads),
+        ]
+    ).encode("utf-8")
+
+    return hmac.new(
+        _digest_key, b"meta\x00" + user_id.bytes + canonical, hashlib.sha256
+    ).hexdigest()
+
+
+# Saves the digests let us skip, reported by /api/metrics
+note_save_stats = {
+    "unchanged_bodies_skipped": 0,
+    "meta_reconciliations_skipped": 0,
+    "meta_reconciliations": 0,
+}
+
 
 def aes_encrypt(data):
     """
-    Encrypt data using AES-256-CFB with a random IV.
+    Encrypt data using AES-256-CTR with a random nonce, authenticated with
+    a truncated HMAC-SHA256 over the header and ciphertext.
+
+    Format: V3 MARKER (4 bytes) + nonce (12 bytes) + tag (16 bytes) + ciphertext
+
+    CTR processes a full block per AES operation (CFB in its default 8-bit
+    segment mode needs one per byte), and the tag lets decryption detect
+    tampering or a format mismatch instead of returning garbage.
+    """
+    # Ensure data is bytes
+    if isinstance(data, str):
+        data = data.encode("utf-8")
+
+    # Generate a random nonce for each encryption
+    nonce = get_random_bytes(NONCE_SIZE)
+    cipher = AES.new(_encryption_key, AES.MODE_CTR, nonce=nonce)
+    ciphertext = cipher.encrypt(data)
+
+    header = ENCRYPTION_V3_MARKER + nonce
+    return header + _v3_tag(header, ciphertext) + ciphertext
+
+
+def aes_encrypt_v2(data):
+    """
+    Encrypt data using the v2 format (AES-256-CFB with a random IV).
 
     Format: MARKER (4 bytes) + IV (16 bytes) + ciphertext
 
-    This provides semantic security - encrypting the same plaintext
-    twice produces different ciphertexts.
+    Superseded by aes_encrypt() for new writes; kept so the v2 format can
+    still be produced for comparison (e.g. benchmarks) and tests of old data.
     """
     # Ensure data is bytes
     if isinstance(data, str):
@@ -78,6 +243,8 @@ def aes_encrypt_legacy_cfb(data):
     needed to look up records by encrypted field values in the database.
 
     DO NOT use for storing new sensitive data - use aes_encrypt() instead.
+    Title lookups now go through make_title_index(); this is only needed to
+    read values written by older versions.
     """
     # Ensure data is bytes
     if isinstance(data, str):
@@ -103,6 +270,23 @@ def aes_encrypt_old(data):
     return binascii.hexlify(cipher.encrypt(data))
 
 
+def _decrypt_v3(data):
+    """
+    Decrypt data encrypted with the v3 format (AES-256-CTR + HMAC).
+
+    Expected format: V3 MARKER (4 bytes) + nonce (12 bytes) + tag (16 bytes) + ciphertext
+    """
+    header = data[: MARKER_SIZE + NONCE_SIZE]
+    tag = data[MARKER_SIZE + NONCE_SIZE : MARKER_SIZE + NONCE_SIZE + TAG_SIZE]
+    ciphertext = data[MARKER_SIZE + NONCE_SIZE + TAG_SIZE :]
+
+    if not hmac.compare_digest(tag, _v3_tag(header, ciphertext)):
+        raise ValueError("V3 authentication tag mismatch")
+
+    cipher = AES.new(_encryption_key, AES.MODE_CTR, nonce=header[MARKER_SIZE:])
+    return cipher.decrypt(ciphertext).decode("utf-8")
+
+
 def _decrypt_v2(data):
     """
     Decrypt data encrypted with the new format (random IV).
@@ -137,35 +321,37 @@ def _decrypt_legacy_ecb(data):
     return cipher.decrypt(binascii.unhexlify(data)).rstrip().decode("ascii")
 
 
-def aes_decrypt(data):
-    """
-    Decrypt data, automatically detecting the encryption format.
+# Format tags returned by detect_encryption_format()
+FORMAT_V3 = "v3"
+FORMAT_V2 = "v2"
+FORMAT_LEGACY = "legacy"
 
-    Supports three formats for backwards compatibility:
-    1. New format (v2): MARKER + random IV + ciphertext
-    2. Legacy CFB: ciphertext with static IV derived from key
-    3. Legacy ECB: hex-encoded ciphertext with padding
-    4. Unencrypted: plain text (returned as-is)
-    """
-    # From a new object (SQLAlchemy instrumented attribute)
-    if type(data) is InstrumentedAttribute:
-        return ""
 
-    # Handle None or empty data
-    if not data:
-        return "" if data is None else data
+def detect_encryption_format(data):
+    """
+    Identify the format of a stored value from its marker bytes.
 
-    # Ensure data is bytes
+    v3 and v2 values carry a marker and are decrypted with a single dispatch.
+    Anything else is an untagged legacy value (static-IV CFB, ECB or plain
+    text) that can only be told apart by trial decryption.
+    """
     if isinstance(data, str):
         data = data.encode("utf-8")
 
-    # Try new format first (check for marker)
+    if (
+        data.startswith(ENCRYPTION_V3_MARKER)
+        and len(data) >= MARKER_SIZE + NONCE_SIZE + TAG_SIZE
+    ):
+        return FORMAT_V3
     if data.startswith(ENCRYPTION_V2_MARKER) and len(data) > MARKER_SIZE + IV_SIZE:
-        try:
-            return _decrypt_v2(data)
-        except (ValueError, UnicodeDecodeError) as e:
-            logger.debug(f"V2 decryption failed, trying legacy formats: {e}")
+        return FORMAT_V2
+    return FORMAT_LEGACY
 
+
+def _decrypt_legacy(data):
+    """
+    Decrypt an untagged legacy value by trying each old format in turn.
+    """
     # Try legacy CFB format (static IV)
     try:
         decrypted = _decrypt_legacy_cfb(data)
@@ -189,6 +375,176 @@ def aes_decrypt(data):
     return data
 
 
+def aes_decrypt(data):
+    """
+    Decrypt data, dispatching on the format detected from its marker.
+
+    Supports these formats for backwards compatibility:
+    1. Current format (v3): V3 MARKER + random nonce + HMAC tag + CTR ciphertext
+    2. Previous format (v2): MARKER + random IV + CFB ciphertext
+    3. Legacy CFB: ciphertext with static IV derived from key
+    4. Legacy ECB: hex-encoded ciphertext with padding
+    5. Unencrypted: plain text (returned as-is)
+
+    Tagged values (1, 2) take a single decryption. Untagged values (3-5) fall
+    back to trial decryption until the background re-encryption job has
+    rewritten them (see app.jobs).
+
+    A v3 value that fails its authentication check is corrupt or tampered
+    with; it is returned as is (bytes, like any value that cannot be
+    decoded) rather than retried as a legacy format.
+    """
+    # From a new object (SQLAlchemy instrumented attribute)
+    if type(data) is InstrumentedAttribute:
+        return ""
+
+    # Handle None or empty data
+    if not data:
+        return "" if data is None else data
+
+    # Ensure data is bytes
+    if isinstance(data, str):
+        data = data.encode("utf-8")
+
+    encryption_format = detect_encryption_format(data)
+    if encryption_format == FORMAT_V3:
+        try:
+            return _decrypt_v3(data)
+        except (ValueError, UnicodeDecodeError) as e:
+            # Never fall back to trial decryption here: static-IV CFB turns
+            # any bytes into something, often valid UTF-8 for short names
+            logger.warning(f"V3 decryption failed, value is corrupt: {e}")
+            return data
+
+    if encryption_format == FORMAT_V2:
+        try:
+            return _decrypt_v2(data)
+        except (ValueError, UnicodeDecodeError) as e:
+            # An untagged legacy value that happens to start with the marker
+            logger.debug(f"V2 decryption failed, trying legacy formats: {e}")
+
+    return _decrypt_legacy(data)
+
+
+# Values up to this many AES blocks are decrypted by aes_decrypt_many() with
+# one shared ECB keystream computation; longer ones amortize their own cipher
+_BULK_MAX_BLOCKS = 64
+_BULK_COUNTERS = [i.to_bytes(4, "big") for i in range(_BULK_MAX_BLOCKS)]
+_V3_HEADER_SIZE = MARKER_SIZE + NONCE_SIZE
+_V3_PREFIX_SIZE = _V3_HEADER_SIZE + TAG_SIZE
+
+# The ECB cipher only holds the expanded key, so one instance can be shared
+_keystream_cipher = AES.new(_encryption_key, AES.MODE_ECB)
+_mac_template = hmac.new(_mac_key, digestmod=hashlib.sha256)
+
+
+def aes_decrypt_many(values):
+    """
+    Decrypt a list of stored values, returning plaintexts in the same order.
+
+    Equivalent to [aes_decrypt(v) for v in values], but short v3 values (the
+    common case for titles, tags and tasks) share a single key schedule:
+    their CTR counter blocks are concatenated and encrypted in one ECB call,
+    then XORed against each ciphertext. Anything else falls back to
+    aes_decrypt().
+    """
+    results = [None] * len(values)
+    pending = []
+    counter_blocks = []
+
+    for i, data in enumerate(values):
+        if (
+            type(data) is not bytes
+            or not data.startswith(ENCRYPTION_V3_MARKER)
+            or len(data) < _V3_PREFIX_SIZE
+        ):
+            results[i] = aes_decrypt(data)
+            continue
+
+        ciphertext = data[_V3_PREFIX_SIZE:]
+        block_count = -(-len(ciphertext) // AES_BLOCK_SIZE)
+        if block_count > _BULK_MAX_BLOCKS:
+            results[i] = aes_decrypt(data)
+            continue
+
+        mac = _mac_template.copy()
+        mac.update(data[:_V3_HEADER_SIZE])
+        mac.update(ciphertext)
+        if not hmac.compare_digest(
+            mac.digest()[:TAG_SIZE], data[_V3_HEADER_SIZE:_V3_PREFIX_SIZE]
+        ):
+            # Corrupt or tampered with; see aes_decrypt
+            logger.warning("V3 decryption failed, value is corrupt: tag mismatch")
+            results[i] = data
+            continue
+
+        nonce = data[MARKER_SIZE:_V3_HEADER_SIZE]
+        counter_blocks.extend(nonce + c for c in _BULK_COUNTERS[:block_count])
+        pending.append((i, ciphertext, block_count))
+
+    if pending:
+        keystream = _keystream_cipher.encrypt(b"".join(counter_blocks))
+        offset = 0
+        for i, ciphertext, block_count in pending:
+            size = len(ciphertext)
+            stream = keystream[offset : offset + size]
+            offset += block_count * AES_BLOCK_SIZE
+            plain = (
+                int.from_bytes(ciphertext, "big") ^ int.from_bytes(stream, "big")
+            ).to_bytes(size, "big")
+            try:
+                results[i] = plain.decode("utf-8")
+            except UnicodeDecodeError as e:
+                logger.warning(f"V3 decryption failed, value is corrupt: {e}")
+                results[i] = values[i]
+
+    return results
+
+
+def aes_encrypt_many(values):
+    """
+    Encrypt a list of values, returning ciphertexts in the same order.
+
+    Equivalent to [aes_encrypt(v) for v in values]; the counterpart of
+    aes_decrypt_many(). The nonces come from one call to the random source
+    and the keystream of every short value from one ECB call, so encrypting
+    the tags and tasks of a note doesn't set up a cipher per name.
+    """
+    values = [v.encode("utf-8") if isinstance(v, str) else v for v in values]
+    nonces = get_random_bytes(NONCE_SIZE * len(values))
+    results = [None] * len(values)
+    pending = []
+    counter_blocks = []
+
+    for i, data in enumerate(values):
+        nonce = nonces[i * NONCE_SIZE : (i + 1) * NONCE_SIZE]
+        block_count = -(-len(data) // AES_BLOCK_SIZE)
+        if block_count > _BULK_MAX_BLOCKS:
+            results[i] = aes_encrypt(data)
+            continue
+        counter_blocks.extend(nonce + c for c in _BULK_COUNTERS[:block_count])
+        pending.append((i, nonce, block_count))
+
+    if pending:
+        keystream = _keystream_cipher.encrypt(b"".join(counter_blocks))
+        offset = 0
+        for i, nonce, block_count in pending:
+            data = values[i]
+            size = len(data)
+            stream = keystream[offset : offset + size]
+            offset += block_count * AES_BLOCK_SIZE
+            ciphertext = (
+                int.from_bytes(data, "big") ^ int.from_bytes(stream, "big")
+            ).to_bytes(size, "big")
+            header = ENCRYPTION_V3_MARKER + nonce
+            mac = _mac_template.copy()
+            mac.update(header)
+            mac.update(ciphertext)
+            results[i] = header + mac.digest()[:TAG_SIZE] + ciphertext
+
+    return results
+
+
 def aes_decrypt_old(data):
     """
     Legacy decryption function - tries ECB first, then falls back to raw data.
@@ -230,8 +586,107 @@ class User(Base):
         return "<User {}>".format(self.uuid)
 
 
+class UserCache:
+    """
+    Short-lived cache of user rows keyed by uuid, so authenticated requests
+    don't look the user up again. Entries hold column values rather than
+    instances; each session gets its own copy via merge(load=False).
+    """
+
+    def __init__(self, ttl, max_size=1024):
+        self.ttl = ttl
+        self.max_size = max_size
+        self._entries = {}
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, user_id):
+        entry = self._entries.get(user_id)
+        if entry is None or entry[0] < time.monotonic():
+            self.misses += 1
+            return None
+        self.hits += 1
+        return entry[1]
+
+    def put(self, user):
+        if self.ttl <= 0:
+            return
+        if len(self._entries) >= self.max_size:
+            # Drop expired entries first, then the oldest
+            now = time.monotonic()
+            for key in [k for k, v in self._entries.items() if v[0] < now]:
+                del self._entries[key]
+            if len(self._entries) >= self.max_size:
+                del self._entries[next(iter(self._entries))]
+        values = {
+            column.key: getattr(user, column.key) for column in User.__table__.columns
+        }
+        self._entries[user.uuid] = (time.monotonic() + self.ttl, values)
+
+    def invalidate(self, user_id):
+        self._entries.pop(user_id, None)
+
+    @property
+    def stats(self):
+        return {
+            "size": len(self._entries),
+            "ttl_seconds": self.ttl,
+            "hits": self.hits,
+            "misses": self.misses,
+        }
+
+
+user_cache = UserCache(app.config["USER_CACHE_TTL_SECONDS"])
+
+
+def _cached_user(values):
+    user = User(**values)
+    make_transient_to_detached(user)
+    return user
+
+
+def load_user(session, user_id):
+    """Get a user by uuid, from the cache when possible"""
+    values = user_cache.get(user_id)
+    if values is not None:
+        return session.merge(_cached_user(values), load=False)
+
+    user = session.get(User, user_id)
+    if user:
+        user_cache.put(user)
+    return user
+
+
+async def load_user_async(session, user_id):
+    """load_user() for an AsyncSession"""
+    values = user_cache.get(user_id)
+    if values is not None:
+        return await session.merge(_cached_user(values), load=False)
+
+    user = await session.get(User, user_id)
+    if user:
+        user_cache.put(user)
+    return user
+
+
+def invalidate_cached_user(mapper, connection, target):
+    user_cache.invalidate(target.uuid)
+
+
+event.listen(User, "after_update", invalidate_cached_user)
+event.listen(User, "after_delete", invalidate_cached_user)
+
+
+# Meta kinds that label notes (as opposed to tasks)
+LABEL_KINDS = ("tag", "project")
+
+
 class Meta(Base):
     __tablename__ = "meta"
+    __table_args__ = (
+        Index("ix_meta_user_id_kind", "user_id", "kind"),
+        Index("ix_meta_note_id_kind", "note_id", "kind"),
+    )
 
     uuid = Column(
         GUID, primary_key=True, index=True, unique=True, default=lambda: uuid.uuid4()
@@ -268,7 +723,16 @@ class Meta(Base):
 
 
 class Upload(Base):
+    """
+    A file stored under UPLOAD_FOLDER. New uploads are named after the SHA-256
+    of their bytes, so the same file uploaded twice by a user resolves to one
+    row and one file on disk.
+    """
+
     __tablename__ = "upload"
+    __table_args__ = (
+        Index("ix_upload_user_id_content_hash", "user_id", "content_hash"),
+    )
 
     uuid = Column(
         GUID, primary_key=True, index=True, unique=True, default=lambda: uuid.uuid4()
@@ -277,6 +741,7 @@ class Upload(Base):
     filename = Column(String(255), nullable=False)
     path = Column(String(512), nullable=False, unique=True)
     size = Column(Integer, nullable=True)
+    content_hash = Column(String(64), nullable=True)
     created_at = Column(DateTime(timezone=True), server_default=func.now())
     last_seen_at = Column(DateTime(timezone=True), nullable=True)
 
@@ -290,13 +755,119 @@ class Upload(Base):
             "filename": self.filename,
             "path": self.path,
             "size": self.size,
+            "content_hash": self.content_hash,
             "created_at": self.created_at,
             "last_seen_at": self.last_seen_at,
         }
 
 
+class NoteUploadRef(Base):
+    """
+    An upload path referenced from a note's body. Kept in sync by the note
+    flush hooks so orphaned uploads can be found without scanning notes.
+    """
+
+    __tablename__ = "note_upload_ref"
+    __table_args__ = (Index("ix_note_upload_ref_user_id_path", "user_id", "path"),)
+
+    note_id = Column(GUID, ForeignKey("note.uuid"), primary_key=True)
+    path = Column(String(512), primary_key=True)
+    user_id = Column(GUID, ForeignKey("user.uuid"), nullable=False)
+
+    def __repr__(self):
+        return "<NoteUploadRef {} {}>".format(self.note_id, self.path)
+
+
+def upload_is_orphan():
+    """
+    Condition matching uploads that no note references. Uploads of a user
+    with notes whose references are unknown never match.
+    """
+    return ~exists().where(
+        NoteUploadRef.user_id == Upload.user_id, NoteUploadRef.path == Upload.path
+    ) & ~exists().where(
+        Note.user_id == Upload.user_id, Note.upload_refs_indexed.is_not(True)
+    )
+
+
+class NoteToken(Base):
+    """
+    A word of a note's body, as its search token, and how often it occurs
+    there. Kept in sync by the note flush hooks so searches find and rank
+    candidate notes with an indexed query instead of decrypting every note.
+    """
+
+    __tablename__ = "note_token"
+    __table_args__ = (Index("ix_note_token_user_id_token", "user_id", "token"),)
+
+    note_id = Column(GUID, ForeignKey("note.uuid"), primary_key=True)
+    token = Column(String(32), primary_key=True)
+    user_id = Column(GUID, ForeignKey("user.uuid"), nullable=False)
+    count = Column(Integer, nullable=False, default=1, server_default="1")
+
+    def __repr__(self):
+        return "<NoteToken {} {}>".format(self.note_id, self.token)
+
+
+class SearchTerm(Base):
+    """
+    A word that has occurred in a user's notes, encrypted, with its search
+    token. Searches match terms against the decrypted words of a user (far
+    fewer than their notes) to find the tokens to look up. Rows are only
+    added; words no note uses any more just match nothing.
+    """
+
+    __tablename__ = "search_term"
+
+    user_id = Column(GUID, ForeignKey("user.uuid"), primary_key=True)
+    token = Column(String(32), primary_key=True)
+    word = Column(LargeBinary, nullable=False)
+
+    def __repr__(self):
+        return "<SearchTerm {} {}>".format(self.user_id, self.token)
+
+
+class FreedUpload(Base):
+    """An orphaned upload the garbage collector (or a manual cleanup) deleted"""
+
+    __tablename__ = "freed_upload"
+    __table_args__ = (Index("ix_freed_upload_user_id_freed_at", "user_id", "freed_at"),)
+
+    uuid = Column(GUID, primary_key=True, default=lambda: uuid.uuid4())
+    user_id = Column(GUID, ForeignKey("user.uuid"), nullable=False)
+    path = Column(String(512), nullable=False)
+    size = Column(Integer, nullable=True)
+    last_seen_at = Column(DateTime(timezone=True), nullable=True)
+    freed_at = Column(DateTime(timezone=True), nullable=False)
+
+    @property
+    def serialize(self):
+        return {
+            "path": self.path,
+            "size": self.size,
+            "last_seen_at": self.last_seen_at,
+            "freed_at": self.freed_at,
+        }
+
+
 class Note(Base):
     __tablename__ = "note"
+    __table_args__ = (
+        Index("ix_note_user_id_title_index", "user_id", "title_index"),
+        Index("ix_note_user_id_is_date", "user_id", "is_date"),
+        Index("ix_note_user_id_tokens_indexed", "user_id", "tokens_indexed"),
+        Index("ix_note_user_id_upload_refs_indexed", "user_id", "upload_refs_indexed"),
+        # One daily note per user and day, also across server processes. MySQL
+        # has no partial indexes; there only the lock in save_day applies
+        Index(
+            "uq_note_user_id_title_index_daily",
+            "user_id",
+            "title_index",
+            unique=True,
+            sqlite_where=text("is_date"),
+            postgresql_where=text("is_date"),
+        ).ddl_if(dialect=("sqlite", "postgresql")),
+    )
 
     uuid = Column(
         GUID, primary_key=True, index=True, unique=True, default=lambda: uuid.uuid4()
@@ -304,9 +875,24 @@ class Note(Base):
     user_id = Column(GUID, ForeignKey("user.uuid"), nullable=False)
     data = Column(LargeBinary)
     title = Column(LargeBinary, nullable=False)
+    title_index = Column(String(64), nullable=True)
+    content_digest = Column(String(64), nullable=True)
+    meta_digest = Column(String(64), nullable=True)
+    # Whether note_token holds this note's words; NULL for notes saved before
+    # the search index existed, until the backfill job gets to them
+    tokens_indexed = Column(Boolean, nullable=True)
+    # Whether note_upload_ref holds the uploads this note embeds; NULL while
+    # its body could not be read, which keeps the user's uploads from being
+    # collected as orphans
+    upload_refs_indexed = Column(Boolean, nullable=True)
+    # Number of words in the body, for ranking search hits by length
+    word_count = Column(Integer, nullable=True)
     date = Column(DateTime(timezone=True), server_default=func.now())
     is_date = Column(Boolean, default=False)
     meta = relationship("Meta", lazy="dynamic", cascade="all, delete, delete-orphan")
+    upload_refs = relationship(
+        "NoteUploadRef", lazy="dynamic", cascade="all, delete, delete-orphan"
+    )
 
     @hybrid_property
     def text(self):
@@ -314,7 +900,13 @@ class Note(Base):
 
     @text.setter
     def text(self, value):
+        # Autosave mostly resends the stored body; leave the row untouched then
+        if self.text_unchanged(value):
+            note_save_stats["unchanged_bodies_skipped"] += 1
+            return
         self.data = aes_encrypt(value)
+        # Lets the flush hooks parse the body without decrypting it again
+        self._text_cache = (self.data, value)
 
     @hybrid_property
     def name(self):
@@ -322,9 +914,15 @@ class Note(Base):
 
     @name.setter
     def name(self, value):
-        # Use legacy CFB encryption for titles to allow database queries
-        # (titles need deterministic encryption for lookups by encrypted value)
-        self.title = aes_encrypt_legacy_cfb(value)
+        # Titles are looked up through title_index, which before_change_note
+        # keeps in sync, so they can use randomized encryption
+        self.title = aes_encrypt(value)
+
+    def text_unchanged(self, value):
+        """True if value is the body already stored for this note"""
+        return self.content_digest is not None and (
+            self.content_digest == make_content_digest(self.user_id, value)
+        )
 
     def __repr__(self):
         return "<Note {}>".format(self.uuid)
@@ -370,38 +968,183 @@ class Note(Base):
         return ["todo", "done"]
 
 
-# Update title automatically
-def before_change_note(mapper, connection, target):
+def serialize_notes(notes):
+    """
+    Bulk equivalent of [note.serialize for note in notes] for list endpoints.
+    """
+    titles = aes_decrypt_many([note.title for note in notes])
+    texts = aes_decrypt_many([note.data for note in notes])
+    return [
+        {
+            "uuid": note.uuid,
+            "data": text,
+            "title": title,
+            "date": note.date,
+            "is_date": note.is_date,
+        }
+        for note, title, text in zip(notes, titles, texts)
+    ]
+
+
+def serialize_metas(metas):
+    """
+    Bulk equivalent of [meta.serialize for meta in metas] for list endpoints.
+    """
+    names = aes_decrypt_many([meta.name_encrypted for meta in metas])
+    results = []
+    for meta, name in zip(metas, names):
+        result = {
+            "uuid": meta.uuid,
+            "name": name,
+            "kind": meta.kind,
+            "note_id": meta.note_id,
+        }
+        if meta.kind == "task":
+            result["task_column"] = meta.task_column
+        results.append(result)
+    return results
+
+
+class ParsedNote(
+    namedtuple("ParsedNote", "text post tags projects task_columns uploads")
+):
+    """
+    A note body parsed for the flush hooks: the plain text, the frontmatter
+    post, the tag and project names, a dict mapping each task line to its
+    kanban column, and the set of upload paths the note references.
+    """
+
+
+# Upload paths (/uploads/<username>/<file>) in links, images or bare URLs
+# Stops at whatever ends a URL in markdown or HTML: a query string or
+# fragment (/uploads/bob/a.png?w=640), quotes and brackets of <img src="...">,
+# and punctuation following a bare URL
+UPLOAD_PATH_PATTERN = re.compile(r"/uploads/[^\s)/?#\"'<>\],]+/[^\s)?#\"'<>\],]+")
+
+
+def extract_upload_paths(text):
+    """
+    Returns the set of upload paths referenced anywhere in a note body, in
+    the form stored in Upload.path
+    """
+    if not text:
+        return set()
+    return {
+        # A full stop ending a sentence isn't part of the file name
+        unquote(path).rstrip(".")
+        for path in UPLOAD_PATH_PATTERN.findall(text)
+    }
+
+
+def parse_note(text):
+    post = frontmatter.loads(text)
+
+    tags = []
+    if isinstance(post.get("tags"), list):
+        tags = list(set([x.replace(",", "\\,") for x in post.get("tags")]))
+    elif isinstance(post.get("tags"), str):
+        tags = list(set(map(str.strip, post["tags"].split(","))))
+    tags = [x for x in tags if x]
+
+    projects = []
+    if isinstance(post.get("projects"), list):
+        projects = list(set([x.replace(",", "\\,") for x in post.get("projects")]))
+    elif isinstance(post.get("projects"), str):
+        projects = list(set(map(str.strip, post["projects"].split(","))))
+    projects = [x for x in projects if x]
+
+    # Map each full task line to its column (duplicate lines collapse into one)
+    task_columns = {}
+    for (
+        full_match,
+        is_completed,
+        task_text,
+        explicit_column,
+    ) in parse_tasks_with_columns(post.content):
+        task_columns[full_match] = get_task_column(is_completed, explicit_column)
+
+    return ParsedNote(
+        text, post, tags, projects, task_columns, extract_upload_paths(text)
+    )
+
+
+def _parsed_note(target):
+    """
+    Parse the note being flushed once; before_change_note stores the result
+    for after_change_note to pick up.
+    """
+    parsed = target.__dict__.get("_parsed_note")
+    if parsed is not None and parsed[0] is target.data:
+        return parsed[1]
+
+    text_cache = target.__dict__.get("_text_cache")
+    if text_cache is not None and text_cache[0] is target.data:
+        parsed = parse_note(text_cache[1])
+    else:
+        parsed = parse_note(target.text)
+    target._parsed_note = (target.data, parsed)
+    return parsed
+
+
+def note_title(post):
+    """
+    Title of a regular (non-daily) note: the frontmatter title, else the first
+    non-empty line of the body.
+    """
     title = None
 
-    data = frontmatter.loads(target.text)
+    if isinstance(post.get("title"), str) and len(post.get("title")) > 0:
+        title = post.get("title")
+
+    # If no title found in frontmatter, generate a default title
+    if not title:
+        # Try to extract first line of content as title
+        content_lines = post.content.strip().split("\n")
+        first_line = ""
+        for line in content_lines:
+            if line.strip():
+                first_line = line.strip()
+                break
+
+        if first_line:
+            # Remove markdown formatting from first line
+            title = first_line.lstrip("#").strip()
+            # Limit title length
+            if len(title) > 100:
+                title = title[:100] + "..."
+
+        # If still no title, use default
+        if not title:
+            title = "Untitled Note"
+
+    return title
 
-    if isinstance(data.get("title"), str) and len(data.get("title")) > 0:
-        title = data.get("title")
 
+# Update title automatically
+def before_change_note(mapper, connection, target):
     if not target.is_date:
-        # If no title found in frontmatter, generate a default title
-        if not title:
-            # Try to extract first line of content as title
-            content_lines = data.content.strip().split("\n")
-            first_line = ""
-            for line in content_lines:
-                if line.strip():
-                    first_line = line.strip()
-                    break
+        target.name = note_title(_parsed_note(target).post)
 
-            if first_line:
-                # Remove markdown formatting from first line
-                title = first_line.lstrip("#").strip()
-                # Limit title length
-                if len(title) > 100:
-                    title = title[:100] + "..."
+    target.title_index = make_title_index(target.user_id, target.name)
 
-            # If still no title, use default
-            if not title:
-                title = "Untitled Note"
+    parsed = _parsed_note(target)
+    target.content_digest = make_content_digest(target.user_id, parsed.text)
+    meta_digest = make_meta_digest(target.user_id, parsed)
+    # Rows that predate the digest (NULL) always get reconciled
+    target._meta_unchanged = target.meta_digest == meta_digest
+    target.meta_digest = meta_digest
 
-        target.name = title
+    # after_change_note rewrites the upload refs of notes whose refs were
+    # never recorded, even if their meta digest matches
+    if not target.upload_refs_indexed:
+        target._meta_unchanged = False
+        target.upload_refs_indexed = True
+
+    # after_change_note rewrites the note's search tokens
+    if get_history(target, "data").has_changes():
+        target._word_counts = count_words(parsed.text)
+        target.word_count = sum(target._word_counts.values())
+        target.tokens_indexed = True
 
 
 # Task regex pattern: captures checkbox state, task text, and optional >>column
@@ -452,133 +1195,350 @@ def get_task_column(is_completed, explicit_column):
     return "done" if is_completed else "todo"
 
 
-# Handle changes to tasks, projects, and tags
-def after_change_note(mapper, connection, target):
-    tags = []
-    projects = []
+def search_term_rows(user_id, words_by_token):
+    """search_term rows for a dict of token -> word, encrypted in bulk"""
+    tokens = list(words_by_token)
+    words = aes_encrypt_many([words_by_token[token] for token in tokens])
+    return [
+        {"user_id": user_id, "token": token, "word": word}
+        for token, word in zip(tokens, words)
+    ]
 
-    data = frontmatter.loads(target.text)
 
-    if isinstance(data.get("tags"), list):
-        tags = list(set([x.replace(",", "\,") for x in data.get("tags")]))
-    elif isinstance(data.get("tags"), str):
-        tags = list(set(map(str.strip, data["tags"].split(","))))
-    tags = [x for x in tags if x]
+def insert_search_terms(connection, rows):
+    """Insert search_term rows, skipping words the user already has"""
+    if not rows:
+        return
+    if connection.dialect.name == "sqlite":
+        statement = sqlite_insert(SearchTerm.__table__).on_conflict_do_nothing()
+    elif connection.dialect.name == "postgresql":
+        statement = postgresql_insert(SearchTerm.__table__).on_conflict_do_nothing()
+    else:
+        statement = insert(SearchTerm.__table__).prefix_with("IGNORE")
+    connection.execute(statement, rows)
 
-    if isinstance(data.get("projects"), list):
-        projects = list(set([x.replace(",", "\,") for x in data.get("projects")]))
-    elif isinstance(data.get("projects"), str):
-        projects = list(set(map(str.strip, data["projects"].split(","))))
-    projects = [x for x in projects if x]
 
-    # Parse tasks with column info: list of (full_match, is_completed, task_text, column)
-    parsed_tasks = parse_tasks_with_columns(data.content)
-    # Build dict mapping full task line to column for easy lookup
-    task_columns = {}
-    for full_match, is_completed, task_text, explicit_column in parsed_tasks:
-        column = get_task_column(is_completed, explicit_column)
-        task_columns[full_match] = column
-
-    # List of task full matches (for compatibility with existing logic)
-    tasks = list(task_columns.keys())
-
-    existing_tags = []
-    existing_projects = []
-    existing_tasks = []
-
-    metas = Meta.query.filter_by(note_id=target.uuid).all()
-
-    for meta in metas:
-        if meta.kind == "tag":
-            existing_tags.append(meta)
-        elif meta.kind == "project":
-            existing_projects.append(meta)
-        elif meta.kind == "task":
-            existing_tasks.append(meta)
-
-    for tag in existing_tags:
-        if tag.name not in tags:
-            connection.execute(
-                text("DELETE FROM meta WHERE uuid = :uuid"),
-                {"uuid": "{}".format(tag.uuid).replace("-", "")},
-            )
-        else:
-            tags.remove(tag.name)
+def sync_note_tokens(connection, user_id, note_id, word_counts, session=None):
+    """
+    Point a note's note_token rows at word_counts (see count_words), adding
+    new words to search_term. With a session, the new words are also
+    recorded in its info for app.search_index to pick up once the session
+    commits.
+    """
+    tokens = {make_search_token(user_id, word): word for word in word_counts}
 
-    for tag in tags:
+    note_token = NoteToken.__table__
+    existing = dict(
         connection.execute(
-            text(
-                "INSERT INTO meta (uuid, user_id, note_id, name, kind) VALUES (:uuid, :user_id, :note_id, :name, :kind)"
-            ),
-            {
-                "uuid": "{}".format(uuid.uuid4()).replace("-", ""),
-                "user_id": "{}".format(target.user_id).replace("-", ""),
-                "note_id": "{}".format(target.uuid).replace("-", ""),
-                "name": aes_encrypt(tag),
-                "kind": "tag",
-            },
+            select(note_token.c.token, note_token.c.count).where(
+                note_token.c.note_id == note_id
+            )
+        ).all()
+    )
+    removed = existing.keys() - tokens.keys()
+    added = {token: word for token, word in tokens.items() if token not in existing}
+    recounted = [
+        {"b_note_id": note_id, "b_token": token, "count": word_counts[word]}
+        for token, word in tokens.items()
+        if token in existing and existing[token] != word_counts[word]
+    ]
+
+    if removed:
+        connection.execute(
+            delete(note_token).where(
+                note_token.c.note_id == note_id, note_token.c.token.in_(removed)
+            )
+        )
+    if recounted:
+        connection.execute(
+            update(note_token)
+            .where(
+                note_token.c.note_id == bindparam("b_note_id"),
+                note_token.c.token == bindparam("b_token"),
+            )
+            .values(count=bindparam("count")),
+            recounted,
+        )
+    if added:
+        connection.execute(
+            insert(note_token),
+            [
+                {
+                    "note_id": note_id,
+                    "token": token,
+                    "user_id": user_id,
+                    "count": word_counts[word],
+                }
+                for token, word in added.items()
+            ],
+        )
+        insert_search_terms(connection, search_term_rows(user_id, added))
+        if session is not None:
+            words = session.info.setdefault("search_terms", {})
+            words.setdefault(user_id, {}).update(
+                (word, token) for token, word in added.items()
+            )
+
+
+# Handle changes to tasks, projects, and tags
+def after_change_note(mapper, connection, target):
+    parsed = _parsed_note(target)
+    # Set by before_change_note when the body changed
+    word_counts = target.__dict__.pop("_word_counts", None)
+    if word_counts is not None:
+        sync_note_tokens(
+            connection,
+            target.user_id,
+            target.uuid,
+            word_counts,
+            object_session(target),
         )
 
-    for project in existing_projects:
-        if project.name not in projects:
-            connection.execute(
-                text("DELETE FROM meta WHERE uuid = :uuid"),
-                {"uuid": "{}".format(project.uuid).replace("-", "")},
+    target.__dict__.pop("_parsed_note", None)
+    target.__dict__.pop("_text_cache", None)
+
+    if target.__dict__.pop("_meta_unchanged", False):
+        note_save_stats["meta_reconciliations_skipped"] += 1
+        return
+    note_save_stats["meta_reconciliations"] += 1
+
+    wanted = {
+        "tag": set(parsed.tags),
+        "project": set(parsed.projects),
+        "task": set(parsed.task_columns),
+    }
+
+    meta = Meta.__table__
+    rows = connection.execute(
+        select(meta.c.uuid, meta.c.name, meta.c.kind, meta.c.task_column).where(
+            meta.c.note_id == target.uuid
+        )
+    ).all()
+
+    # Prefer in-memory state over the database row for meta loaded in the
+    # session being flushed (e.g. save_task renames the task alongside the note)
+    session = object_session(target)
+    existing = []
+    for row in rows:
+        loaded = session.identity_map.get(identity_key(Meta, row.uuid))
+        if loaded is not None:
+            existing.append(
+                (row.uuid, loaded.name_encrypted, row.kind, loaded.task_column)
             )
         else:
-            projects.remove(project.name)
-
-    for project in projects:
+            existing.append(tuple(row))
+
+    names = aes_decrypt_many([name for _, name, _, _ in existing])
+
+    deletes = []
+    column_updates = []
+    labels_changed = False
+    for (meta_uuid, _, kind, task_column), name in zip(existing, names):
+        if kind not in wanted:
+            continue
+        if name not in wanted[kind]:
+            deletes.append({"meta_uuid": meta_uuid})
+            labels_changed = labels_changed or kind in LABEL_KINDS
+            continue
+        # Later duplicates of the same name are removed
+        wanted[kind].discard(name)
+        if kind == "task":
+            new_column = parsed.task_columns.get(name)
+            if new_column and new_column != task_column:
+                column_updates.append({"meta_uuid": meta_uuid, "column": new_column})
+
+    inserts = _meta_rows(target.uuid, target.user_id, wanted, parsed.task_columns)
+
+    # One executemany per statement type, however many rows changed
+    if deletes:
+        connection.execute(
+            delete(meta).where(meta.c.uuid == bindparam("meta_uuid")), deletes
+        )
+    if column_updates:
         connection.execute(
-            text(
-                "INSERT INTO meta (uuid, user_id, note_id, name, kind) VALUES (:uuid, :user_id, :note_id, :name, :kind)"
-            ),
+            update(meta)
+            .where(meta.c.uuid == bindparam("meta_uuid"))
+            .values(task_column=bindparam("column")),
+            column_updates,
+        )
+    if inserts:
+        connection.execute(insert(meta), inserts)
+
+    if labels_changed or any(row["kind"] in LABEL_KINDS for row in inserts):
+        _record_label_change(session, target.user_id)
+
+    _sync_upload_refs(connection, target, parsed.uploads)
+
+
+def _meta_rows(note_id, user_id, wanted, task_columns):
+    """Meta rows to insert for the names in wanted, a dict of kind -> names"""
+    names = [(kind, name) for kind, kind_names in wanted.items() for name in kind_names]
+    rows = []
+    for (kind, name), encrypted in zip(
+        names, aes_encrypt_many([name for _, name in names])
+    ):
+        rows.append(
             {
-                "uuid": "{}".format(uuid.uuid4()).replace("-", ""),
-                "user_id": "{}".format(target.user_id).replace("-", ""),
-                "note_id": "{}".format(target.uuid).replace("-", ""),
-                "name": aes_encrypt(project),
-                "kind": "project",
-            },
+                "uuid": uuid.uuid4(),
+                "user_id": user_id,
+                "note_id": note_id,
+                "name": encrypted,
+                # Lets before_update_task notice when a task is renamed
+                "name_compare": encrypted if kind == "task" else None,
+                "kind": kind,
+                "task_column": task_columns[name] if kind == "task" else None,
+            }
         )
+    return rows
 
-    for task in existing_tasks:
-        if task.name not in tasks:
-            connection.execute(
-                text("DELETE FROM meta WHERE uuid = :uuid"),
-                {"uuid": "{}".format(task.uuid).replace("-", "")},
-            )
-        else:
-            # Task still exists - check if column needs update
-            new_column = task_columns.get(task.name)
-            if new_column and new_column != task.task_column:
-                connection.execute(
-                    text("UPDATE meta SET task_column = :column WHERE uuid = :uuid"),
-                    {
-                        "column": new_column,
-                        "uuid": "{}".format(task.uuid).replace("-", ""),
-                    },
-                )
-            tasks.remove(task.name)
-
-    for task in tasks:
-        encrypted_task = aes_encrypt(task)
-        task_column = task_columns.get(task)
 
+class PreparedNote(namedtuple("PreparedNote", "note meta upload_refs tokens words")):
+    """
+    Rows for a new note built by prepare_note_rows: the note row, its meta,
+    note_upload_ref and note_token rows, and a dict of search token -> word.
+    """
+
+
+def prepare_note_rows(user_id, parsed, is_date, name=None):
+    """
+    The rows the flush hooks would write for a new note with the parsed
+    body, for bulk inserts that bypass the ORM (see insert_note_rows).
+    Daily notes are titled name; other notes are titled from their body like
+    any saved note.
+
+    Returns a PreparedNote. CPU-bound (parsing is done by the caller,
+    encryption and digests here), so safe to run in a worker.
+    """
+    if not is_date:
+        name = note_title(parsed.post)
+
+    note_id = uuid.uuid4()
+    data, title = aes_encrypt_many([parsed.text, name])
+    word_counts = count_words(parsed.text)
+    note_row = {
+        "uuid": note_id,
+        "user_id": user_id,
+        "data": data,
+        "title": title,
+        "title_index": make_title_index(user_id, name),
+        "content_digest": make_content_digest(user_id, parsed.text),
+        "meta_digest": make_meta_digest(user_id, parsed),
+        "tokens_indexed": True,
+        "upload_refs_indexed": True,
+        "word_count": sum(word_counts.values()),
+        "is_date": is_date,
+    }
+    wanted = {
+        "tag": set(parsed.tags),
+        "project": set(parsed.projects),
+        "task": set(parsed.task_columns),
+    }
+    meta_rows = _meta_rows(note_id, user_id, wanted, parsed.task_columns)
+    ref_rows = [
+        {"note_id": note_id, "user_id": user_id, "path": path}
+        for path in parsed.uploads
+    ]
+    words = {make_search_token(user_id, word): word for word in word_counts}
+    token_rows = [
+        {
+            "note_id": note_id,
+            "token": token,
+            "user_id": user_id,
+            "count": word_counts[word],
+        }
+        for token, word in words.items()
+    ]
+    return PreparedNote(note_row, meta_rows, ref_rows, token_rows, words)
+
+
+def insert_note_rows(connection, prepared, term_rows=()):
+    """
+    Insert notes built by prepare_note_rows with one executemany per table,
+    doing what after_change_note does for notes added through the session.
+    term_rows are the search_term rows (see search_term_rows) for their words.
+    """
+    note_rows = [note.note for note in prepared]
+    meta_rows = [row for note in prepared for row in note.meta]
+    ref_rows = [row for note in prepared for row in note.upload_refs]
+    token_rows = [row for note in prepared for row in note.tokens]
+
+    if note_rows:
+        connection.execute(insert(Note.__table__), note_rows)
+    if meta_rows:
+        connection.execute(insert(Meta.__table__), meta_rows)
+    if token_rows:
+        connection.execute(insert(NoteToken.__table__), token_rows)
+    insert_search_terms(connection, list(term_rows))
+    if ref_rows:
+        connection.execute(insert(NoteUploadRef.__table__), ref_rows)
+        paths = {}
+        for row in ref_rows:
+            paths.setdefault(row["user_id"], set()).add(row["path"])
+        for user_id, user_paths in paths.items():
+            _touch_uploads(connection, user_id, user_paths)
+
+
+def _touch_uploads(connection, user_id, paths):
+    """Record that uploads were referenced (or stopped being referenced) now"""
+    upload = Upload.__table__
+    connection.execute(
+        update(upload)
+        .where(upload.c.user_id == user_id, upload.c.path.in_(paths))
+        .values(last_seen_at=datetime.datetime.utcnow())
+    )
+
+
+def _sync_upload_refs(connection, target, paths):
+    ref = NoteUploadRef.__table__
+    existing = set(
+        connection.execute(select(ref.c.path).where(ref.c.note_id == target.uuid))
+        .scalars()
+        .all()
+    )
+
+    added = paths - existing
+    removed = existing - paths
+
+    if removed:
         connection.execute(
-            text(
-                "INSERT INTO meta (uuid, user_id, note_id, name, name_compare, kind, task_column) VALUES (:uuid, :user_id, :note_id, :name, :name_compare, :kind, :task_column)"
-            ),
-            {
-                "uuid": "{}".format(uuid.uuid4()).replace("-", ""),
-                "user_id": "{}".format(target.user_id).replace("-", ""),
-                "note_id": "{}".format(target.uuid).replace("-", ""),
-                "name": encrypted_task,
-                "name_compare": encrypted_task,
-                "kind": "task",
-                "task_column": task_column,
-            },
+            delete(ref).where(ref.c.note_id == target.uuid, ref.c.path.in_(removed))
         )
+    if added:
+        connection.execute(
+            insert(ref),
+            [
+                {"note_id": target.uuid, "user_id": target.user_id, "path": path}
+                for path in added
+            ],
+        )
+    if added or removed:
+        _touch_uploads(connection, target.user_id, added | removed)
+
+
+def _record_label_change(session, user_id):
+    """
+    Note in the session's info that a user's tags or projects changed, for
+    app.label_index to drop once the session commits.
+    """
+    if session is not None:
+        session.info.setdefault("label_users", set()).add(user_id)
+
+
+def before_delete_note(mapper, connection, target):
+    _record_label_change(object_session(target), target.user_id)
+
+    note_token = NoteToken.__table__
+    connection.execute(delete(note_token).where(note_token.c.note_id == target.uuid))
+
+    # Start the orphan grace period of everything the note referenced
+    ref = NoteUploadRef.__table__
+    paths = set(
+        connection.execute(select(ref.c.path).where(ref.c.note_id == target.uuid))
+        .scalars()
+        .all()
+    )
+    if paths:
+        _touch_uploads(connection, target.user_id, paths)
 
 
 def before_update_task(mapper, connection, target):
@@ -588,19 +1548,40 @@ def before_update_task(mapper, connection, target):
     if target.name_encrypted == target.name_compare:
         return
 
-    note = Note.query.get(target.note_id)
+    note = object_session(target).get(Note, target.note_id)
 
     if not note:
         return
 
-    note_data = aes_encrypt(
-        note.text.replace(aes_decrypt(target.name_compare), target.name)
-    )
+    note_text = note.text.replace(aes_decrypt(target.name_compare), target.name)
+    note_data = aes_encrypt(note_text)
+    word_counts = count_words(note_text)
+    word_count = sum(word_counts.values())
 
+    # The digests no longer describe the rewritten body; the next save of the
+    # note recomputes them and reconciles its meta
     connection.execute(
-        text("UPDATE note SET data = :data WHERE uuid = :uuid"),
-        {"data": note_data, "uuid": "{}".format(note.uuid).replace("-", "")},
+        text(
+            "UPDATE note SET data = :data, content_digest = NULL, meta_digest = NULL, tokens_indexed = :indexed, word_count = :word_count WHERE uuid = :uuid"
+        ),
+        {
+            "data": note_data,
+            "indexed": True,
+            "word_count": word_count,
+            "uuid": "{}".format(note.uuid).replace("-", ""),
+        },
+    )
+    sync_note_tokens(
+        connection, note.user_id, note.uuid, word_counts, object_session(target)
     )
+    for key, value in (
+        ("data", note_data),
+        ("content_digest", None),
+        ("meta_digest", None),
+        ("tokens_indexed", True),
+        ("word_count", word_count),
+    ):
+        set_committed_value(note, key, value)
 
     target.name_compare = target.name_encrypted
 
@@ -609,6 +1590,7 @@ event.listen(Note, "before_insert", before_change_note)
 event.listen(Note, "before_update", before_change_note)
 event.listen(Note, "after_insert", after_change_note)
 event.listen(Note, "after_update", after_change_note)
+event.listen(Note, "before_delete", before_delete_note)
 event.listen(Meta, "before_update", before_update_task)
 
 
@@ -1,8 +1,19 @@
+import io
 import os
+import base64
+import bisect
+import collections
 import zipfile
 import re
 import time
 import asyncio
+import weakref
+import tempfile
+import threading
+import hashlib
+import logging
+import mimetypes
+import stat
 from uuid import uuid4
 import frontmatter
 import datetime
@@ -17,10 +28,16 @@ import json
 from app import (
     app,
     db,
-    argon2,
+    crypto_executor,
+    password_executor,
+    pool_monitors,
+    generate_password_hash_async,
+    check_password_hash_async,
     jwt_required,
     create_access_token,
     get_jwt_identity,
+    get_current_user,
+    get_current_user_async,
     verify_jwt_in_request,
 )
 from app.models import (
@@ -28,12 +45,32 @@ from app.models import (
     Note,
     Meta,
     Upload,
+    NoteUploadRef,
+    FreedUpload,
     ExternalCalendar,
+    LABEL_KINDS,
     aes_encrypt,
-    aes_encrypt_legacy_cfb,
-    aes_encrypt_old,
+    aes_decrypt_many,
+    make_title_index,
+    parse_note,
+    prepare_note_rows,
+    insert_note_rows,
+    search_term_rows,
+    serialize_notes,
+    serialize_metas,
     parse_tasks_with_columns,
     get_task_column,
+    user_cache,
+    note_save_stats,
+    upload_is_orphan,
+)
+from app.jobs import collect_orphan_uploads, upload_gc_stats
+from app.search_index import search_index
+from app.label_index import label_index
+from app.image_variants import (
+    variant_cache,
+    image_executor,
+    VARIANT_MIMETYPE,
 )
 from quart import (
     render_template,
@@ -41,13 +78,26 @@ from quart import (
     jsonify,
     abort,
     send_file,
-    send_from_directory,
     Response,
     url_for,
     make_response,
 )
-from sqlalchemy import text
+from sqlalchemy import select, text
+from sqlalchemy.exc import IntegrityError
+from quart.wrappers.response import ResponseBody
+from werkzeug.exceptions import RequestedRangeNotSatisfiable
 from werkzeug.utils import secure_filename
+from werkzeug.security import safe_join
+from werkzeug.sansio.multipart import (
+    MultipartDecoder,
+    NeedData,
+    File,
+    Field,
+    Data,
+    Epilogue,
+)
+
+logger = logging.getLogger(__name__)
 
 
 def _is_allowed_file(filename, mimetype):
@@ -170,57 +220,318 @@ def _ensure_upload_table():
         logging.getLogger(__name__).debug(f"Upload table creation skipped: {e}")
 
 
-def _extract_upload_paths_from_text(text, username):
+# Multipart chunks are buffered up to this size before each off-loop disk write
+UPLOAD_WRITE_BUFFER_SIZE = 256 * 1024
+# Room for multipart boundaries and part headers around the file itself
+UPLOAD_MULTIPART_OVERHEAD = 64 * 1024
+# The process umask, read once (os.umask can only be read by setting it)
+_UMASK = os.umask(0)
+os.umask(_UMASK)
+# Stored uploads are read (and archived on export) in chunks of this size
+UPLOAD_SEND_BUFFER_SIZE = 256 * 1024
+# Uploads stored since content addressing are named <sha256 hex><ext>
+CONTENT_HASH_NAME = re.compile(r"^[0-9a-f]{64}\.")
+
+# Notes decrypted per batch, and archive pieces waiting for a slow client
+EXPORT_BATCH_SIZE = 200
+EXPORT_QUEUE_SIZE = 8
+# Archive files read, parsed and encrypted per batch
+IMPORT_BATCH_SIZE = 100
+# Daily notes are exported as MM-dd-yyyy.md
+DAILY_NOTE_NAME = re.compile(r"^\d{2}-\d{2}-\d{4}$")
+
+# Notes loaded per IN (...) query when serializing search hits
+SEARCH_LOAD_BATCH_SIZE = 500
+SEARCH_PAGE_SIZE = 50
+SEARCH_MAX_PAGE_SIZE = 200
+
+TAG_COMPLETE_LIMIT = 8
+TAG_COMPLETE_MAX_LIMIT = 100
+
+
+class _UploadRejected(Exception):
+    def __init__(self, message, status=400):
+        super().__init__(message)
+        self.message = message
+        self.status = status
+
+
+async def _stream_upload(target_dir, max_size):
     """
-    Returns a set of upload paths (/uploads/<username>/file.png) referenced in markdown.
+    Stream the "file" part of a multipart request body into a temporary file
+    in target_dir, without holding the upload in memory. Chunks are written
+    off the event loop, and the transfer is aborted as soon as the file grows
+    past max_size.
+
+    Returns (filename, temp_path, size, sha256 hex digest); the caller moves
+    temp_path into place. Raises _UploadRejected for unusable uploads.
     """
-    if not text:
-        return set()
+    if request.mimetype != "multipart/form-data":
+        raise _UploadRejected("No file provided")
+    boundary = request.mimetype_params.get("boundary")
+    if not boundary:
+        raise _UploadRejected("No file provided")
+
+    if (
+        max_size
+        and request.content_length
+        and request.content_length > max_size + UPLOAD_MULTIPART_OVERHEAD
+    ):
+        raise _UploadRejected("File too large", 413)
+
+    decoder = MultipartDecoder(boundary.encode("latin-1"))
+    filename = None
+    temp_file = None
+    temp_path = None
+    in_file = False
+    done = False
+    size = 0
+    buffer = bytearray()
+    digest = hashlib.sha256()
+
+    def write_chunk(chunk):
+        digest.update(chunk)
+        temp_file.write(chunk)
 
-    paths = set()
-    # Markdown image or link pattern
-    md_link_regex = re.compile(r"\[.*?\]\((.*?)\)")
-    upload_prefix = f"/uploads/{username.lower()}/"
+    try:
+        body = request.body.__aiter__()
+        while not done:
+            try:
+                chunk = await body.__anext__()
+            except StopAsyncIteration:
+                chunk = None
+            try:
+                decoder.receive_data(chunk)
+                event = decoder.next_event()
+            except ValueError:
+                raise _UploadRejected("Invalid upload")
+            while not isinstance(event, NeedData):
+                if isinstance(event, File) and event.name == "file" and not filename:
+                    filename = secure_filename(event.filename or "")
+                    if not filename:
+                        raise _UploadRejected("No file selected")
+                    if not _is_allowed_file(
+                        filename, event.headers.get("Content-Type")
+                    ):
+                        raise _UploadRejected("Unsupported file type")
+                    fd, temp_path = tempfile.mkstemp(dir=target_dir, suffix=".part")
+                    # mkstemp creates the file 0600; give it the permissions a
+                    # plain open() would, so a proxy serving uploads can read it
+                    os.fchmod(fd, 0o666 & ~_UMASK)
+                    temp_file = os.fdopen(fd, "wb")
+                    in_file = True
+                elif isinstance(event, (File, Field)):
+                    in_file = False
+                elif isinstance(event, Data) and in_file:
+                    size += len(event.data)
+                    if max_size and size > max_size:
+                        raise _UploadRejected("File too large", 413)
+                    buffer += event.data
+                    if len(buffer) >= UPLOAD_WRITE_BUFFER_SIZE or not event.more_data:
+                        await asyncio.to_thread(write_chunk, bytes(buffer))
+                        buffer.clear()
+                    if not event.more_data:
+                        in_file = False
+                elif isinstance(event, Epilogue):
+                    done = True
+                    break
+                try:
+                    event = decoder.next_event()
+                except ValueError:
+                    raise _UploadRejected("Invalid upload")
+
+            # The body ended before the closing boundary: the upload is cut short
+            if chunk is None and not done:
+                raise _UploadRejected("Invalid upload")
+
+        if temp_file is None:
+            raise _UploadRejected("No file provided")
+        await asyncio.to_thread(temp_file.close)
+        return filename, temp_path, size, digest.hexdigest()
+    except BaseException:
+        if temp_file is not None:
+            temp_file.close()
+            os.remove(temp_path)
+        raise
+
+
+async def _store_upload(user, user_folder, filename, temp_path, size, content_hash):
+    """
+    Move a streamed upload into place under its content hash and return its
+    Upload row. Bytes the user has uploaded before are not stored again: the
+    temp file is dropped and the existing row is returned.
+    """
+    existing = Upload.query.filter_by(
+        user_id=user.uuid, content_hash=content_hash
+    ).first()
+    if existing is not None:
+        file_path = os.path.join(
+            app.config["UPLOAD_FOLDER"], existing.path.replace("/uploads/", "", 1)
+        )
+        if await asyncio.to_thread(os.path.exists, file_path):
+            await asyncio.to_thread(os.remove, temp_path)
+        else:
+            await asyncio.to_thread(os.replace, temp_path, file_path)
+        existing.last_seen_at = datetime.datetime.utcnow()
+        db.session.commit()
+        return existing
 
-    for match in md_link_regex.finditer(text):
-        url = match.group(1)
-        if upload_prefix in url:
-            # Normalize to just the /uploads/... portion
-            idx = url.find(upload_prefix)
-            if idx != -1:
-                paths.add(url[idx:].split(")", 1)[0])
+    ext = os.path.splitext(filename)[1].lower()
+    saved_name = f"{content_hash}{ext}"
+    relative_path = f"/uploads/{user_folder}/{saved_name}"
 
-    # Bare URLs
-    bare_regex = re.compile(rf"{re.escape(upload_prefix)}[^\s)]+")
-    for match in bare_regex.finditer(text):
-        paths.add(match.group(0))
+    # Atomic, so the file only ever appears complete under its final name
+    await asyncio.to_thread(
+        os.replace, temp_path, os.path.join(os.path.dirname(temp_path), saved_name)
+    )
 
-    return paths
+    upload_row = Upload(
+        user_id=user.uuid,
+        filename=saved_name,
+        path=relative_path,
+        size=size if size else None,
+        content_hash=content_hash,
+        last_seen_at=datetime.datetime.utcnow(),
+    )
+    db.session.add(upload_row)
+    try:
+        db.session.commit()
+    except IntegrityError:
+        # The same bytes were uploaded concurrently and the other request won
+        db.session.rollback()
+        upload_row = Upload.query.filter_by(path=relative_path).one()
+    return upload_row
 
 
-def _collect_referenced_uploads_for_user(user):
+class _UploadFileBody(ResponseBody):
     """
-    Scan all of a user's notes and return a set of upload paths referenced anywhere.
-    Also updates last_seen_at for matched uploads.
+    Response body for a stored upload, sized from a stat the caller already
+    made. The file is read in UPLOAD_SEND_BUFFER_SIZE chunks with one worker
+    thread hop each, where Quart's FileBody makes a tell() and a read() round
+    trip per 8 KiB. begin, end and make_conditional() are what Quart's
+    Response uses to answer a range request.
     """
-    referenced_paths = set()
-    notes = Note.query.filter_by(user_id=user.uuid).all()
-    for note in notes:
-        referenced_paths.update(
-            _extract_upload_paths_from_text(note.text, user.username)
-        )
 
-    if referenced_paths:
-        now = datetime.datetime.utcnow()
-        Upload.query.filter(
-            Upload.user_id == user.uuid, Upload.path.in_(referenced_paths)
-        ).update(
-            {"last_seen_at": now},
-            synchronize_session=False,
+    buffer_size = UPLOAD_SEND_BUFFER_SIZE
+
+    def __init__(self, file_path, size):
+        self.file_path = file_path
+        self.size = size
+        self.begin = 0
+        self.end = size
+        self.file = None
+        self._position = 0
+
+    async def make_conditional(self, begin, end):
+        """Narrow the body to the byte range [begin, end); returns the full size"""
+        # Suffix ranges ("bytes=-500") arrive as a negative begin
+        if begin < 0:
+            begin, end = max(self.size + begin, 0), None
+        end = self.size if end is None else min(end, self.size)
+        if begin >= end:
+            raise RequestedRangeNotSatisfiable(self.size)
+        self.begin, self.end = begin, end
+        return self.size
+
+    async def __aenter__(self):
+        self.file = await asyncio.to_thread(open, self.file_path, "rb", buffering=0)
+        if self.begin:
+            await asyncio.to_thread(self.file.seek, self.begin)
+        self._position = self.begin
+        return self
+
+    async def __aexit__(self, exc_type, exc_value, tb):
+        self.file.close()
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self):
+        if self._position >= self.end:
+            raise StopAsyncIteration()
+        read_size = min(self.buffer_size, self.end - self._position)
+        chunk = await asyncio.to_thread(self.file.read, read_size)
+        if not chunk:
+            raise StopAsyncIteration()
+        self._position += len(chunk)
+        return chunk
+
+
+def _upload_etag(file_path, file_stat):
+    """
+    Strong validator for a stored upload. Content-addressed names (and the
+    variants derived from them) already identify the bytes; older random
+    names fall back to size and modification time.
+    """
+    name = os.path.basename(file_path)
+    if CONTENT_HASH_NAME.match(name):
+        return name
+    return f"{file_stat.st_size:x}-{file_stat.st_mtime_ns:x}"
+
+
+async def _send_upload(file_path, mimetype=None):
+    """
+    Response for a file under UPLOAD_FOLDER, or None if it does not exist.
+
+    Upload names never get reused for different bytes, so responses are
+    cacheable for good (immutable) and revalidate against a strong ETag.
+    Range requests are honoured. With UPLOAD_ACCEL_REDIRECT set the body is
+    left to the reverse proxy (nginx X-Accel-Redirect), which can send the
+    file with sendfile().
+    """
+    try:
+        file_stat = await asyncio.to_thread(os.stat, file_path)
+    except OSError:
+        return None
+    if not stat.S_ISREG(file_stat.st_mode):
+        return None
+
+    if mimetype is None:
+        mimetype = mimetypes.guess_type(file_path)[0] or "application/octet-stream"
+
+    accel_prefix = app.config["UPLOAD_ACCEL_REDIRECT"]
+    if accel_prefix:
+        response = Response(b"", mimetype=mimetype)
+        relative = os.path.relpath(file_path, app.config["UPLOAD_FOLDER"])
+        response.headers["X-Accel-Redirect"] = (
+            accel_prefix.rstrip("/") + "/" + quote(relative.replace(os.sep, "/"))
         )
-        db.session.commit()
+    else:
+        response = Response(
+            _UploadFileBody(file_path, file_stat.st_size), mimetype=mimetype
+        )
+        response.content_length = file_stat.st_size
+        response.headers["Accept-Ranges"] = "bytes"
+
+    response.last_modified = file_stat.st_mtime
+    response.set_etag(_upload_etag(file_path, file_stat))
+    response.cache_control.public = True
+    response.cache_control.max_age = app.config["UPLOAD_CACHE_MAX_AGE"]
+    response.cache_control.immutable = True
+    response.headers["X-Content-Type-Options"] = "nosniff"
+
+    if accel_prefix:
+        # The proxy handles ranges itself; only answer revalidations here
+        await response.make_conditional(request)
+    else:
+        await response.make_conditional(
+            request, accept_ranges=True, complete_length=file_stat.st_size
+        )
+    return response
+
+
+def _orphan_uploads_query(user):
+    """A user's uploads no note references, as an anti-join on note_upload_ref"""
+    return Upload.query.filter(Upload.user_id == user.uuid, upload_is_orphan())
 
-    return referenced_paths
+
+def _recently_freed_uploads(user, limit=100):
+    return (
+        FreedUpload.query.filter_by(user_id=user.uuid)
+        .order_by(FreedUpload.freed_at.desc())
+        .limit(limit)
+        .all()
+    )
 
 
 _ICS_CACHE = {}
@@ -272,6 +583,29 @@ async def _sse_broadcast(user_id, event_type, data):
                 pass
 
 
+# Daily note locks keyed by (username, title); entries go away once no save holds them
+_DAY_NOTE_LOCKS = weakref.WeakValueDictionary()
+
+
+def _get_day_note_lock(username, title):
+    """
+    Get the lock serializing saves of one daily note. save_day looks the note
+    up and creates it if missing, so two overlapping first saves would
+    otherwise both insert a note for the same day. Take it before opening a
+    session so waiters don't hold pooled connections.
+
+    The lock only covers this process. Across processes, the partial unique
+    index uq_note_user_id_title_index_daily rejects the second insert on
+    SQLite and PostgreSQL; MySQL deployments need a single server process.
+    """
+    key = (username.lower(), title)
+    lock = _DAY_NOTE_LOCKS.get(key)
+    if lock is None:
+        lock = asyncio.Lock()
+        _DAY_NOTE_LOCKS[key] = lock
+    return lock
+
+
 def _normalize_calendar_url(raw_url):
     """
     Convert common Google Calendar embed URLs to ICS URLs.
@@ -622,12 +956,12 @@ def _markdown_to_plain(text, limit=800):
     return plain
 
 
-def _note_to_ics_event(note, base_url=None):
+def _note_to_ics_event(note_uuid, name, text, base_url=None):
     """
-    Convert a daily note into an all-day VEVENT block.
+    Convert a daily note (already decrypted name and text) into an all-day VEVENT block.
     """
     try:
-        day = datetime.datetime.strptime(note.name, "%m-%d-%Y").date()
+        day = datetime.datetime.strptime(name, "%m-%d-%Y").date()
     except (ValueError, TypeError):
         return None
 
@@ -635,14 +969,14 @@ def _note_to_ics_event(note, base_url=None):
     start_str = day.strftime("%Y%m%d")
     end_str = (day + datetime.timedelta(days=1)).strftime("%Y%m%d")
 
-    summary = _escape_ics_text(note.name or "Daily Note")
+    summary = _escape_ics_text(name or "Daily Note")
 
     description_source = ""
     try:
-        parsed = frontmatter.loads(note.text or "")
+        parsed = frontmatter.loads(text or "")
         description_source = parsed.content.strip()
     except (ValueError, TypeError, AttributeError):
-        description_source = (note.text or "").strip()
+        description_source = (text or "").strip()
 
     description_plain = _markdown_to_plain(description_source, limit=800)
 
@@ -650,14 +984,14 @@ def _note_to_ics_event(note, base_url=None):
     note_url = None
     if base_url:
         safe_base = base_url.rstrip("/")
-        note_url = f"{safe_base}/date/{note.name}"
+        note_url = f"{safe_base}/date/{name}"
         footer = f"\n\nOpen in DailyNotes: {note_url}"
 
     description = _escape_ics_text(description_plain + footer)
 
     event_lines = [
         "BEGIN:VEVENT",
-        f"UID:{note.uuid}@dailynotes",
+        f"UID:{note_uuid}@dailynotes",
         f"DTSTAMP:{dtstamp}",
         f"DTSTART;VALUE=DATE:{start_str}",
         f"DTEND;VALUE=DATE:{end_str}",
@@ -684,6 +1018,35 @@ async def health_check():
         return jsonify({"status": "unhealthy", "error": str(e)}), 503
 
 
+@app.route("/api/metrics", methods=["GET"])
+@jwt_required()
+async def metrics():
+    """
+    Operational counters for sizing worker pools. They cover every user of
+    the server, so only the users listed in METRICS_USERS may read them.
+    """
+    if get_jwt_identity().lower() not in app.config["METRICS_USERS"]:
+        abort(403)
+
+    return (
+        jsonify(
+            executors={
+                crypto_executor.name: crypto_executor.stats,
+                password_executor.name: password_executor.stats,
+                image_executor.name: image_executor.stats,
+            },
+            pools={monitor.name: monitor.stats for monitor in pool_monitors},
+            user_cache=user_cache.stats,
+            note_saves=note_save_stats,
+            image_variants=variant_cache.stats,
+            search_index=search_index.stats,
+            label_index=label_index.stats,
+            upload_gc=upload_gc_stats,
+        ),
+        200,
+    )
+
+
 @app.route("/api/sign-up", methods=["POST"])
 async def sign_up():
     if app.config["PREVENT_SIGNUPS"]:
@@ -696,13 +1059,13 @@ async def sign_up():
     if not username or not password:
         abort(400)
 
-    password_hash = argon2.generate_password_hash(password)
+    password_hash = await generate_password_hash_async(password)
 
     new_user = User(username=username.lower(), password_hash=password_hash)
     db.session.add(new_user)
     db.session.commit()
 
-    access_token = create_access_token(identity=username)
+    access_token = create_access_token(identity=username, user_id=new_user.uuid)
     return jsonify(access_token=access_token), 200
 
 
@@ -720,10 +1083,10 @@ async def login():
     if not user:
         return jsonify({"msg": "Bad username or password"}), 401
 
-    if not argon2.check_password_hash(user.password_hash, password):
+    if not await check_password_hash_async(user.password_hash, password):
         return jsonify({"msg": "Bad username or password"}), 401
 
-    access_token = create_access_token(identity=username)
+    access_token = create_access_token(identity=username, user_id=user.uuid)
     return jsonify(access_token=access_token), 200
 
 
@@ -742,36 +1105,44 @@ async def save_day():
     if not username:
         abort(401)
 
-    user = User.query.filter_by(username=username.lower()).first()
-
-    if not user:
-        abort(400)
+    async with _get_day_note_lock(username, title), db.async_session() as session:
+        user = await get_current_user_async(session)
 
-    # Try to find existing note with legacy CFB encryption (most common for existing data)
-    enc_date = aes_encrypt_legacy_cfb(title)
-    note = user.notes.filter_by(title=enc_date).first()
-
-    if not note:
-        # Check legacy ECB encryption
-        enc_date = aes_encrypt_old(title)
-        note = user.notes.filter_by(title=enc_date).first()
-
-    if not note:
-        # Create new note (will be encrypted with new v2 format)
-        note = Note(user_id=user.uuid, name=title, text=data, is_date=True)
-    else:
-        note.text = data
+        if not user:
+            abort(400)
 
-    db.session.add(note)
-    db.session.flush()
-    db.session.commit()
+        user_id = user.uuid
+        day_query = select(Note).filter_by(
+            user_id=user_id, title_index=make_title_index(user_id, title)
+        )
+        note = (await session.scalars(day_query)).first()
 
-    # Update upload references for this user based on all notes
-    _collect_referenced_uploads_for_user(user)
+        if not note:
+            # Create new note (will be encrypted with the current v3 format)
+            note = Note(user_id=user_id, name=title, text=data, is_date=True)
+            session.add(note)
+            try:
+                await session.commit()
+            except IntegrityError:
+                # Another server process created the day first (the lock only
+                # covers this one); save into its note instead
+                await session.rollback()
+                note = (await session.scalars(day_query)).one()
+                note.text = data
+                await session.commit()
+            # Load server-side defaults (e.g. date) for serialization
+            await session.refresh(note)
+        elif note.text_unchanged(data):
+            # Autosave of an unchanged body: nothing to write or announce
+            note.text = data
+            return jsonify(note=note.serialize), 200
+        else:
+            note.text = data
+            await session.commit()
 
     # Broadcast SSE event for real-time sync
     await _sse_broadcast(
-        str(user.uuid),
+        str(user_id),
         "note_updated",
         {
             "note_uuid": str(note.uuid),
@@ -792,12 +1163,7 @@ async def create_note():
     if not data:
         abort(400)
 
-    username = get_jwt_identity()
-
-    if not username:
-        abort(401)
-
-    user = User.query.filter_by(username=username.lower()).first()
+    user = get_current_user()
 
     if not user:
         abort(400)
@@ -808,9 +1174,6 @@ async def create_note():
     db.session.flush()
     db.session.commit()
 
-    # Update upload references for this user based on all notes
-    _collect_referenced_uploads_for_user(user)
-
     # Broadcast SSE event for real-time sync
     await _sse_broadcast(
         str(user.uuid),
@@ -844,12 +1207,7 @@ async def save_task():
     if not uuid or not name:
         abort(400)
 
-    username = get_jwt_identity()
-
-    if not username:
-        abort(401)
-
-    user = User.query.filter_by(username=username.lower()).first()
+    user = get_current_user()
 
     if not user:
         abort(400)
@@ -915,26 +1273,27 @@ async def save_note():
     if not uuid:
         abort(400)
 
-    username = get_jwt_identity()
+    async with db.async_session() as session:
+        user = await get_current_user_async(session)
 
-    if not username:
-        abort(401)
-
-    user = User.query.filter_by(username=username.lower()).first()
+        if not user:
+            abort(400)
 
-    if not user:
-        abort(400)
+        note = (
+            await session.scalars(select(Note).filter_by(user_id=user.uuid, uuid=uuid))
+        ).first()
 
-    note = user.notes.filter_by(uuid=uuid).first()
+        if not note:
+            abort(400)
 
-    if not note:
-        abort(400)
+        unchanged = note.text_unchanged(data)
+        note.text = data
 
-    note.text = data
+        if unchanged:
+            # Autosave of an unchanged body: nothing to write or announce
+            return jsonify(note=note.serialize), 200
 
-    db.session.add(note)
-    db.session.flush()
-    db.session.commit()
+        await session.commit()
 
     # Broadcast SSE event for real-time sync
     await _sse_broadcast(
@@ -956,12 +1315,7 @@ async def delete_note(uuid):
     if not uuid:
         abort(400)
 
-    username = get_jwt_identity()
-
-    if not username:
-        abort(401)
-
-    user = User.query.filter_by(username=username.lower()).first()
+    user = get_current_user()
 
     if not user:
         abort(400)
@@ -981,11 +1335,12 @@ async def delete_note(uuid):
 @jwt_required()
 async def refresh_jwt():
     username = get_jwt_identity()
+    user = get_current_user()
 
-    if not username:
+    if not username or not user:
         abort(401)
 
-    access_token = create_access_token(identity=username)
+    access_token = create_access_token(identity=username, user_id=user.uuid)
     return jsonify(token=access_token), 200
 
 
@@ -995,12 +1350,7 @@ async def calendar_token():
     """
     Return, generate, rotate, or disable the per-user ICS feed token and URL.
     """
-    username = get_jwt_identity()
-
-    if not username:
-        abort(401)
-
-    user = User.query.filter_by(username=username.lower()).first()
+    user = get_current_user()
 
     if not user:
         abort(400)
@@ -1027,8 +1377,7 @@ async def external_calendars():
     """
     List or add external ICS calendars for the user.
     """
-    username = get_jwt_identity()
-    user = User.query.filter_by(username=username.lower()).first()
+    user = get_current_user()
 
     if not user:
         abort(400)
@@ -1058,8 +1407,7 @@ async def external_calendars():
 @app.route("/api/external_calendars/<uuid>", methods=["DELETE"])
 @jwt_required()
 async def delete_external_calendar(uuid):
-    username = get_jwt_identity()
-    user = User.query.filter_by(username=username.lower()).first()
+    user = get_current_user()
 
     if not user:
         abort(400)
@@ -1088,8 +1436,7 @@ async def external_events():
     except Exception:
         abort(400)
 
-    username = get_jwt_identity()
-    user = User.query.filter_by(username=username.lower()).first()
+    user = get_current_user()
 
     if not user:
         abort(400)
@@ -1146,9 +1493,17 @@ async def calendar_feed():
 
     base_url = request.url_root.rstrip("/")
 
+    rows = (
+        user.notes.filter_by(is_date=True)
+        .with_entities(Note.uuid, Note.title, Note.data)
+        .all()
+    )
+    names = await crypto_executor.run(aes_decrypt_many, [row.title for row in rows])
+    texts = await crypto_executor.run(aes_decrypt_many, [row.data for row in rows])
+
     events = []
-    for note in user.notes.filter_by(is_date=True).all():
-        event_block = _note_to_ics_event(note, base_url=base_url)
+    for row, name, text in zip(rows, names, texts):
+        event_block = _note_to_ics_event(row.uuid, name, text, base_url=base_url)
         if event_block:
             events.append(event_block)
 
@@ -1178,8 +1533,7 @@ async def get_note():
     if not uuid:
         abort(400)
 
-    username = get_jwt_identity()
-    user = User.query.filter_by(username=username.lower()).first()
+    user = get_current_user()
 
     if not user:
         abort(400)
@@ -1200,27 +1554,28 @@ async def get_date():
     if not date:
         abort(400)
 
-    username = get_jwt_identity()
-    user = User.query.filter_by(username=username.lower()).first()
-
-    if not user:
-        abort(400)
-
-    ret_note = {
-        "title": date,
-        "data": "---\ntags: \nprojects: \n---\n\n",
-        "is_date": True,
-        "user_id": user.uuid,
-    }
+    async with db.async_session() as session:
+        user = await get_current_user_async(session)
 
-    # Try to find existing note with legacy CFB encryption (most common for existing data)
-    date_enc = aes_encrypt_legacy_cfb(date)
-    note = user.notes.filter_by(title=date_enc, is_date=True).first()
+        if not user:
+            abort(400)
 
-    if not note:
-        # Check legacy ECB encryption
-        date_enc = aes_encrypt_old(date)
-        note = user.notes.filter_by(title=date_enc, is_date=True).first()
+        ret_note = {
+            "title": date,
+            "data": "---\ntags: \nprojects: \n---\n\n",
+            "is_date": True,
+            "user_id": user.uuid,
+        }
+
+        note = (
+            await session.scalars(
+                select(Note).filter_by(
+                    user_id=user.uuid,
+                    title_index=make_title_index(user.uuid, date),
+                    is_date=True,
+                )
+            )
+        ).first()
 
     if note:
         ret_note = note.serialize
@@ -1231,41 +1586,70 @@ async def get_date():
 @app.route("/api/events", methods=["GET"])
 @jwt_required()
 async def cal_events():
-    username = get_jwt_identity()
-    user = User.query.filter_by(username=username.lower()).first()
+    user = get_current_user()
 
     if not user:
         abort(400)
 
     # TODO: Only do current month or something
-    notes = user.notes.filter_by(is_date=True).all()
+    titles = user.notes.filter_by(is_date=True).with_entities(Note.title).all()
+    events = await crypto_executor.run(aes_decrypt_many, [row.title for row in titles])
 
-    return jsonify(events=[x.name for x in notes]), 200
+    return jsonify(events=events), 200
 
 
 @app.route("/api/sidebar", methods=["GET"])
 @jwt_required()
 async def sidebar_data():
-    username = get_jwt_identity()
-    user = User.query.filter_by(username=username.lower()).first()
+    async with db.async_session() as session:
+        user = await get_current_user_async(session)
 
-    if not user:
-        abort(400)
+        if not user:
+            abort(400)
+
+        note_rows = (
+            await session.scalars(
+                select(Note).filter_by(user_id=user.uuid, is_date=False)
+            )
+        ).all()
+        tag_rows = (
+            await session.execute(
+                select(Meta.name_encrypted).filter_by(user_id=user.uuid, kind="tag")
+            )
+        ).all()
+        project_rows = (
+            await session.execute(
+                select(Meta.name_encrypted).filter_by(user_id=user.uuid, kind="project")
+            )
+        ).all()
+        task_rows = (
+            await session.scalars(
+                select(Meta).filter_by(user_id=user.uuid, kind="task")
+            )
+        ).all()
 
     notes = sorted(
-        [a.serialize for a in user.notes.filter_by(is_date=False).all()],
+        await crypto_executor.run(serialize_notes, note_rows),
         key=lambda note: note["title"].lower(),
     )
     tags = sorted(
-        set([a.name for a in user.meta.filter_by(kind="tag").all()]),
+        set(
+            await crypto_executor.run(
+                aes_decrypt_many, [row.name_encrypted for row in tag_rows]
+            )
+        ),
         key=lambda s: s.lower(),
     )
     projects = sorted(
-        set([a.name for a in user.meta.filter_by(kind="project").all()]),
+        set(
+            await crypto_executor.run(
+                aes_decrypt_many, [row.name_encrypted for row in project_rows]
+            )
+        ),
         key=lambda s: s.lower(),
     )
     tasks = sorted(
-        [a.serialize for a in user.meta.filter_by(kind="task").all()],
+        await crypto_executor.run(serialize_metas, task_rows),
         key=lambda task: task["note_id"],
     )
     auto_save = user.auto_save
@@ -1301,12 +1685,7 @@ async def toggle_auto_save():
     req = await request.get_json()
     auto_save = req.get("auto_save", False)
 
-    username = get_jwt_identity()
-
-    if not username:
-        abort(401)
-
-    user = User.query.filter_by(username=username.lower()).first()
+    user = get_current_user()
 
     if not user:
         abort(400)
@@ -1326,12 +1705,7 @@ async def toggle_vim_mode():
     req = await request.get_json()
     vim_mode = req.get("vim_mode", False)
 
-    username = get_jwt_identity()
-
-    if not username:
-        abort(401)
-
-    user = User.query.filter_by(username=username.lower()).first()
+    user = get_current_user()
 
     if not user:
         abort(400)
@@ -1349,12 +1723,7 @@ async def toggle_vim_mode():
 @jwt_required()
 async def get_settings():
     """Get all user settings including kanban configuration."""
-    username = get_jwt_identity()
-
-    if not username:
-        abort(401)
-
-    user = User.query.filter_by(username=username.lower()).first()
+    user = get_current_user()
 
     if not user:
         abort(400)
@@ -1384,12 +1753,7 @@ async def update_settings():
     """Update user settings. Only updates fields that are provided."""
     req = await request.get_json()
 
-    username = get_jwt_identity()
-
-    if not username:
-        abort(401)
-
-    user = User.query.filter_by(username=username.lower()).first()
+    user = get_current_user()
 
     if not user:
         abort(400)
@@ -1456,12 +1820,7 @@ async def update_task_column():
     if not task_uuid or not new_column:
         abort(400)
 
-    username = get_jwt_identity()
-
-    if not username:
-        abort(401)
-
-    user = User.query.filter_by(username=username.lower()).first()
+    user = get_current_user()
 
     if not user:
         abort(400)
@@ -1563,6 +1922,93 @@ async def update_task_column():
     )
 
 
+def _narrow(note_ids, allowed):
+    """Intersect the matched note ids with allowed; None stands for all notes"""
+    if allowed is None:
+        return note_ids
+    if note_ids is None:
+        return set(allowed)
+    return note_ids & allowed
+
+
+async def _load_notes(session, user_id, note_ids):
+    """The user's notes with the given ids, or all of them for None"""
+    query = select(Note).filter_by(user_id=user_id)
+    if note_ids is None:
+        return (await session.scalars(query)).all()
+
+    note_ids = list(note_ids)
+    notes = []
+    for i in range(0, len(note_ids), SEARCH_LOAD_BATCH_SIZE):
+        batch = note_ids[i : i + SEARCH_LOAD_BATCH_SIZE]
+        notes.extend(await session.scalars(query.where(Note.uuid.in_(batch))))
+    return notes
+
+
+async def _load_titles(session, user_id, note_ids):
+    """(uuid, title) rows of the user's notes with the given ids, or all for None"""
+    query = select(Note.uuid, Note.title).filter_by(user_id=user_id)
+    if note_ids is None:
+        return (await session.execute(query)).all()
+
+    note_ids = list(note_ids)
+    rows = []
+    for i in range(0, len(note_ids), SEARCH_LOAD_BATCH_SIZE):
+        batch = note_ids[i : i + SEARCH_LOAD_BATCH_SIZE]
+        rows.extend(await session.execute(query.where(Note.uuid.in_(batch))))
+    return rows
+
+
+async def _load_labels(session, note_ids):
+    """The distinct tag and project names of each note, by note id and kind"""
+    if not note_ids:
+        return {}
+
+    rows = (
+        await session.execute(
+            select(Meta.note_id, Meta.kind, Meta.name_encrypted).where(
+                Meta.note_id.in_(note_ids), Meta.kind.in_(["tag", "project"])
+            )
+        )
+    ).all()
+    names = await crypto_executor.run(
+        aes_decrypt_many, [row.name_encrypted for row in rows]
+    )
+
+    labels = {}
+    for row, name in zip(rows, names):
+        labels.setdefault(row.note_id, {}).setdefault(row.kind, set()).add(name)
+    return labels
+
+
+def _score_notes(notes, ranking, terms_lower):
+    """Scores of the notes containing every term, from their decrypted text"""
+    texts = aes_decrypt_many([note.data for note in notes])
+    scores = {}
+    for note, text in zip(notes, texts):
+        if not isinstance(text, str):
+            logger.warning(f"Note {note.uuid} could not be decoded; not searched")
+            continue
+        if all(term in text.lower() for term in terms_lower):
+            scores[note.uuid] = ranking.score(text)
+    return scores
+
+
+def _encode_cursor(key):
+    return base64.urlsafe_b64encode(json.dumps(key).encode("utf-8")).decode("ascii")
+
+
+def _decode_cursor(cursor):
+    """The sort key a search page ended at, from its next_cursor"""
+    try:
+        key = json.loads(base64.urlsafe_b64decode(cursor.encode("ascii")))
+    except (ValueError, TypeError, AttributeError):
+        abort(400)
+    if not isinstance(key, list) or len(key) != 2 or not isinstance(key[1], str):
+        abort(400)
+    return tuple(key)
+
+
 @app.route("/api/search", methods=["POST"])
 @jwt_required()
 async def search():
@@ -1572,322 +2018,565 @@ async def search():
     query_string = req.get("query", "")
     selected_search = req.get("selected", "")
     search_string = req.get("search", "")
+    # Hits are returned a page at a time; next_cursor fetches the next one
+    cursor = req.get("cursor")
+    limit = req.get("limit", SEARCH_PAGE_SIZE)
+    if not isinstance(limit, int) or isinstance(limit, bool) or limit < 1:
+        abort(400)
+    limit = min(limit, SEARCH_MAX_PAGE_SIZE)
 
-    username = get_jwt_identity()
+    async with db.async_session() as session:
+        user = await get_current_user_async(session)
 
-    if not username:
-        abort(401)
+        if not user:
+            abort(400)
 
-    user = User.query.filter_by(username=username.lower()).first()
+        # Determine if using new syntax-based search or legacy dropdown search
+        if query_string:
+            # New syntax-based search
+            parsed = parse_search_query(query_string)
+            tags_filter = parsed["tags"]
+            projects_filter = parsed["projects"]
+            text_terms = parsed["text_terms"]
+        elif selected_search and search_string:
+            # Legacy dropdown-based search (backward compatibility)
+            if selected_search not in ["project", "tag", "search"]:
+                abort(400)
+
+            tags_filter = [search_string] if selected_search == "tag" else []
+            projects_filter = [search_string] if selected_search == "project" else []
+            text_terms = [search_string] if selected_search == "search" else []
+        else:
+            abort(400)
 
-    if not user:
+        # None until a filter narrows the search down from all notes
+        matched_note_ids = None
+
+        if tags_filter or projects_filter:
+            labels = await label_index.get(user.uuid)
+
+        # Filter by tags (AND logic - must have ALL specified tags)
+        # Supports nested tags: searching for "home" matches "home", "home/family", "home/tech", etc.
+        for required_tag in tags_filter:
+            matched_note_ids = _narrow(
+                matched_note_ids, labels["tag"].notes(required_tag, nested=True)
+            )
+
+        # Filter by projects (OR logic - can be in ANY specified project)
+        if projects_filter:
+            project_note_ids = set()
+            for proj_filter in projects_filter:
+                project_note_ids |= labels["project"].notes(proj_filter)
+            matched_note_ids = _narrow(matched_note_ids, project_note_ids)
+
+        # Filter by text terms (AND logic - must contain ALL terms). The index
+        # ranks the notes that may contain them; only the notes of the page
+        # (and any not indexed yet) are decrypted
+        if text_terms:
+            terms_lower = [term.lower() for term in text_terms]
+            ranking = await search_index.rank(user.uuid, text_terms)
+            order = [
+                ((-score, str(note_id)), note_id)
+                for note_id, score in ranking.scores.items()
+                if matched_note_ids is None or note_id in matched_note_ids
+            ]
+            unscored = _narrow(matched_note_ids, ranking.unscored)
+            if unscored != set():
+                unscored_notes = await _load_notes(session, user.uuid, unscored)
+                scores = await crypto_executor.run(
+                    _score_notes, unscored_notes, ranking, terms_lower
+                )
+                order.extend(
+                    ((-score, str(note_id)), note_id)
+                    for note_id, score in scores.items()
+                )
+        else:
+            terms_lower = []
+            rows = await _load_titles(session, user.uuid, matched_note_ids)
+            titles = await crypto_executor.run(
+                aes_decrypt_many, [row.title for row in rows]
+            )
+            order = [
+                ((title.lower(), str(row.uuid)), row.uuid)
+                for row, title in zip(rows, titles)
+                if isinstance(title, str)
+            ]
+        order.sort()
+
+        position = 0
+        if cursor:
+            try:
+                position = bisect.bisect_right(
+                    [key for key, _ in order], _decode_cursor(cursor)
+                )
+            except TypeError:
+                abort(400)
+
+        # Walk the order from the cursor, checking the text of index hits,
+        # until the page is full
+        notes = []
+        while position < len(order) and len(notes) < limit:
+            batch = order[position : position + limit - len(notes)]
+            position += len(batch)
+            loaded = await _load_notes(
+                session, user.uuid, [note_id for _, note_id in batch]
+            )
+            by_id = {
+                note.uuid: cleaned_note
+                for note, cleaned_note in zip(
+                    loaded, await crypto_executor.run(serialize_notes, loaded)
+                )
+            }
+            for key, note_id in batch:
+                cleaned_note = by_id.get(note_id)
+                if cleaned_note is None:
+                    continue
+                if not isinstance(cleaned_note["data"], str) or not isinstance(
+                    cleaned_note["title"], str
+                ):
+                    logger.warning(f"Note {note_id} could not be decoded; not listed")
+                    continue
+                data_lower = cleaned_note["data"].lower()
+                if not all(term in data_lower for term in terms_lower):
+                    continue
+
+                hit = {
+                    "uuid": note_id,
+                    "title": cleaned_note["title"],
+                    "is_date": cleaned_note["is_date"],
+                    "score": round(-key[0], 4) if text_terms else None,
+                }
+
+                # Add snippet with highlights if text search was performed
+                if text_terms:
+                    snippet_data = get_text_snippet(cleaned_note["data"], text_terms)
+                    hit["snippet"] = snippet_data["snippet"]
+                    hit["highlights"] = snippet_data["highlights"]
+
+                notes.append(hit)
+
+        # Tags and projects of the whole page in one query
+        labels = await _load_labels(session, [hit["uuid"] for hit in notes])
+        for hit in notes:
+            note_labels = labels.get(hit["uuid"], {})
+            for kind, key in (("tag", "tags"), ("project", "projects")):
+                hit[key] = sorted(note_labels.get(kind, ()), key=lambda s: s.lower())
+
+    next_cursor = None
+    if position < len(order):
+        next_cursor = _encode_cursor(order[position - 1][0])
+
+    return jsonify(notes=notes, next_cursor=next_cursor), 200
+
+
+@app.route("/api/tags/complete", methods=["GET"])
+@jwt_required()
+async def complete_tags():
+    """Tags (or projects with kind=project) starting with prefix, with note counts"""
+    prefix = request.args.get("prefix", "")
+    kind = request.args.get("kind", "tag")
+    try:
+        limit = int(request.args.get("limit", TAG_COMPLETE_LIMIT))
+    except ValueError:
+        abort(400)
+
+    if kind not in LABEL_KINDS or limit < 1:
         abort(400)
 
-    # Determine if using new syntax-based search or legacy dropdown search
-    if query_string:
-        # New syntax-based search
-        parsed = parse_search_query(query_string)
-        tags_filter = parsed["tags"]
-        projects_filter = parsed["projects"]
-        text_terms = parsed["text_terms"]
-    elif selected_search and search_string:
-        # Legacy dropdown-based search (backward compatibility)
-        if selected_search not in ["project", "tag", "search"]:
+    async with db.async_session() as session:
+        user = await get_current_user_async(session)
+
+        if not user:
             abort(400)
 
-        tags_filter = [search_string] if selected_search == "tag" else []
-        projects_filter = [search_string] if selected_search == "project" else []
-        text_terms = [search_string] if selected_search == "search" else []
-    else:
-        abort(400)
+    labels = await label_index.get(user.uuid)
+    completions = labels[kind].complete(prefix, min(limit, TAG_COMPLETE_MAX_LIMIT))
 
-    # Start with all notes
-    all_notes = user.notes.all()
-    matched_note_ids = set(note.uuid for note in all_notes)
+    return (
+        jsonify(
+            completions=[{"name": name, "count": count} for name, count in completions]
+        ),
+        200,
+    )
 
-    # Filter by tags (AND logic - must have ALL specified tags)
-    # Supports nested tags: searching for "home" matches "home", "home/family", "home/tech", etc.
-    if tags_filter:
-        all_tags = user.meta.filter_by(kind="tag").all()
-        for required_tag in tags_filter:
-            tag_note_ids = set()
-            required_tag_lower = required_tag.lower()
-            for tag in all_tags:
-                tag_name_lower = tag.name.lower()
-                # Match exact tag or nested children (prefix match with /)
-                if tag_name_lower == required_tag_lower or tag_name_lower.startswith(
-                    required_tag_lower + "/"
-                ):
-                    tag_note_ids.add(tag.note_id)
-            matched_note_ids &= tag_note_ids
-
-    # Filter by projects (OR logic - can be in ANY specified project)
-    if projects_filter:
-        all_projects = user.meta.filter_by(kind="project").all()
-        project_note_ids = set()
-        for project in all_projects:
-            for proj_filter in projects_filter:
-                if proj_filter.lower() == project.name.lower():
-                    project_note_ids.add(project.note_id)
-        matched_note_ids &= project_note_ids
-
-    # Filter by text terms (AND logic - must contain ALL terms)
-    if text_terms:
-        text_matched_ids = set()
-        for note in all_notes:
-            if note.uuid not in matched_note_ids:
-                continue
-            note_text_lower = note.text.lower()
-            if all(term.lower() in note_text_lower for term in text_terms):
-                text_matched_ids.add(note.uuid)
-        matched_note_ids &= text_matched_ids
 
-    # Fetch and serialize matched notes
-    filtered_notes = Note.query.filter(Note.uuid.in_(matched_note_ids)).all()
-    notes = []
+class _ZipStream(io.RawIOBase):
+    """
+    Write-only, unseekable sink for zipfile: the archive is written with
+    data descriptors, and whatever has been written so far can be drained
+    and sent while the rest is still being built.
+    """
 
-    for note in filtered_notes:
-        cleaned_note = note.serialize
-        cleaned_note["tags"] = sorted(
-            set([x.name for x in note.meta.filter_by(kind="tag").all()]),
-            key=lambda s: s.lower(),
-        )
-        cleaned_note["projects"] = sorted(
-            set([x.name for x in note.meta.filter_by(kind="project").all()]),
-            key=lambda s: s.lower(),
+    def __init__(self):
+        self._chunks = []
+
+    def writable(self):
+        return True
+
+    def write(self, data):
+        self._chunks.append(bytes(data))
+        return len(data)
+
+    def drain(self):
+        data = b"".join(self._chunks)
+        self._chunks.clear()
+        return data
+
+
+def _export_upload_paths(user_id):
+    """
+    Paths of the user's own uploads that their notes reference. A note can
+    link to any /uploads/ path, so the refs are matched against the user's
+    upload rows rather than trusted as they are.
+    """
+    refs = NoteUploadRef.__table__
+    uploads = Upload.__table__
+    with db.engine.connect() as conn:
+        return (
+            conn.execute(
+                select(refs.c.path)
+                .join(
+                    uploads,
+                    (uploads.c.user_id == refs.c.user_id)
+                    & (uploads.c.path == refs.c.path),
+                )
+                .where(refs.c.user_id == user_id)
+                .distinct()
+                .order_by(refs.c.path)
+            )
+            .scalars()
+            .all()
         )
 
-        # Add snippet with highlights if text search was performed
-        if text_terms:
-            snippet_data = get_text_snippet(note.text, text_terms)
-            cleaned_note["snippet"] = snippet_data["snippet"]
-            cleaned_note["highlights"] = snippet_data["highlights"]
 
-        notes.append(cleaned_note)
+class _ExportCancelled(Exception):
+    pass
 
-    sorted_nodes = sorted(notes, key=lambda s: s["title"].lower())
 
-    return jsonify(notes=sorted_nodes), 200
+def _build_export_archive(user_id, include_uploads, emit):
+    """
+    Write a ZIP of the user's notes, and optionally the uploads they
+    reference, passing each piece of the archive to emit as soon as it is
+    written. Runs in a worker thread: notes come from a single streamed query
+    and are decrypted EXPORT_BATCH_SIZE at a time.
+    """
+    stream = _ZipStream()
+    zf = zipfile.ZipFile(stream, mode="w")
+
+    notes = Note.__table__
+    query = select(notes.c.title, notes.c.data).where(notes.c.user_id == user_id)
+    with db.engine.connect() as conn:
+        result = conn.execution_options(
+            stream_results=True, yield_per=EXPORT_BATCH_SIZE
+        ).execute(query)
+        for rows in result.partitions():
+            plain = aes_decrypt_many(
+                [row.title for row in rows] + [row.data for row in rows]
+            )
+            for title, text in zip(plain[: len(rows)], plain[len(rows) :]):
+                zf.writestr(f"{title}.md", text or "", zipfile.ZIP_DEFLATED)
+            emit(stream.drain())
+
+    if include_uploads:
+        for path in _export_upload_paths(user_id):
+            relative = path.replace("/uploads/", "", 1)
+            file_path = safe_join(app.config["UPLOAD_FOLDER"], relative)
+            if file_path is None or not os.path.isfile(file_path):
+                continue
+
+            # Images are already compressed; store them as they are
+            info = zipfile.ZipInfo(f"uploads/{relative}")
+            info.compress_type = zipfile.ZIP_STORED
+            info.file_size = os.path.getsize(file_path)
+            with open(file_path, "rb") as source, zf.open(info, "w") as entry:
+                for chunk in iter(lambda: source.read(UPLOAD_SEND_BUFFER_SIZE), b""):
+                    entry.write(chunk)
+                    emit(stream.drain())
+            emit(stream.drain())
+
+    zf.close()
+    emit(stream.drain())
+
+
+async def _export_archive(user_id, include_uploads):
+    """
+    Yield the export ZIP while a worker thread builds it. At most
+    EXPORT_QUEUE_SIZE pieces wait to be sent, so memory use and time to first
+    byte don't grow with the account; the worker stops if the client goes away.
+    """
+    loop = asyncio.get_running_loop()
+    pieces = asyncio.Queue()
+    slots = threading.Semaphore(EXPORT_QUEUE_SIZE)
+    cancelled = threading.Event()
+    finished = object()
+
+    def emit(piece):
+        if isinstance(piece, bytes) and not piece:
+            return
+        while not slots.acquire(timeout=1):
+            if cancelled.is_set():
+                raise _ExportCancelled()
+        loop.call_soon_threadsafe(pieces.put_nowait, piece)
+
+    def build():
+        try:
+            _build_export_archive(user_id, include_uploads, emit)
+        except _ExportCancelled:
+            return
+        except Exception as e:
+            emit(e)
+            return
+        emit(finished)
+
+    worker = loop.run_in_executor(None, build)
+    try:
+        while True:
+            piece = await pieces.get()
+            slots.release()
+            if piece is finished:
+                break
+            if isinstance(piece, Exception):
+                raise piece
+            yield piece
+    finally:
+        cancelled.set()
+    await worker
 
 
 @app.route("/api/export")
 @jwt_required()
 async def export():
-    username = get_jwt_identity()
-    user = User.query.filter_by(username=username.lower()).first()
+    user = get_current_user()
 
     if not user:
         abort(400)
 
-    zip_location = app.config["EXPORT_FILE"]
-    zf = zipfile.ZipFile(zip_location, mode="w")
-    os.chmod(zip_location, 0o755)
-    notes = user.notes
-    for note in notes:
-        ret_note = note.serialize
-        zf.writestr(ret_note["title"] + ".md", ret_note["data"], zipfile.ZIP_DEFLATED)
-    zf.close()
+    include_uploads = request.args.get("uploads", "").lower() in ("1", "true", "yes")
+    response = Response(
+        _export_archive(user.uuid, include_uploads), mimetype="application/zip"
+    )
+    response.headers["Content-Disposition"] = 'attachment; filename="export.zip"'
+    # Large accounts can take longer than the default response timeout
+    response.timeout = None
+    return response
 
-    rval = await send_file(zip_location, as_attachment=True)
-    os.remove(zip_location)
-    return rval
 
+def _plan_import(zf, user_id, existing_days):
+    """
+    Pick the Markdown files of an archive to import, as [(info, name, is_date)],
+    and count the daily notes skipped because that day already has a note.
+    Daily notes are recognised by file name (MM-dd-yyyy.md), so nothing has
+    to be read or parsed yet. existing_days holds the title_index of the
+    user's daily notes and gains the days being imported.
+    """
+    members = []
+    skipped = 0
+    for info in zf.infolist():
+        filename = info.filename
 
-@app.route("/api/import", methods=["POST"])
-@jwt_required()
-async def import_notes():
-    import re
-    import os
-    from app.models import aes_encrypt
+        # Skip directories, non-markdown files and hidden or system files
+        if info.is_dir() or not filename.endswith(".md"):
+            continue
+        if os.path.basename(filename).startswith("."):
+            continue
 
-    username = get_jwt_identity()
-    user = User.query.filter_by(username=username.lower()).first()
+        name = os.path.basename(filename)[:-3]
+        is_date = DAILY_NOTE_NAME.match(name) is not None
+        if is_date:
+            title_index = make_title_index(user_id, name)
+            # Also skips later copies of the same day within the archive
+            if title_index in existing_days:
+                skipped += 1
+                continue
+            existing_days.add(title_index)
 
-    if not user:
-        abort(400)
+        members.append((info, name, is_date))
+    return members, skipped
 
-    files = await request.files
-    if "file" not in files:
-        return jsonify({"error": "No file provided"}), 400
 
-    file = files["file"]
+def _prepare_import_batch(user_id, zf, members):
+    """
+    Read, parse and encrypt a batch of archive members in a worker thread.
+    Returns (prepare_note_rows results, search_term rows for their words,
+    number of files that failed).
+    """
+    prepared = []
+    errors = 0
+    for info, name, is_date in members:
+        try:
+            with zf.open(info) as member:
+                parsed = parse_note(member.read().decode("utf-8"))
 
-    if file.filename == "":
-        return jsonify({"error": "No file selected"}), 400
+            # Daily notes keep their date as title unless the frontmatter has one
+            title = parsed.post.get("title")
+            if is_date and isinstance(title, str) and len(title) > 0:
+                name = title
 
-    if not file.filename.endswith(".zip"):
-        return jsonify({"error": "Only ZIP files are supported"}), 400
+            prepared.append(prepare_note_rows(user_id, parsed, is_date, name))
+        except Exception as e:
+            logger.warning(f"Error importing {info.filename}: {e}")
+            errors += 1
 
-    import_location = None
+    words = {}
+    for note in prepared:
+        words.update(note.words)
+    return prepared, search_term_rows(user_id, words), errors
 
-    try:
-        # Save uploaded file temporarily
-        import_location = app.config["EXPORT_FILE"].replace("export.zip", "import.zip")
-        await file.save(import_location)
 
-        # Open and process the ZIP file
-        imported_count = 0
-        skipped_count = 0
-        error_count = 0
+async def _import_archive(user_id, zf):
+    """
+    Import the Markdown files of an open archive in one transaction.
 
-        with zipfile.ZipFile(import_location, "r") as zf:
-            for file_info in zf.filelist:
-                filename = file_info.filename
+    The user's existing daily notes are looked up once. Batches of
+    IMPORT_BATCH_SIZE files are then read, parsed and encrypted in the crypto
+    pool, several at a time, and each batch is inserted with one executemany
+    per table as soon as it is ready. Progress is sent to the user's SSE
+    clients as "import_progress" events. Returns (imported, skipped, errors).
+    """
+    notes = Note.__table__
+    imported = 0
+    errors = 0
+    pending = collections.deque()
+
+    async with db.async_engine.begin() as conn:
+        existing_days = set(
+            (
+                await conn.execute(
+                    select(notes.c.title_index).where(
+                        notes.c.user_id == user_id, notes.c.is_date.is_(True)
+                    )
+                )
+            ).scalars()
+        )
+        members, skipped = await asyncio.to_thread(
+            _plan_import, zf, user_id, existing_days
+        )
+        batches = collections.deque(
+            members[i : i + IMPORT_BATCH_SIZE]
+            for i in range(0, len(members), IMPORT_BATCH_SIZE)
+        )
+        total = len(members) + skipped
 
-                # Skip directories and non-markdown files
-                if file_info.is_dir() or not filename.endswith(".md"):
-                    continue
+        try:
+            while batches or pending:
+                # Keep every worker busy while earlier batches are inserted
+                while batches and len(pending) < crypto_executor.max_workers:
+                    pending.append(
+                        asyncio.ensure_future(
+                            crypto_executor.run(
+                                _prepare_import_batch, user_id, zf, batches.popleft()
+                            )
+                        )
+                    )
 
-                # Skip hidden files and system files
-                if os.path.basename(filename).startswith("."):
-                    continue
+                prepared, term_rows, failed = await pending.popleft()
+                if prepared:
+                    await conn.run_sync(insert_note_rows, prepared, term_rows)
+                imported += len(prepared)
+                errors += failed
+
+                await _sse_broadcast(
+                    str(user_id),
+                    "import_progress",
+                    {
+                        "processed": imported + errors + skipped,
+                        "total": total,
+                        "imported": imported,
+                        "skipped": skipped,
+                        "errors": errors,
+                    },
+                )
+        finally:
+            for task in pending:
+                task.cancel()
 
-                try:
-                    # Read markdown content
-                    content = zf.read(filename).decode("utf-8")
-
-                    # Extract just the filename without path and extension
-                    base_filename = os.path.basename(filename)[:-3]
-
-                    # Parse frontmatter to determine if it's a daily note
-                    data = frontmatter.loads(content)
-                    is_date = False
-                    note_title = base_filename
-
-                    # Check if this is a daily note by title format (MM-dd-yyyy)
-                    date_pattern = r"^\d{2}-\d{2}-\d{4}$"
-                    if re.match(date_pattern, base_filename):
-                        is_date = True
-
-                        # Check if daily note already exists for this date
-                        # Query all daily notes for this user and check decrypted titles
-                        existing_daily_notes = Note.query.filter_by(
-                            user_id=user.uuid, is_date=True
-                        ).all()
-                        note_exists = False
-                        for existing in existing_daily_notes:
-                            if existing.name == base_filename:
-                                note_exists = True
-                                break
-
-                        if note_exists:
-                            skipped_count += 1
-                            continue
-
-                    # Extract title from frontmatter if available
-                    if (
-                        isinstance(data.get("title"), str)
-                        and len(data.get("title")) > 0
-                    ):
-                        note_title = data.get("title")
+    # The notes bypassed the session, so its change hooks never saw them
+    search_index.invalidate(user_id)
+    label_index.invalidate(user_id)
+    return imported, skipped, errors
 
-                    # Create new note
-                    note = Note()
-                    note.user_id = user.uuid
-                    note.text = content
-                    note.name = note_title
-                    note.is_date = is_date
 
-                    db.session.add(note)
-                    imported_count += 1
+@app.route("/api/import", methods=["POST"])
+@jwt_required()
+async def import_notes():
+    user = get_current_user()
 
-                except Exception as e:
-                    print(f"Error importing {filename}: {str(e)}")
-                    import traceback
+    if not user:
+        abort(400)
 
-                    traceback.print_exc()
-                    error_count += 1
-                    continue
+    files = await request.files
+    if "file" not in files:
+        return jsonify({"error": "No file provided"}), 400
 
-        # Commit all changes
-        db.session.commit()
+    file = files["file"]
 
-        # Clean up temporary file
-        if import_location and os.path.exists(import_location):
-            os.remove(import_location)
+    if file.filename == "":
+        return jsonify({"error": "No file selected"}), 400
 
-        return (
-            jsonify(
-                {
-                    "message": "Import completed",
-                    "imported": imported_count,
-                    "skipped": skipped_count,
-                    "errors": error_count,
-                }
-            ),
-            200,
-        )
+    if not file.filename.endswith(".zip"):
+        return jsonify({"error": "Only ZIP files are supported"}), 400
 
+    # Members are read straight from the uploaded file; nothing is copied to a
+    # shared location, so concurrent imports don't overwrite each other
+    try:
+        zf = await asyncio.to_thread(zipfile.ZipFile, file.stream)
     except zipfile.BadZipFile:
-        if import_location and os.path.exists(import_location):
-            os.remove(import_location)
         return jsonify({"error": "Invalid ZIP file"}), 400
+
+    try:
+        with zf:
+            imported_count, skipped_count, error_count = await _import_archive(
+                user.uuid, zf
+            )
     except Exception as e:
         print(f"Import error: {str(e)}")
         import traceback
 
         traceback.print_exc()
-        if import_location and os.path.exists(import_location):
-            os.remove(import_location)
         return jsonify({"error": f"Import failed: {str(e)}"}), 500
 
+    return (
+        jsonify(
+            {
+                "message": "Import completed",
+                "imported": imported_count,
+                "skipped": skipped_count,
+                "errors": error_count,
+            }
+        ),
+        200,
+    )
+
 
 @app.route("/api/upload", methods=["POST"])
 @jwt_required()
 async def upload_file():
     username = get_jwt_identity()
-    user = User.query.filter_by(username=username.lower()).first()
+    user = get_current_user()
 
     if not user:
         abort(400)
 
     _ensure_upload_table()
 
-    files = await request.files
-    if "file" not in files:
-        return jsonify({"error": "No file provided"}), 400
-
-    file = files["file"]
-
-    if file.filename == "":
-        return jsonify({"error": "No file selected"}), 400
-
-    filename = secure_filename(file.filename)
-    if not _is_allowed_file(filename, file.mimetype):
-        return jsonify({"error": "Unsupported file type"}), 400
-
-    max_size = app.config.get("MAX_UPLOAD_SIZE")
-    # Read the file content to determine size
-    file_content = await file.read()
-    file_size = len(file_content)
-
-    if max_size and file_size and file_size > max_size:
-        return jsonify({"error": "File too large"}), 413
-
     user_dir = os.path.join(app.config["UPLOAD_FOLDER"], username.lower())
-    os.makedirs(user_dir, exist_ok=True)
+    await asyncio.to_thread(os.makedirs, user_dir, exist_ok=True)
 
-    ext = os.path.splitext(filename)[1].lower()
-    saved_name = f"{uuid4().hex}{ext}"
-    file_path = os.path.join(user_dir, saved_name)
+    try:
+        filename, temp_path, file_size, content_hash = await _stream_upload(
+            user_dir, app.config.get("MAX_UPLOAD_SIZE")
+        )
+    except _UploadRejected as e:
+        return jsonify({"error": e.message}), e.status
 
-    # Write file content to disk
-    with open(file_path, "wb") as f:
-        f.write(file_content)
+    upload_row = await _store_upload(
+        user, username.lower(), filename, temp_path, file_size, content_hash
+    )
 
-    relative_path = f"/uploads/{username.lower()}/{saved_name}"
     url_prefix = request.script_root or ""
-    public_url = f"{url_prefix}{relative_path}"
-
-    upload_row = Upload(
-        user_id=user.uuid,
-        filename=saved_name,
-        path=relative_path,
-        size=file_size if file_size else None,
-        last_seen_at=datetime.datetime.utcnow(),
-    )
-    db.session.add(upload_row)
-    db.session.commit()
+    public_url = f"{url_prefix}{upload_row.path}"
+    relative_path = upload_row.path
+    saved_name = upload_row.filename
 
     return (
         jsonify(
@@ -1904,82 +2593,102 @@ async def upload_file():
 
 @app.route("/uploads/<path:filename>")
 async def uploaded_file(filename):
-    return await send_from_directory(app.config["UPLOAD_FOLDER"], filename)
+    file_path = safe_join(app.config["UPLOAD_FOLDER"], filename)
+    if file_path is None:
+        abort(404)
+
+    response = None
+    width = request.args.get("w", type=int)
+    if width and await asyncio.to_thread(os.path.isfile, file_path):
+        variant = await variant_cache.get(f"/uploads/{filename}", file_path, width)
+        if variant is not None:
+            # None if the variant was evicted in the meantime
+            response = await _send_upload(variant, VARIANT_MIMETYPE)
+
+    if response is None:
+        response = await _send_upload(file_path)
+    if response is None:
+        abort(404)
+    return response
 
 
 @app.route("/api/uploads/orphans", methods=["GET"])
 @jwt_required()
 async def list_orphan_uploads():
-    username = get_jwt_identity()
-    user = User.query.filter_by(username=username.lower()).first()
+    """
+    Uploads no note references, with when the background GC will collect
+    them, and what it has freed recently. Nothing is scanned or deleted here.
+    """
+    user = get_current_user()
 
     if not user:
         abort(400)
 
     _ensure_upload_table()
-    referenced = _collect_referenced_uploads_for_user(user)
-    uploads = Upload.query.filter_by(user_id=user.uuid).all()
 
+    grace = datetime.timedelta(hours=app.config["UPLOAD_GC_GRACE_HOURS"])
     orphans = []
-    for upload in uploads:
-        if upload.path not in referenced:
-            file_path = os.path.join(
-                app.config["UPLOAD_FOLDER"], upload.path.replace("/uploads/", "")
-            )
-            size = upload.size
-            if size is None and os.path.exists(file_path):
-                size = os.path.getsize(file_path)
-            orphans.append(
-                {
-                    "uuid": str(upload.uuid),
-                    "filename": upload.filename,
-                    "path": upload.path,
-                    "size": size,
-                    "created_at": upload.created_at,
-                    "last_seen_at": upload.last_seen_at,
-                }
-            )
+    for upload in _orphan_uploads_query(user).all():
+        last_seen = upload.last_seen_at or upload.created_at
+        orphans.append(
+            {
+                "uuid": str(upload.uuid),
+                "filename": upload.filename,
+                "path": upload.path,
+                "size": upload.size,
+                "created_at": upload.created_at,
+                "last_seen_at": upload.last_seen_at,
+                "collect_after": last_seen + grace if last_seen else None,
+            }
+        )
 
-    return jsonify({"orphans": orphans, "count": len(orphans)}), 200
+    return (
+        jsonify(
+            {
+                "orphans": orphans,
+                "count": len(orphans),
+                "freed": [entry.serialize for entry in _recently_freed_uploads(user)],
+                "last_gc_at": upload_gc_stats["last_run_at"],
+            }
+        ),
+        200,
+    )
 
 
 @app.route("/api/uploads/orphans/cleanup", methods=["POST"])
 @jwt_required()
 async def cleanup_orphan_uploads():
-    username = get_jwt_identity()
-    user = User.query.filter_by(username=username.lower()).first()
+    """
+    Collect the user's orphaned uploads now, skipping the grace period. The
+    deletion runs in the background; the response lists what it will free.
+    """
+    user = get_current_user()
 
     if not user:
         abort(400)
 
     _ensure_upload_table()
-    referenced = _collect_referenced_uploads_for_user(user)
-    uploads = Upload.query.filter_by(user_id=user.uuid).all()
 
-    deleted = []
-    for upload in uploads:
-        if upload.path in referenced:
-            continue
-
-        file_path = os.path.join(
-            app.config["UPLOAD_FOLDER"], upload.path.replace("/uploads/", "")
+    scheduled = [upload.path for upload in _orphan_uploads_query(user).all()]
+    if scheduled:
+        app.add_background_task(
+            asyncio.to_thread,
+            collect_orphan_uploads,
+            user.uuid,
+            datetime.datetime.utcnow(),
+            None,
         )
-        if os.path.exists(file_path):
-            try:
-                os.remove(file_path)
-            except OSError as e:
-                import logging
-
-                logging.getLogger(__name__).warning(
-                    f"Failed to delete orphan file {file_path}: {e}"
-                )
-
-        db.session.delete(upload)
-        deleted.append(upload.path)
-
-    db.session.commit()
 
-    return jsonify({"deleted": deleted, "count": len(deleted)}), 200
+    return (
+        jsonify(
+            {
+                "scheduled": scheduled,
+                "count": len(scheduled),
+                "freed": [entry.serialize for entry in _recently_freed_uploads(user)],
+            }
+        ),
+        202,
+    )
 
 
 @app.route("/api/events/stream", methods=["GET", "OPTIONS"])
@@ -2009,7 +2718,7 @@ async def sse_stream():
     if not username:
         abort(401)
 
-    user = User.query.filter_by(username=username.lower()).first()
+    user = get_current_user()
 
     if not user:
         abort(400)
@@ -0,0 +1,399 @@
+"""
+Candidate lookup and ranking for /api/search text terms. The words of every
+note are stored as keyed hashes with their counts in note_token, and each
+user's words, encrypted, in search_term (see models.sync_note_tokens). This
+module keeps decrypted vocabularies in memory: a term is expanded to the
+words containing it, and the notes holding those words are found and scored
+(BM25) with one indexed query per word of the term. Vocabularies are loaded
+on a user's first text search, extended as notes are saved, and evicted
+least recently used first under a global memory budget
+(SEARCH_INDEX_CACHE_MB). search_term rows are only ever added, so each
+search compares the user's row count with the cached vocabulary and reads
+the words another process (./rebuild_search_index.py, another server
+worker) added meanwhile.
+"""
+
+import asyncio
+import logging
+import math
+import threading
+from collections import OrderedDict
+
+from sqlalchemy import event, func, select
+from sqlalchemy.orm import Session
+
+from app import app, db, crypto_executor
+from app.models import (
+    Note,
+    NoteToken,
+    SearchTerm,
+    aes_decrypt_many,
+    count_words,
+    tokenize,
+)
+
+logger = logging.getLogger(__name__)
+
+LOAD_BATCH_SIZE = 2000
+# A word of a term contained in more of the user's words than this doesn't
+# narrow the search enough to be worth looking up
+MAX_EXPANSION = 1000
+
+# BM25 term frequency saturation and length normalization
+BM25_K1 = 1.2
+BM25_B = 0.75
+
+# Rough CPython cost of a vocabulary entry (dict slot, word and token
+# strings) behind the memory budget
+_WORD_BYTES = 200
+
+
+class Vocabulary:
+    """The decrypted words of one user's notes, with their search tokens"""
+
+    def __init__(self):
+        self.words = {}  # word -> token
+        # Every search_term token read or added, including undecodable words
+        self.tokens = set()
+        self.size = 0
+
+    def add(self, words):
+        for word, token in words.items():
+            self.tokens.add(token)
+            if word not in self.words:
+                self.words[word] = token
+                self.size += len(word) + _WORD_BYTES
+
+    def expand(self, piece):
+        """Tokens of the words containing piece"""
+        return [token for word, token in self.words.items() if piece in word]
+
+
+def _decrypt_terms(rows):
+    """word -> token for the search_term rows whose word can be decoded"""
+    words = {}
+    for row, word in zip(rows, aes_decrypt_many([row.word for row in rows])):
+        if isinstance(word, str):
+            words[word] = row.token
+        else:
+            logger.warning(f"Search term {row.token} could not be decoded")
+    return words
+
+
+def _bm25(frequency, length, average_length, idf):
+    if average_length:
+        norm = 1 - BM25_B + BM25_B * length / average_length
+    else:
+        norm = 1
+    return idf * frequency * (BM25_K1 + 1) / (frequency + BM25_K1 * norm)
+
+
+class Ranking:
+    """
+    BM25 scores for the words of a text search. A word's term frequency in
+    a note is the number of occurrences of the note's words containing it.
+
+    scores holds the notes the index found, which may still turn out not to
+    contain the terms as substrings. unscored is the notes whose words are
+    not indexed, to be checked and scored from their text with score(); None
+    stands for all notes when no word of the terms narrows the search.
+    """
+
+    def __init__(self, idf, average_length, scores, unscored):
+        self.idf = idf  # word of the terms -> inverse document frequency
+        self.average_length = average_length
+        self.scores = scores
+        self.unscored = unscored
+
+    def score(self, text):
+        word_counts = count_words(text)
+        length = sum(word_counts.values())
+        return sum(
+            _bm25(
+                sum(count for word, count in word_counts.items() if piece in word),
+                length,
+                self.average_length,
+                idf,
+            )
+            for piece, idf in self.idf.items()
+        )
+
+
+class SearchIndexCache:
+    """
+    Per-user Vocabulary objects, evicted least recently used first once their
+    estimated total size passes max_bytes. Words committed while one is being
+    loaded are added to it when the load finishes.
+    """
+
+    def __init__(self, max_bytes):
+        self.max_bytes = max_bytes
+        self._vocabularies = OrderedDict()  # user uuid -> Vocabulary
+        self._sizes = {}
+        self._total = 0
+        self._loading = {}  # user uuid -> words committed during the load
+        self._pending = {}  # user uuid -> load task
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.loads = 0
+        self.lookups = 0
+        self.evictions = 0
+        self.refreshes = 0
+
+    def _load(self, user_id, changes):
+        """
+        Read and decrypt a user's search terms (runs in a worker). changes
+        collects the words committed meanwhile.
+        """
+        vocabulary = Vocabulary()
+        terms = SearchTerm.__table__
+        query = select(terms.c.token, terms.c.word).where(terms.c.user_id == user_id)
+        with db.engine.connect() as conn:
+            result = conn.execution_options(
+                stream_results=True, yield_per=LOAD_BATCH_SIZE
+            ).execute(query)
+            for rows in result.partitions():
+                vocabulary.add(_decrypt_terms(rows))
+                vocabulary.tokens.update(row.token for row in rows)
+
+        with self._lock:
+            vocabulary.add(changes)
+            # Unless the user was invalidated while this load was reading
+            if self._loading.get(user_id) is changes:
+                self._store(user_id, vocabulary)
+            self.loads += 1
+        return vocabulary
+
+    def _store(self, user_id, vocabulary):
+        """Add or resize a vocabulary and evict others (called with the lock held)"""
+        size = vocabulary.size
+        self._total += size - self._sizes.get(user_id, 0)
+        self._sizes[user_id] = size
+        self._vocabularies[user_id] = vocabulary
+        self._vocabularies.move_to_end(user_id)
+        while self._total > self.max_bytes and len(self._vocabularies) > 1:
+            evicted, _ = self._vocabularies.popitem(last=False)
+            self._total -= self._sizes.pop(evicted)
+            self.evictions += 1
+
+    async def get(self, user_id):
+        """A user's vocabulary, loading it in the crypto pool if needed"""
+        with self._lock:
+            vocabulary = self._vocabularies.get(user_id)
+            if vocabulary is not None:
+                self._vocabularies.move_to_end(user_id)
+                self.hits += 1
+                return vocabulary
+            # Concurrent searches share one load
+            task = self._pending.get(user_id)
+            if task is None:
+                changes = self._loading[user_id] = {}
+                task = asyncio.ensure_future(
+                    crypto_executor.run(self._load, user_id, changes)
+                )
+                self._pending[user_id] = task
+
+                def done(_):
+                    with self._lock:
+                        if self._pending.get(user_id) is task:
+                            del self._pending[user_id]
+                            del self._loading[user_id]
+
+                task.add_done_callback(done)
+        return await asyncio.shield(task)
+
+    def _refresh(self, user_id, vocabulary):
+        """
+        Add the search terms of the user that vocabulary lacks, written by
+        another process since it was loaded (runs in a worker). Costs one
+        count when it is up to date.
+        """
+        terms = SearchTerm.__table__
+        with db.engine.connect() as conn:
+            count = conn.execute(
+                select(func.count())
+                .select_from(terms)
+                .where(terms.c.user_id == user_id)
+            ).scalar()
+            with self._lock:
+                if count <= len(vocabulary.tokens):
+                    return
+            tokens = set(
+                conn.execute(
+                    select(terms.c.token).where(terms.c.user_id == user_id)
+                ).scalars()
+            )
+            with self._lock:
+                missing = list(tokens - vocabulary.tokens)
+
+            for i in range(0, len(missing), LOAD_BATCH_SIZE):
+                rows = conn.execute(
+                    select(terms.c.token, terms.c.word).where(
+                        terms.c.user_id == user_id,
+                        terms.c.token.in_(missing[i : i + LOAD_BATCH_SIZE]),
+                    )
+                ).all()
+                words = _decrypt_terms(rows)
+                with self._lock:
+                    vocabulary.add(words)
+                    vocabulary.tokens.update(row.token for row in rows)
+                    if self._vocabularies.get(user_id) is vocabulary:
+                        self._store(user_id, vocabulary)
+
+        with self._lock:
+            self.refreshes += 1
+
+    def _rank(self, user_id, pieces, expansions):
+        """
+        A Ranking for the words of a search, given the tokens each word
+        expands to for the words that narrow it (runs in a worker).
+        """
+        note_token = NoteToken.__table__
+        notes = Note.__table__
+        with db.engine.connect() as conn:
+            indexed, total_length = conn.execute(
+                select(func.count(), func.sum(notes.c.word_count)).where(
+                    notes.c.user_id == user_id, notes.c.tokens_indexed.is_(True)
+                )
+            ).one()
+            # Saved before the index existed; may contain the terms
+            unindexed = set(
+                conn.execute(
+                    select(notes.c.uuid).where(
+                        notes.c.user_id == user_id,
+                        notes.c.tokens_indexed.is_not(True),
+                    )
+                ).scalars()
+            )
+            total = indexed + len(unindexed)
+            average_length = (total_length or 0) / indexed if indexed else None
+
+            if not expansions:
+                idf = dict.fromkeys(pieces, 1.0)
+                return Ranking(idf, average_length, {}, None)
+
+            self.lookups += 1
+            frequencies = {}
+            matched = None
+            for piece, tokens in sorted(expansions.items(), key=lambda e: len(e[1])):
+                frequencies[piece] = dict(
+                    conn.execute(
+                        select(note_token.c.note_id, func.sum(note_token.c.count))
+                        .where(
+                            note_token.c.user_id == user_id,
+                            note_token.c.token.in_(tokens),
+                        )
+                        .group_by(note_token.c.note_id)
+                    ).all()
+                )
+                if matched is None:
+                    matched = frequencies[piece].keys() - unindexed
+                else:
+                    matched &= frequencies[piece].keys()
+                if not matched:
+                    break
+
+            lengths = {}
+            matched = list(matched)
+            for i in range(0, len(matched), LOAD_BATCH_SIZE):
+                lengths.update(
+                    conn.execute(
+                        select(notes.c.uuid, notes.c.word_count).where(
+                            notes.c.uuid.in_(matched[i : i + LOAD_BATCH_SIZE])
+                        )
+                    ).all()
+                )
+
+        idf = {}
+        for piece in expansions:
+            found = len(frequencies.get(piece, ()))
+            idf[piece] = math.log(1 + (total - found + 0.5) / (found + 0.5))
+        scores = {
+            note_id: sum(
+                _bm25(
+                    counts[note_id], lengths[note_id] or 0, average_length, idf[piece]
+                )
+                for piece, counts in frequencies.items()
+            )
+            for note_id in lengths
+        }
+        return Ranking(idf, average_length, scores, unindexed)
+
+    async def rank(self, user_id, terms):
+        """
+        A Ranking of the notes that may contain every term as a substring. A
+        term can only occur in a note if each of its words occurs inside one
+        of the note's words, so the notes scored are a superset of the notes
+        /api/search matches; the caller checks the text.
+        """
+        vocabulary = await self.get(user_id)
+        pieces = {piece for term in terms for piece in tokenize(term)}
+
+        def expand():
+            self._refresh(user_id, vocabulary)
+            with self._lock:
+                expansions = {piece: vocabulary.expand(piece) for piece in pieces}
+            return {
+                piece: tokens
+                for piece, tokens in expansions.items()
+                if len(tokens) <= MAX_EXPANSION
+            }
+
+        expansions = await asyncio.to_thread(expand)
+        return await asyncio.to_thread(self._rank, user_id, pieces, expansions)
+
+    def add_words(self, words_by_user):
+        """
+        Add committed words, a dict of user uuid -> {word: token}, to the
+        vocabularies that are loaded or being loaded.
+        """
+        with self._lock:
+            for user_id, words in words_by_user.items():
+                loading = self._loading.get(user_id)
+                if loading is not None:
+                    loading.update(words)
+                vocabulary = self._vocabularies.get(user_id)
+                if vocabulary is not None:
+                    vocabulary.add(words)
+                    self._store(user_id, vocabulary)
+
+    def invalidate(self, user_id):
+        """Drop a user's vocabulary, e.g. after notes were written outside a session"""
+        with self._lock:
+            if self._vocabularies.pop(user_id, None) is not None:
+                self._total -= self._sizes.pop(user_id)
+            # A load already reading the terms may have missed new ones; the
+            # next search starts a new one
+            self._loading.pop(user_id, None)
+            self._pending.pop(user_id, None)
+
+    @property
+    def stats(self):
+        return {
+            "users": len(self._vocabularies),
+            "words": sum(len(v.words) for v in self._vocabularies.values()),
+            "bytes": self._total,
+            "max_bytes": self.max_bytes,
+            "hits": self.hits,
+            "loads": self.loads,
+            "lookups": self.lookups,
+            "evictions": self.evictions,
+            "refreshes": self.refreshes,
+        }
+
+
+search_index = SearchIndexCache(app.config["SEARCH_INDEX_CACHE_MB"] * 1024 * 1024)
+
+
+def add_committed_words(session):
+    words = session.info.pop("search_terms", None)
+    if words:
+        search_index.add_words(words)
+
+
+def discard_committed_words(session):
+    session.info.pop("search_terms", None)
+
+
+event.listen(Session, "after_commit", add_committed_words)
+event.listen(Session, "after_rollback", discard_committed_words)
@@ -0,0 +1,110 @@
+#!/usr/bin/env python
+"""
+Per-row cost of decrypting a 10k-note account for the list endpoints:
+hybrid properties one attribute at a time versus aes_decrypt_many().
+
+Usage: python benchmarks/bench_bulk_decrypt.py [note_count]
+"""
+
+import os
+import sys
+import tempfile
+import time
+import uuid
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+_tmpdir = tempfile.mkdtemp()
+os.environ.setdefault("API_SECRET_KEY", "benchmark-secret")
+os.environ.setdefault("DB_ENCRYPTION_KEY", "0123456789abcdef0123456789abcdef")
+os.environ["DATABASE_URI"] = "sqlite:///" + os.path.join(_tmpdir, "bench.db")
+
+from app import db  # noqa: E402
+from app.models import (  # noqa: E402
+    User,
+    Note,
+    Meta,
+    aes_encrypt,
+    aes_decrypt_many,
+    serialize_notes,
+)
+
+
+def _populate(note_count):
+    db.create_all()
+    user = User(username="bench", password_hash="x")
+    db.session.add(user)
+    db.session.commit()
+
+    body = "---\ntags: work, home/family\nprojects: bench\n---\n\n" + (
+        "- [ ] something to do\n" * 20 + "Lorem ipsum dolor sit amet. " * 40
+    )
+    note_rows = []
+    meta_rows = []
+    for i in range(note_count):
+        note_id = uuid.uuid4()
+        note_rows.append(
+            {
+                "uuid": note_id,
+                "user_id": user.uuid,
+                "data": aes_encrypt(body),
+                "title": aes_encrypt(f"Note {i}"),
+                "is_date": i % 2 == 0,
+            }
+        )
+        for kind, name in (("tag", "work"), ("tag", "home/family"), ("project", "b")):
+            meta_rows.append(
+                {
+                    "uuid": uuid.uuid4(),
+                    "user_id": user.uuid,
+                    "note_id": note_id,
+                    "name_encrypted": aes_encrypt(name),
+                    "kind": kind,
+                }
+            )
+
+    db.session.bulk_insert_mappings(Note, note_rows)
+    db.session.bulk_insert_mappings(Meta, meta_rows)
+    db.session.commit()
+    return user
+
+
+def _timed(label, rows, fn):
+    start = time.perf_counter()
+    fn()
+    elapsed = time.perf_counter() - start
+    print(f"{label:<40} {elapsed * 1000:>9.1f} ms {elapsed / rows * 1e6:>8.2f} us/row")
+
+
+def main():
+    note_count = int(sys.argv[1]) if len(sys.argv) > 1 else 10000
+    user = _populate(note_count)
+
+    notes = Note.query.filter_by(user_id=user.uuid).all()
+    metas = Meta.query.filter_by(user_id=user.uuid).all()
+    print(f"{note_count} notes, {len(metas)} meta rows (rows already loaded)\n")
+
+    _timed(
+        "notes: [n.serialize for n in notes]",
+        len(notes),
+        lambda: [n.serialize for n in notes],
+    )
+    _timed("notes: serialize_notes(notes)", len(notes), lambda: serialize_notes(notes))
+    _timed(
+        "titles: [n.name for n in notes]", len(notes), lambda: [n.name for n in notes]
+    )
+    _timed(
+        "titles: aes_decrypt_many(titles)",
+        len(notes),
+        lambda: aes_decrypt_many([n.title for n in notes]),
+    )
+    _timed("meta: [m.name for m in metas]", len(metas), lambda: [m.name for m in metas])
+    _timed(
+        "meta: aes_decrypt_many(names)",
+        len(metas),
+        lambda: aes_decrypt_many([m.name_encrypted for m in metas]),
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,141 @@
+#!/usr/bin/env python
+"""
+Fire hundreds of overlapping saves at the app through the Quart test client
+and check every one of them landed. Mixes routes on the scoped sync session
+(create_note, task_column) with routes on the async session (save_note,
+save_day) so requests interleave on the event loop the way autosaves do.
+
+Usage: python benchmarks/bench_concurrent_saves.py [request_count]
+"""
+
+import asyncio
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+_tmpdir = tempfile.mkdtemp()
+os.environ.setdefault("API_SECRET_KEY", "benchmark-secret")
+os.environ.setdefault("DB_ENCRYPTION_KEY", "0123456789abcdef0123456789abcdef")
+os.environ["DATABASE_URI"] = "sqlite:///" + os.path.join(_tmpdir, "bench.db")
+
+from app import app, db, pool_monitors  # noqa: E402
+from app.models import Note  # noqa: E402
+
+
+async def _request(client, method, path, headers, **kwargs):
+    response = await getattr(client, method)(path, headers=headers, **kwargs)
+    if response.status_code != 200:
+        raise AssertionError(
+            f"{method.upper()} {path} -> {response.status_code}: "
+            f"{(await response.get_data()).decode(errors='replace')[:200]}"
+        )
+    return await response.get_json()
+
+
+async def main():
+    request_count = int(sys.argv[1]) if len(sys.argv) > 1 else 400
+    db.create_all()
+    app.config["UPLOAD_FOLDER"] = os.path.join(_tmpdir, "uploads")
+
+    client = app.test_client()
+    signup = await client.post(
+        "/api/sign-up", json={"username": "bench", "password": "bench"}
+    )
+    headers = {"Authorization": "Bearer " + (await signup.get_json())["access_token"]}
+
+    # Seed notes to autosave into, each with one task to move between columns
+    seeded = []
+    for i in range(16):
+        data = f"---\ntags: seed\n---\n# Seed {i}\n- [ ] seed task {i}"
+        note = await _request(
+            client, "post", "/api/create_note", headers, json={"data": data}
+        )
+        seeded.append(note["note"]["uuid"])
+    sidebar = await _request(client, "get", "/api/sidebar", headers)
+    tasks = [task["uuid"] for task in sidebar["tasks"]]
+
+    expected_bodies = {}
+
+    def make_request(i):
+        kind = i % 4
+        if kind == 0:
+            return _request(
+                client,
+                "post",
+                "/api/create_note",
+                headers,
+                json={"data": f"---\ntags: new\n---\n# Created {i}\nbody {i}"},
+            )
+        if kind == 1:
+            note_uuid = seeded[i % len(seeded)]
+            body = f"---\ntags: seed, t{i}\n---\n# Seed {i % len(seeded)}\nsaved {i}"
+            expected_bodies.setdefault(note_uuid, set()).add(body)
+            return _request(
+                client,
+                "put",
+                "/api/save_note",
+                headers,
+                json={"uuid": note_uuid, "data": body},
+            )
+        if kind == 2:
+            day = f"01-{(i % 28) + 1:02d}-2024"
+            return _request(
+                client,
+                "put",
+                "/api/save_day",
+                headers,
+                json={"title": day, "data": f"day {i}"},
+            )
+        return _request(
+            client,
+            "put",
+            "/api/task_column",
+            headers,
+            json={"uuid": tasks[i % len(tasks)], "column": f"col{i % 3}"},
+        )
+
+    start = time.perf_counter()
+    results = await asyncio.gather(
+        *(make_request(i) for i in range(request_count)), return_exceptions=True
+    )
+    elapsed = time.perf_counter() - start
+
+    failures = [result for result in results if isinstance(result, Exception)]
+    for failure in failures[:5]:
+        print(f"failed: {failure}")
+
+    db.session.remove()
+    expected_days = len({i % 28 for i in range(2, request_count, 4)})
+    created = Note.query.filter(Note.is_date.is_(False)).count() - len(seeded)
+    days = Note.query.filter(Note.is_date.is_(True)).count()
+    wrong_bodies = [
+        note_uuid
+        for note_uuid, bodies in expected_bodies.items()
+        if db.session.get(Note, note_uuid).text not in bodies
+    ]
+
+    print(
+        f"{request_count} overlapping saves in {elapsed * 1000:.0f} ms "
+        f"({request_count / elapsed:.0f} req/s), {len(failures)} failed"
+    )
+    print(f"created notes: {created}/{len(range(0, request_count, 4))}")
+    print(f"daily notes: {days}/{expected_days}")
+    print(f"autosaved notes with a body that was never sent: {len(wrong_bodies)}")
+    for monitor in pool_monitors:
+        print(f"{monitor.name} pool: {monitor.stats}")
+
+    ok = (
+        not failures
+        and created == len(range(0, request_count, 4))
+        and days == expected_days
+        and not wrong_bodies
+    )
+    print("OK" if ok else "FAILED")
+    return 0 if ok else 1
+
+
+if __name__ == "__main__":
+    sys.exit(asyncio.run(main()))
@@ -0,0 +1,58 @@
+#!/usr/bin/env python
+"""
+Micro-benchmark comparing the v2 (AES-CFB, 8-bit segments) and v3 (AES-CTR + HMAC)
+ciphertext formats across typical note sizes.
+
+Usage: python benchmarks/bench_encryption.py
+"""
+
+import os
+import sys
+import timeit
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# The app module needs these to import; values are irrelevant for benchmarking
+os.environ.setdefault("API_SECRET_KEY", "benchmark-secret")
+os.environ.setdefault("DB_ENCRYPTION_KEY", "0123456789abcdef0123456789abcdef")
+os.environ.setdefault("DATABASE_URI", "sqlite://")
+
+from app.models import aes_encrypt, aes_encrypt_v2, aes_decrypt  # noqa: E402
+
+SIZES = [64, 1024, 16 * 1024, 256 * 1024, 1024 * 1024]
+
+
+def _rate(size, seconds, number):
+    return (size * number) / seconds / (1024 * 1024)
+
+
+def main():
+    print(
+        f"{'size':>10} | {'v2 enc MB/s':>12} {'v3 enc MB/s':>12} | "
+        f"{'v2 dec MB/s':>12} {'v3 dec MB/s':>12} | {'dec speedup':>11}"
+    )
+    for size in SIZES:
+        text = ("lorem ipsum " * (size // 12 + 1))[:size]
+        number = max(3, min(2000, (4 * 1024 * 1024) // size))
+
+        v2_blob = aes_encrypt_v2(text)
+        v3_blob = aes_encrypt(text)
+        assert aes_decrypt(v2_blob) == text
+        assert aes_decrypt(v3_blob) == text
+
+        v2_enc = timeit.timeit(lambda: aes_encrypt_v2(text), number=number)
+        v3_enc = timeit.timeit(lambda: aes_encrypt(text), number=number)
+        v2_dec = timeit.timeit(lambda: aes_decrypt(v2_blob), number=number)
+        v3_dec = timeit.timeit(lambda: aes_decrypt(v3_blob), number=number)
+
+        print(
+            f"{size:>10} | {_rate(size, v2_enc, number):>12.1f} "
+            f"{_rate(size, v3_enc, number):>12.1f} | "
+            f"{_rate(size, v2_dec, number):>12.1f} "
+            f"{_rate(size, v3_dec, number):>12.1f} | "
+            f"{v2_dec / v3_dec:>10.1f}x"
+        )
+
+
+if __name__ == "__main__":
+    main()
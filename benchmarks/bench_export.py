@@ -0,0 +1,85 @@
+#!/usr/bin/env python
+"""
+Time to first byte, total time and peak traced memory of /api/export's
+archive stream against the number of notes in the account.
+
+Usage: python benchmarks/bench_export.py [max_notes]
+"""
+
+import asyncio
+import os
+import sys
+import tempfile
+import time
+import tracemalloc
+import uuid
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+_tmpdir = tempfile.mkdtemp()
+os.environ.setdefault("API_SECRET_KEY", "benchmark-secret")
+os.environ.setdefault("DB_ENCRYPTION_KEY", "0123456789abcdef0123456789abcdef")
+os.environ["DATABASE_URI"] = "sqlite:///" + os.path.join(_tmpdir, "bench.db")
+
+from app import db  # noqa: E402
+from app.models import User, Note, aes_encrypt  # noqa: E402
+from app.routes import _export_archive  # noqa: E402
+
+
+def _populate(note_count):
+    user = User(username=f"bench{note_count}", password_hash="x")
+    db.session.add(user)
+    db.session.commit()
+
+    body = "---\ntags: work\n---\n\n" + "Lorem ipsum dolor sit amet. " * 80
+    db.session.execute(
+        Note.__table__.insert(),
+        [
+            {
+                "uuid": uuid.uuid4(),
+                "user_id": user.uuid,
+                "data": aes_encrypt(body),
+                "title": aes_encrypt(f"Note {i}"),
+                "is_date": False,
+            }
+            for i in range(note_count)
+        ],
+    )
+    db.session.commit()
+    return user.uuid
+
+
+async def _measure(user_id):
+    tracemalloc.start()
+    start = time.perf_counter()
+    first = None
+    size = 0
+    async for piece in _export_archive(user_id, False):
+        if first is None:
+            first = time.perf_counter() - start
+        size += len(piece)
+    elapsed = time.perf_counter() - start
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return first, elapsed, size, peak
+
+
+async def main():
+    max_notes = int(sys.argv[1]) if len(sys.argv) > 1 else 20000
+    db.create_all()
+
+    print(
+        f"{'notes':>7} {'ms to first byte':>17} {'ms total':>10} {'MiB zip':>8} {'MiB peak':>9}"
+    )
+    sizes = [count for count in (100, 1000, 10000) if count < max_notes] + [max_notes]
+    for note_count in sizes:
+        user_id = _populate(note_count)
+        first, elapsed, size, peak = await _measure(user_id)
+        print(
+            f"{note_count:>7} {first * 1000:>17.1f} {elapsed * 1000:>10.0f} "
+            f"{size / (1024 * 1024):>8.1f} {peak / (1024 * 1024):>9.1f}"
+        )
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
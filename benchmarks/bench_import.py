@@ -0,0 +1,92 @@
+#!/usr/bin/env python
+"""
+Time /api/import for an archive of ten years of daily notes plus regular
+notes with tags, projects and tasks, then import it again (every daily note
+is skipped) and check the meta rows written for the imported notes.
+
+Usage: python benchmarks/bench_import.py [years] [regular_notes]
+"""
+
+import asyncio
+import datetime
+import io
+import os
+import sys
+import tempfile
+import time
+import zipfile
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+_tmpdir = tempfile.mkdtemp()
+os.environ.setdefault("API_SECRET_KEY", "benchmark-secret")
+os.environ.setdefault("DB_ENCRYPTION_KEY", "0123456789abcdef0123456789abcdef")
+os.environ["DATABASE_URI"] = "sqlite:///" + os.path.join(_tmpdir, "bench.db")
+
+from quart.datastructures import FileStorage  # noqa: E402
+from sqlalchemy import func, select  # noqa: E402
+
+from app import app, db  # noqa: E402
+from app.models import Meta, Note  # noqa: E402
+
+
+def _archive(years, regular_notes):
+    body = "Lorem ipsum dolor sit amet, consectetur adipiscing elit. " * 20
+    buffer = io.BytesIO()
+    with zipfile.ZipFile(buffer, "w", zipfile.ZIP_DEFLATED) as zf:
+        day = datetime.date(2016, 1, 1)
+        for _ in range(365 * years):
+            zf.writestr(
+                day.strftime("%m-%d-%Y.md"),
+                f"---\ntags: journal, year{day.year}\n---\n\n"
+                f"- [ ] Task for {day}\n- [x] Done {day}\n\n{body}",
+            )
+            day += datetime.timedelta(days=1)
+        for i in range(regular_notes):
+            zf.writestr(
+                f"notes/note-{i}.md",
+                f"---\ntitle: Note {i}\nprojects: project{i % 10}\n---\n\n{body}",
+            )
+    return buffer.getvalue()
+
+
+async def _import(client, headers, data):
+    start = time.perf_counter()
+    response = await client.post(
+        "/api/import",
+        files={"file": FileStorage(io.BytesIO(data), filename="notes.zip")},
+        headers=headers,
+    )
+    elapsed = time.perf_counter() - start
+    return elapsed, await response.get_json()
+
+
+async def main():
+    years = int(sys.argv[1]) if len(sys.argv) > 1 else 10
+    regular_notes = int(sys.argv[2]) if len(sys.argv) > 2 else 350
+    db.create_all()
+
+    client = app.test_client()
+    signup = await client.post(
+        "/api/sign-up", json={"username": "bench", "password": "bench"}
+    )
+    headers = {"Authorization": "Bearer " + (await signup.get_json())["access_token"]}
+
+    data = _archive(years, regular_notes)
+    print(f"archive: {365 * years + regular_notes} notes, {len(data) / 1024:.0f} KiB")
+
+    elapsed, result = await _import(client, headers, data)
+    print(f"import     {elapsed * 1000:>8.0f} ms  {result}")
+    elapsed, result = await _import(client, headers, data)
+    print(f"re-import  {elapsed * 1000:>8.0f} ms  {result}")
+
+    with db.engine.connect() as conn:
+        notes = conn.execute(select(func.count()).select_from(Note.__table__))
+        meta = conn.execute(
+            select(Meta.__table__.c.kind, func.count()).group_by(Meta.__table__.c.kind)
+        )
+        print(f"notes {notes.scalar()}, meta {dict(meta.all())}")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,102 @@
+#!/usr/bin/env python
+"""
+Save latency of a note against the number of tasks in it. The note is
+created with all its tasks, then each save ticks one task and swaps one tag,
+so the flush hooks have to reconcile the note's meta rows every time. Also
+reports the SQL statements issued, and the cost of saves that resend the
+same body or only edit text outside the metadata.
+
+Usage: python benchmarks/bench_note_save.py [saves_per_size]
+"""
+
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+_tmpdir = tempfile.mkdtemp()
+os.environ.setdefault("API_SECRET_KEY", "benchmark-secret")
+os.environ.setdefault("DB_ENCRYPTION_KEY", "0123456789abcdef0123456789abcdef")
+os.environ["DATABASE_URI"] = "sqlite:///" + os.path.join(_tmpdir, "bench.db")
+
+from sqlalchemy import event  # noqa: E402
+
+from app import db  # noqa: E402
+from app.models import User, Note, Meta  # noqa: E402
+
+TASK_COUNTS = [0, 10, 50, 200, 500]
+
+
+def _body(task_count, revision):
+    tasks = "".join(
+        f"- [{'x' if i == revision % max(task_count, 1) else ' '}] task number {i}\n"
+        for i in range(task_count)
+    )
+    return (
+        f"---\ntags: work, home/family, rev{revision}\nprojects: bench\n---\n\n"
+        f"# Benchmark note\n\n{tasks}\nSome text after the tasks.\n"
+    )
+
+
+def main():
+    saves = int(sys.argv[1]) if len(sys.argv) > 1 else 20
+    db.create_all()
+    user = User(username="bench", password_hash="x")
+    db.session.add(user)
+    db.session.commit()
+
+    statements = []
+    event.listen(
+        db.engine, "before_cursor_execute", lambda *args: statements.append(args[2])
+    )
+
+    print(
+        f"{'tasks':>6} {'ms/create':>10} {'statements':>11} "
+        f"{'ms/save':>10} {'statements/save':>16} "
+        f"{'ms/unchanged':>13} {'ms/text-only':>13}"
+    )
+    for task_count in TASK_COUNTS:
+        statements.clear()
+        start = time.perf_counter()
+        note = Note(user_id=user.uuid, text=_body(task_count, 0))
+        db.session.add(note)
+        db.session.commit()
+        create_elapsed = time.perf_counter() - start
+        create_statements = len(statements)
+
+        statements.clear()
+        start = time.perf_counter()
+        for revision in range(1, saves + 1):
+            note.text = _body(task_count, revision)
+            db.session.commit()
+        elapsed = time.perf_counter() - start
+        save_statements = len(statements)
+
+        # Autosave resending the same body, then an edit outside the metadata
+        body = _body(task_count, saves)
+        start = time.perf_counter()
+        for _ in range(saves):
+            note.text = body
+            db.session.commit()
+        unchanged_elapsed = time.perf_counter() - start
+
+        start = time.perf_counter()
+        for revision in range(saves):
+            note.text = body + f"\nedit {revision}\n"
+            db.session.commit()
+        text_only_elapsed = time.perf_counter() - start
+
+        meta_count = Meta.query.filter_by(note_id=note.uuid, kind="task").count()
+        assert meta_count == task_count, (meta_count, task_count)
+        print(
+            f"{task_count:>6} {create_elapsed * 1000:>10.2f} {create_statements:>11} "
+            f"{elapsed / saves * 1000:>10.2f} {save_statements / saves:>16.1f} "
+            f"{unchanged_elapsed / saves * 1000:>13.2f} "
+            f"{text_only_elapsed / saves * 1000:>13.2f}"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,146 @@
+#!/usr/bin/env python
+"""
+Latency of the first page of /api/search text queries against the number
+of notes in the account: the first search after start-up, then the median
+of repeated searches for common, rare and absent words. Notes are written
+directly and then indexed the way the backfill job does it.
+
+Also counts the SQL statements of a common-word search for pages of 10 and
+200 hits (statements/hits), and exits with an error if the count grows
+with the page size.
+
+Usage: python benchmarks/bench_search.py [max_notes]
+"""
+
+import asyncio
+import os
+import random
+import statistics
+import sys
+import tempfile
+import time
+import uuid
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+_tmpdir = tempfile.mkdtemp()
+os.environ.setdefault("API_SECRET_KEY", "benchmark-secret")
+os.environ.setdefault("DB_ENCRYPTION_KEY", "0123456789abcdef0123456789abcdef")
+os.environ["DATABASE_URI"] = "sqlite:///" + os.path.join(_tmpdir, "bench.db")
+
+from sqlalchemy import event  # noqa: E402
+
+from app import app, db  # noqa: E402
+from app.jobs import index_notes_batch  # noqa: E402
+from app.models import Note, User, aes_encrypt  # noqa: E402
+
+VOCABULARY = [f"word{i}" for i in range(5000)]
+QUERIES = {"common": "word2 word3", "rare": "word400", "absent": "zzzz"}
+
+
+def _populate(user_id, note_count):
+    rng = random.Random(note_count)
+    db.session.execute(
+        Note.__table__.insert(),
+        [
+            {
+                "uuid": uuid.uuid4(),
+                "user_id": user_id,
+                "data": aes_encrypt(
+                    f"# Note {i}\n\n"
+                    # Skewed so a few words are common and most are rare
+                    + " ".join(
+                        VOCABULARY[int(rng.paretovariate(1.2)) % len(VOCABULARY)]
+                        for _ in range(150)
+                    )
+                ),
+                "title": aes_encrypt(f"Note {i}"),
+                "is_date": False,
+            }
+            for i in range(note_count)
+        ],
+    )
+    db.session.commit()
+    while index_notes_batch(500)[2]:
+        pass
+
+
+async def _search(client, headers, query, limit=None):
+    body = {"query": query}
+    if limit is not None:
+        body["limit"] = limit
+    start = time.perf_counter()
+    response = await client.post("/api/search", json=body, headers=headers)
+    elapsed = time.perf_counter() - start
+    return elapsed * 1000, len((await response.get_json())["notes"])
+
+
+async def _count_statements(client, headers, query, limit):
+    statements = []
+
+    def count(*args):
+        statements.append(args[2])
+
+    engines = (db.engine, db.async_engine.sync_engine)
+    for engine in engines:
+        event.listen(engine, "before_cursor_execute", count)
+    try:
+        _, hits = await _search(client, headers, query, limit)
+    finally:
+        for engine in engines:
+            event.remove(engine, "before_cursor_execute", count)
+    return len(statements), hits
+
+
+async def main():
+    max_notes = int(sys.argv[1]) if len(sys.argv) > 1 else 10000
+    db.create_all()
+    client = app.test_client()
+
+    print(
+        f"{'notes':>7} {'first ms':>9} "
+        + " ".join(f"{name + ' ms':>10} {'hits':>6}" for name in QUERIES)
+        + f" {'queries':>9}"
+    )
+    failures = []
+    sizes = [count for count in (100, 1000) if count < max_notes] + [max_notes]
+    for note_count in sizes:
+        signup = await client.post(
+            "/api/sign-up", json={"username": f"bench{note_count}", "password": "x"}
+        )
+        token = (await signup.get_json())["access_token"]
+        headers = {"Authorization": "Bearer " + token}
+        user = db.session.query(User).filter_by(username=f"bench{note_count}").one()
+        _populate(user.uuid, note_count)
+
+        first, _ = await _search(client, headers, QUERIES["rare"])
+        columns = []
+        for query in QUERIES.values():
+            timings = []
+            for _ in range(5):
+                elapsed, hits = await _search(client, headers, query)
+                timings.append(elapsed)
+            columns.append(f"{statistics.median(timings):>10.1f} {hits:>6}")
+
+        page_counts = []
+        statements = set()
+        for limit in (10, 200):
+            count, hits = await _count_statements(
+                client, headers, QUERIES["common"], limit
+            )
+            page_counts.append(f"{count}/{hits}")
+            statements.add(count)
+        if len(statements) > 1:
+            failures.append(note_count)
+        print(
+            f"{note_count:>7} {first:>9.1f} "
+            + " ".join(columns)
+            + f" {' '.join(page_counts):>9}"
+        )
+
+    if failures:
+        sys.exit(f"statements per search grow with the hits for {failures} notes")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
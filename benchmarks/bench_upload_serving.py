@@ -0,0 +1,113 @@
+#!/usr/bin/env python
+"""
+Throughput of /uploads under many concurrent image requests, through the
+Quart test client: full downloads, revalidations that send back the ETag
+the first download returned, and Range requests for the second half of
+each file.
+
+Usage: python benchmarks/bench_upload_serving.py [concurrency] [image_count] [image_kb]
+"""
+
+import asyncio
+import io
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+_tmpdir = tempfile.mkdtemp()
+os.environ.setdefault("API_SECRET_KEY", "benchmark-secret")
+os.environ.setdefault("DB_ENCRYPTION_KEY", "0123456789abcdef0123456789abcdef")
+os.environ["DATABASE_URI"] = "sqlite:///" + os.path.join(_tmpdir, "bench.db")
+
+from quart.datastructures import FileStorage  # noqa: E402
+
+from app import app, db  # noqa: E402
+
+
+async def _run(label, client, requests, concurrency, expected_status):
+    queue = list(requests)
+    transferred = 0
+    statuses = {}
+
+    async def worker():
+        nonlocal transferred
+        while queue:
+            path, headers = queue.pop()
+            response = await client.get(path, headers=headers)
+            transferred += len(await response.get_data())
+            statuses[response.status_code] = statuses.get(response.status_code, 0) + 1
+
+    start = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    elapsed = time.perf_counter() - start
+    print(
+        f"{label:<14} {len(requests) / elapsed:>9.0f} req/s "
+        f"{transferred / elapsed / (1024 * 1024):>9.1f} MiB/s  statuses {statuses}"
+    )
+    return statuses.keys() == {expected_status}
+
+
+async def main():
+    concurrency = int(sys.argv[1]) if len(sys.argv) > 1 else 64
+    image_count = int(sys.argv[2]) if len(sys.argv) > 2 else 50
+    image_kb = int(sys.argv[3]) if len(sys.argv) > 3 else 512
+    rounds = 4
+
+    db.create_all()
+    app.config["UPLOAD_FOLDER"] = os.path.join(_tmpdir, "uploads")
+
+    client = app.test_client()
+    signup = await client.post(
+        "/api/sign-up", json={"username": "bench", "password": "bench"}
+    )
+    headers = {"Authorization": "Bearer " + (await signup.get_json())["access_token"]}
+
+    paths = []
+    for i in range(image_count):
+        data = b"\x89PNG" + os.urandom(image_kb * 1024)
+        response = await client.post(
+            "/api/upload",
+            files={
+                "file": FileStorage(
+                    io.BytesIO(data), filename=f"{i}.png", content_type="image/png"
+                )
+            },
+            headers=headers,
+        )
+        paths.append((await response.get_json())["path"])
+
+    first = await client.get(paths[0])
+    print(
+        f"{image_count} images of {image_kb} KiB, {concurrency} concurrent requests\n"
+        f"Cache-Control: {first.headers.get('Cache-Control')}\n"
+        f"ETag: {first.headers.get('ETag')}\n"
+        f"Accept-Ranges: {first.headers.get('Accept-Ranges')}\n"
+    )
+
+    etags = {}
+    for path in paths:
+        etags[path] = (await client.get(path)).headers.get("ETag")
+
+    full = [(path, {}) for path in paths] * rounds
+    revalidate = (
+        [
+            (path, {"If-None-Match": etags[path]} if etags[path] else {})
+            for path in paths
+        ]
+        * rounds
+        * 4
+    )
+    ranged = [(path, {"Range": f"bytes={image_kb * 512}-"}) for path in paths] * rounds
+
+    ok = await _run("full", client, full, concurrency, 200)
+    ok &= await _run("revalidate", client, revalidate, concurrency, 304)
+    ok &= await _run("range", client, ranged, concurrency, 206)
+    print("OK" if ok else "FAILED")
+    return 0 if ok else 1
+
+
+if __name__ == "__main__":
+    sys.exit(asyncio.run(main()))
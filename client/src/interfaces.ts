@@ -22,6 +22,7 @@ export interface INote {
   projects?: string;
   snippet?: string;
   highlights?: string[];
+  score?: number | null;
 }
 
 export interface IMeta {
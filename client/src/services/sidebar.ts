@@ -79,10 +79,12 @@ class SidebarSerivce {
   public date: Date | null = null;
   public sidebarLoading: boolean = false;
   public searchLoading: boolean = false;
+  public searchLoadingMore: boolean = false;
   public selectedSearch: string = '';
   public searchString: string = '';
   public searchQuery: string = '';
   public filteredNotes: INote[] = [];
+  public searchCursor: string | null = null;
 
   /**
    * Returns the tags organized as a nested tree structure.
@@ -205,34 +207,56 @@ class SidebarSerivce {
     this.sidebarLoading = false;
   }
 
-  public async searchNotes() {
-    if (this.searchLoading) {
+  /**
+   * Runs the current search, or with loadMore fetches its next page of
+   * results and appends them.
+   */
+  public async searchNotes(loadMore: boolean = false) {
+    if (this.searchLoading || this.searchLoadingMore) {
+      return;
+    }
+
+    if (loadMore && !this.searchCursor) {
       return;
     }
 
-    this.searchLoading = true;
+    if (loadMore) {
+      this.searchLoadingMore = true;
+    } else {
+      this.searchLoading = true;
+    }
 
     try {
       let res;
+      const page = loadMore ? { cursor: this.searchCursor } : {};
 
       // Use new query-based search if searchQuery is set, otherwise use legacy
       if (this.searchQuery) {
         res = await Requests.post('/search', {
           query: this.searchQuery,
+          ...page,
         });
       } else {
         res = await Requests.post('/search', {
           selected: this.selectedSearch,
           search: this.searchString,
+          ...page,
         });
       }
 
       if (res?.data) {
-        this.filteredNotes = res.data.notes || [];
+        const notes = res.data.notes || [];
+        this.filteredNotes = loadMore ? [...this.filteredNotes, ...notes] : notes;
+        this.searchCursor = res.data.next_cursor || null;
       }
     } catch (_e) {}
 
     this.searchLoading = false;
+    this.searchLoadingMore = false;
+
+    if (loadMore) {
+      return;
+    }
 
     // Update URL - use q param for new syntax, legacy params for old
     if (this.searchQuery) {
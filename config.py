@@ -11,12 +11,74 @@ class Config(object):
     SQLALCHEMY_DATABASE_URI = os.environ.get(
         "DATABASE_URI"
     ) or "sqlite:///" + os.path.join(basedir + "/config", "app.db")
+    # Optional override; derived from DATABASE_URI (aiosqlite/asyncpg/aiomysql) if unset
+    SQLALCHEMY_ASYNC_DATABASE_URI = os.environ.get("ASYNC_DATABASE_URI")
     SQLALCHEMY_TRACK_MODIFICATIONS = False
+    # Connection pool; unset values fall back to per-dialect defaults (see app.engine_options)
+    DB_POOL_SIZE = os.environ.get("DB_POOL_SIZE")
+    DB_MAX_OVERFLOW = os.environ.get("DB_MAX_OVERFLOW")
+    DB_POOL_TIMEOUT = float(os.environ.get("DB_POOL_TIMEOUT", 30))
+    DB_POOL_RECYCLE = os.environ.get("DB_POOL_RECYCLE")
+    DB_POOL_PRE_PING = os.environ.get("DB_POOL_PRE_PING")
+    # Pragmas applied to every SQLite connection
+    SQLITE_JOURNAL_MODE = os.environ.get("SQLITE_JOURNAL_MODE", "WAL")
+    SQLITE_SYNCHRONOUS = os.environ.get("SQLITE_SYNCHRONOUS", "NORMAL")
+    SQLITE_BUSY_TIMEOUT_MS = int(os.environ.get("SQLITE_BUSY_TIMEOUT_MS", 30000))
+    SQLITE_MMAP_SIZE = int(os.environ.get("SQLITE_MMAP_SIZE", 256 * 1024 * 1024))
     JWT_ACCESS_TOKEN_EXPIRES = datetime.timedelta(days=7)
-    EXPORT_FILE = os.path.join(basedir, "config", "export.zip")
+    # Users allowed to read the server-wide counters of /api/metrics; nobody by default
+    METRICS_USERS = {
+        name.strip().lower()
+        for name in os.environ.get("METRICS_USERS", "").split(",")
+        if name.strip()
+    }
+    # How long authenticated requests may reuse a user row; 0 disables the cache
+    USER_CACHE_TTL_SECONDS = float(os.environ.get("USER_CACHE_TTL_SECONDS", 60))
     UPLOAD_FOLDER = os.path.join(basedir, "config", "uploads")
     MAX_UPLOAD_SIZE = int(
         os.environ.get("MAX_UPLOAD_SIZE", 10 * 1024 * 1024)
     )  # 10MB default
     ALLOWED_UPLOAD_EXTENSIONS = {"png", "jpg", "jpeg", "gif", "webp"}
+    # Upload names never change content, so browsers may cache them for good
+    UPLOAD_CACHE_MAX_AGE = int(os.environ.get("UPLOAD_CACHE_MAX_AGE", 365 * 24 * 3600))
+    # Internal nginx location serving UPLOAD_FOLDER; when set, file bodies are
+    # handed to the proxy with X-Accel-Redirect instead of streamed by the app
+    UPLOAD_ACCEL_REDIRECT = os.environ.get("UPLOAD_ACCEL_REDIRECT")
+    # Resized image variants (/uploads/...?w=640, needs Pillow); requested
+    # widths are rounded up to one of these so the cache stays small
+    IMAGE_VARIANT_WIDTHS = sorted(
+        int(w)
+        for w in os.environ.get(
+            "IMAGE_VARIANT_WIDTHS", "160,320,640,960,1280,1920"
+        ).split(",")
+    )
+    IMAGE_VARIANT_QUALITY = int(os.environ.get("IMAGE_VARIANT_QUALITY", 80))
+    IMAGE_VARIANT_CACHE_MB = int(os.environ.get("IMAGE_VARIANT_CACHE_MB", 512))
+    IMAGE_WORKERS = int(os.environ.get("IMAGE_WORKERS", 2))
+    # Memory budget for the decrypted search vocabularies kept per user
+    SEARCH_INDEX_CACHE_MB = int(os.environ.get("SEARCH_INDEX_CACHE_MB", 64))
+    # Background indexing of notes saved before the search index existed
+    SEARCH_INDEX_BACKFILL = (
+        os.environ.get("SEARCH_INDEX_BACKFILL", "true").lower() == "true"
+    )
+    SEARCH_INDEX_BATCH_SIZE = int(os.environ.get("SEARCH_INDEX_BATCH_SIZE", 200))
+    SEARCH_INDEX_INTERVAL_SECONDS = float(
+        os.environ.get("SEARCH_INDEX_INTERVAL_SECONDS", 1)
+    )
     DEFAULT_TIMEZONE = os.environ.get("DEFAULT_TIMEZONE", None)
+    # Worker pools that keep CPU-bound crypto off the event loop
+    CRYPTO_WORKERS = int(os.environ.get("CRYPTO_WORKERS", min(4, os.cpu_count() or 1)))
+    PASSWORD_HASH_WORKERS = int(os.environ.get("PASSWORD_HASH_WORKERS", 2))
+    PASSWORD_HASH_EXECUTOR = os.environ.get("PASSWORD_HASH_EXECUTOR", "thread")
+    # Background rewrite of legacy-format ciphertexts into the current format
+    REENCRYPT_LEGACY = os.environ.get("REENCRYPT_LEGACY", "true").lower() == "true"
+    REENCRYPT_BATCH_SIZE = int(os.environ.get("REENCRYPT_BATCH_SIZE", 100))
+    REENCRYPT_INTERVAL_SECONDS = float(os.environ.get("REENCRYPT_INTERVAL_SECONDS", 2))
+    # Background deletion of uploads no note has referenced for the grace period
+    UPLOAD_GC = os.environ.get("UPLOAD_GC", "false").lower() == "true"
+    UPLOAD_GC_GRACE_HOURS = float(os.environ.get("UPLOAD_GC_GRACE_HOURS", 24))
+    UPLOAD_GC_INTERVAL_SECONDS = float(
+        os.environ.get("UPLOAD_GC_INTERVAL_SECONDS", 3600)
+    )
+    UPLOAD_GC_BATCH_SIZE = int(os.environ.get("UPLOAD_GC_BATCH_SIZE", 200))
+    UPLOAD_GC_LOG_DAYS = int(os.environ.get("UPLOAD_GC_LOG_DAYS", 30))
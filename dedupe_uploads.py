@@ -0,0 +1,142 @@
+#!/usr/bin/env python
+"""
+Deduplicate the files already in the upload folder.
+
+Uploads are now stored under the SHA-256 of their bytes, but files uploaded
+before that have random names and may be stored many times. This hashes
+every file in UPLOAD_FOLDER/<username>/, records the hash on the matching
+upload rows so new uploads of the same bytes reuse them, and replaces
+byte-identical copies with hard links to a single file. Every existing
+/uploads/... URL keeps resolving, and deleting one of the names later only
+frees the space once no other name points at it. Safe to re-run.
+
+Usage: ./dedupe_uploads.py [--dry-run] [--across-users] [--folder PATH]
+"""
+
+import argparse
+import hashlib
+import os
+import sys
+
+from sqlalchemy import update
+
+from app import app, db
+from app.models import Upload
+
+HASH_CHUNK_SIZE = 1024 * 1024
+
+
+def hash_file(path):
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(HASH_CHUNK_SIZE), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def scan_uploads(upload_folder):
+    """Yield (user_folder, filename, path, stat) for every stored upload"""
+    for user_entry in os.scandir(upload_folder):
+        # Dot-directories hold derived files, not uploads
+        if not user_entry.is_dir() or user_entry.name.startswith("."):
+            continue
+        for entry in os.scandir(user_entry.path):
+            if entry.is_file(follow_symlinks=False) and not entry.name.endswith(
+                ".part"
+            ):
+                yield user_entry.name, entry.name, entry.path, entry.stat()
+
+
+def link_duplicate(keep, duplicate):
+    """Atomically replace duplicate with a hard link to keep"""
+    temp_path = duplicate + ".link"
+    os.link(keep, temp_path)
+    try:
+        os.replace(temp_path, duplicate)
+    except OSError:
+        os.remove(temp_path)
+        raise
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument(
+        "--dry-run", action="store_true", help="report duplicates, change nothing"
+    )
+    parser.add_argument(
+        "--across-users",
+        action="store_true",
+        help="also link identical files uploaded by different users",
+    )
+    parser.add_argument(
+        "--folder",
+        default=app.config["UPLOAD_FOLDER"],
+        help="upload folder to scan (default: %(default)s)",
+    )
+    args = parser.parse_args()
+
+    upload_folder = args.folder
+    if not os.path.isdir(upload_folder):
+        print(f"No upload folder at {upload_folder}")
+        return 0
+
+    groups = {}
+    hashes = {}
+    scanned = 0
+    for user_folder, filename, path, stat in scan_uploads(upload_folder):
+        content_hash = hash_file(path)
+        hashes[f"/uploads/{user_folder}/{filename}"] = content_hash
+        key = content_hash if args.across_users else (user_folder, content_hash)
+        groups.setdefault(key, []).append((stat.st_mtime, path, stat.st_size))
+        scanned += 1
+
+    linked = 0
+    freed = 0
+    for files in groups.values():
+        if len(files) < 2:
+            continue
+        files.sort()
+        keep = files[0][1]
+        for _, path, size in files[1:]:
+            if os.path.samefile(keep, path):
+                continue
+            linked += 1
+            freed += size
+            if args.dry_run:
+                print(f"would link {path} -> {keep}")
+                continue
+            try:
+                link_duplicate(keep, path)
+            except OSError as e:
+                linked -= 1
+                freed -= size
+                print(f"Could not link {path}: {e}", file=sys.stderr)
+
+    updated = 0
+    if not args.dry_run and hashes:
+        # Only fill in missing hashes; rows written since the switch already
+        # carry the hash their name was derived from
+        with db.engine.begin() as conn:
+            rows = conn.execute(
+                Upload.__table__.select().where(Upload.content_hash.is_(None))
+            ).all()
+            for row in rows:
+                if row.path in hashes:
+                    conn.execute(
+                        update(Upload.__table__)
+                        .where(Upload.__table__.c.uuid == row.uuid)
+                        .values(content_hash=hashes[row.path])
+                    )
+                    updated += 1
+
+    print(
+        f"{scanned} files hashed, {linked} duplicates "
+        f"{'found' if args.dry_run else 'linked'}, "
+        f"{freed / (1024 * 1024):.1f} MiB {'reclaimable' if args.dry_run else 'freed'}, "
+        f"{updated} upload rows updated"
+    )
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
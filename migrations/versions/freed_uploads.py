@@ -0,0 +1,43 @@
+"""Add freed_upload table recording uploads deleted by the upload GC
+
+Revision ID: freed_uploads_001
+Revises: upload_content_hash_001
+Create Date: 2026-10-18 00:00:00.000000
+
+"""
+
+from alembic import op
+import sqlalchemy as sa
+import app.model_types
+
+
+# revision identifiers, used by Alembic.
+revision = "freed_uploads_001"
+down_revision = "upload_content_hash_001"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table(
+        "freed_upload",
+        sa.Column("uuid", app.model_types.GUID(), nullable=False),
+        sa.Column("user_id", app.model_types.GUID(), nullable=False),
+        sa.Column("path", sa.String(length=512), nullable=False),
+        sa.Column("size", sa.Integer(), nullable=True),
+        sa.Column("last_seen_at", sa.DateTime(timezone=True), nullable=True),
+        sa.Column("freed_at", sa.DateTime(timezone=True), nullable=False),
+        sa.ForeignKeyConstraint(["user_id"], ["user.uuid"]),
+        sa.PrimaryKeyConstraint("uuid"),
+    )
+    op.create_index(
+        "ix_freed_upload_user_id_freed_at",
+        "freed_upload",
+        ["user_id", "freed_at"],
+        unique=False,
+    )
+
+
+def downgrade():
+    op.drop_index("ix_freed_upload_user_id_freed_at", table_name="freed_upload")
+    op.drop_table("freed_upload")
@@ -0,0 +1,86 @@
+"""Allow one daily note per user and day
+
+Revision ID: note_daily_unique_001
+Revises: note_upload_refs_002
+Create Date: 2026-10-18 00:00:00.000000
+
+"""
+
+import logging
+
+from alembic import op
+import sqlalchemy as sa
+import app.model_types
+
+
+# revision identifiers, used by Alembic.
+revision = "note_daily_unique_001"
+down_revision = "note_upload_refs_002"
+branch_labels = None
+depends_on = None
+
+logger = logging.getLogger("alembic.runtime.migration")
+
+DIALECTS = ("sqlite", "postgresql")
+
+
+def upgrade():
+    bind = op.get_bind()
+    if bind.dialect.name not in DIALECTS:
+        # No partial indexes; save_day's in-process lock is all there is
+        return
+
+    note = sa.table(
+        "note",
+        sa.column("uuid", app.model_types.GUID()),
+        sa.column("user_id", app.model_types.GUID()),
+        sa.column("title_index", sa.String()),
+        sa.column("is_date", sa.Boolean()),
+        sa.column("date", sa.DateTime(timezone=True)),
+    )
+
+    # Days saved twice by racing requests: the first note stays the day's
+    # note, later copies are kept as regular notes so nothing is lost
+    duplicates = bind.execute(
+        sa.select(note.c.user_id, note.c.title_index)
+        .where(note.c.is_date.is_(True), note.c.title_index.is_not(None))
+        .group_by(note.c.user_id, note.c.title_index)
+        .having(sa.func.count() > 1)
+    ).all()
+    for user_id, title_index in duplicates:
+        copies = (
+            bind.execute(
+                sa.select(note.c.uuid)
+                .where(
+                    note.c.user_id == user_id,
+                    note.c.title_index == title_index,
+                    note.c.is_date.is_(True),
+                )
+                .order_by(note.c.date, note.c.uuid)
+            )
+            .scalars()
+            .all()
+        )
+        logger.warning(
+            f"User {user_id} has {len(copies)} notes for one day; keeping "
+            f"{copies[0]} as the daily note and "
+            f"{', '.join(str(copy) for copy in copies[1:])} as regular notes"
+        )
+        bind.execute(
+            sa.update(note).where(note.c.uuid.in_(copies[1:])).values(is_date=False)
+        )
+
+    op.create_index(
+        "uq_note_user_id_title_index_daily",
+        "note",
+        ["user_id", "title_index"],
+        unique=True,
+        sqlite_where=sa.text("is_date"),
+        postgresql_where=sa.text("is_date"),
+    )
+
+
+def downgrade():
+    if op.get_bind().dialect.name not in DIALECTS:
+        return
+    op.drop_index("uq_note_user_id_title_index_daily", table_name="note")
@@ -0,0 +1,34 @@
+"""Add content and meta digests to Note table
+
+Revision ID: note_digests_001
+Revises: per_user_indexes_001
+Create Date: 2026-10-18 00:00:00.000000
+
+"""
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = "note_digests_001"
+down_revision = "per_user_indexes_001"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # Left NULL for existing notes; the next save of a note fills them in
+    with op.batch_alter_table("note", schema=None) as batch_op:
+        batch_op.add_column(
+            sa.Column("content_digest", sa.String(length=64), nullable=True)
+        )
+        batch_op.add_column(
+            sa.Column("meta_digest", sa.String(length=64), nullable=True)
+        )
+
+
+def downgrade():
+    with op.batch_alter_table("note", schema=None) as batch_op:
+        batch_op.drop_column("meta_digest")
+        batch_op.drop_column("content_digest")
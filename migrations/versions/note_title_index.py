@@ -0,0 +1,92 @@
+"""Add title_index blind index to Note table
+
+Revision ID: note_title_index_001
+Revises: f1803e0263f1
+Create Date: 2026-10-18 00:00:00.000000
+
+"""
+
+from alembic import op
+import sqlalchemy as sa
+import app.model_types
+
+
+# revision identifiers, used by Alembic.
+revision = "note_title_index_001"
+down_revision = "f1803e0263f1"
+branch_labels = None
+depends_on = None
+
+BATCH_SIZE = 500
+
+
+def upgrade():
+    with op.batch_alter_table("note", schema=None) as batch_op:
+        batch_op.add_column(
+            sa.Column("title_index", sa.String(length=64), nullable=True)
+        )
+        batch_op.create_index(
+            "ix_note_user_id_title_index", ["user_id", "title_index"], unique=False
+        )
+
+    # Backfill the index and move titles from the deterministic CFB/ECB
+    # encryption to the randomized current format
+    from app.models import aes_decrypt, aes_encrypt, make_title_index
+
+    note = sa.table(
+        "note",
+        sa.column("uuid", app.model_types.GUID()),
+        sa.column("user_id", app.model_types.GUID()),
+        sa.column("title", sa.LargeBinary()),
+        sa.column("title_index", sa.String()),
+    )
+
+    bind = op.get_bind()
+    after = None
+    while True:
+        query = sa.select(note.c.uuid, note.c.user_id, note.c.title)
+        if after is not None:
+            query = query.where(note.c.uuid > after)
+        rows = bind.execute(query.order_by(note.c.uuid).limit(BATCH_SIZE)).all()
+        if not rows:
+            break
+
+        for row in rows:
+            title = aes_decrypt(row.title)
+            if not isinstance(title, str):
+                continue
+            bind.execute(
+                sa.update(note)
+                .where(note.c.uuid == row.uuid)
+                .values(
+                    title=aes_encrypt(title),
+                    title_index=make_title_index(row.user_id, title),
+                )
+            )
+
+        after = rows[-1].uuid
+
+
+def downgrade():
+    # Restore the deterministic titles older versions look notes up by
+    from app.models import aes_decrypt, aes_encrypt_legacy_cfb
+
+    note = sa.table(
+        "note",
+        sa.column("uuid", app.model_types.GUID()),
+        sa.column("title", sa.LargeBinary()),
+    )
+
+    bind = op.get_bind()
+    for row in bind.execute(sa.select(note.c.uuid, note.c.title)).all():
+        title = aes_decrypt(row.title)
+        if isinstance(title, str):
+            bind.execute(
+                sa.update(note)
+                .where(note.c.uuid == row.uuid)
+                .values(title=aes_encrypt_legacy_cfb(title))
+            )
+
+    with op.batch_alter_table("note", schema=None) as batch_op:
+        batch_op.drop_index("ix_note_user_id_title_index")
+        batch_op.drop_column("title_index")
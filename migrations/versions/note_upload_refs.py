@@ -0,0 +1,105 @@
+"""Add note_upload_ref table indexing upload paths referenced by notes
+
+Revision ID: note_upload_refs_001
+Revises: note_digests_001
+Create Date: 2026-10-18 00:00:00.000000
+
+"""
+
+from alembic import op
+import sqlalchemy as sa
+import app.model_types
+
+
+# revision identifiers, used by Alembic.
+revision = "note_upload_refs_001"
+down_revision = "note_digests_001"
+branch_labels = None
+depends_on = None
+
+BATCH_SIZE = 500
+
+
+def upgrade():
+    bind = op.get_bind()
+
+    # The upload table used to be created on first upload; the note hooks now
+    # update it on every save, so make sure it exists
+    if "upload" not in sa.inspect(bind).get_table_names():
+        op.create_table(
+            "upload",
+            sa.Column("uuid", app.model_types.GUID(), nullable=False),
+            sa.Column("user_id", app.model_types.GUID(), nullable=False),
+            sa.Column("filename", sa.String(length=255), nullable=False),
+            sa.Column("path", sa.String(length=512), nullable=False),
+            sa.Column("size", sa.Integer(), nullable=True),
+            sa.Column(
+                "created_at",
+                sa.DateTime(timezone=True),
+                server_default=sa.func.now(),
+                nullable=True,
+            ),
+            sa.Column("last_seen_at", sa.DateTime(timezone=True), nullable=True),
+            sa.ForeignKeyConstraint(["user_id"], ["user.uuid"]),
+            sa.PrimaryKeyConstraint("uuid"),
+            sa.UniqueConstraint("path"),
+        )
+        op.create_index("ix_upload_uuid", "upload", ["uuid"], unique=True)
+
+    op.create_table(
+        "note_upload_ref",
+        sa.Column("note_id", app.model_types.GUID(), nullable=False),
+        sa.Column("path", sa.String(length=512), nullable=False),
+        sa.Column("user_id", app.model_types.GUID(), nullable=False),
+        sa.ForeignKeyConstraint(["note_id"], ["note.uuid"]),
+        sa.ForeignKeyConstraint(["user_id"], ["user.uuid"]),
+        sa.PrimaryKeyConstraint("note_id", "path"),
+    )
+    op.create_index(
+        "ix_note_upload_ref_user_id_path",
+        "note_upload_ref",
+        ["user_id", "path"],
+        unique=False,
+    )
+
+    # Backfill from the existing notes
+    from app.models import aes_decrypt, extract_upload_paths
+
+    note = sa.table(
+        "note",
+        sa.column("uuid", app.model_types.GUID()),
+        sa.column("user_id", app.model_types.GUID()),
+        sa.column("data", sa.LargeBinary()),
+    )
+    ref = sa.table(
+        "note_upload_ref",
+        sa.column("note_id", app.model_types.GUID()),
+        sa.column("path", sa.String()),
+        sa.column("user_id", app.model_types.GUID()),
+    )
+
+    after = None
+    while True:
+        query = sa.select(note.c.uuid, note.c.user_id, note.c.data)
+        if after is not None:
+            query = query.where(note.c.uuid > after)
+        rows = bind.execute(query.order_by(note.c.uuid).limit(BATCH_SIZE)).all()
+        if not rows:
+            break
+
+        refs = []
+        for row in rows:
+            text = aes_decrypt(row.data) if row.data is not None else None
+            if not isinstance(text, str):
+                continue
+            for path in extract_upload_paths(text):
+                refs.append({"note_id": row.uuid, "path": path, "user_id": row.user_id})
+        if refs:
+            bind.execute(sa.insert(ref), refs)
+
+        after = rows[-1].uuid
+
+
+def downgrade():
+    op.drop_index("ix_note_upload_ref_user_id_path", table_name="note_upload_ref")
+    op.drop_table("note_upload_ref")
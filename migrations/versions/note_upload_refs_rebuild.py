@@ -0,0 +1,96 @@
+"""Rebuild note_upload_ref from clean paths, flag notes whose refs are known
+
+Revision ID: note_upload_refs_002
+Revises: search_rank_001
+Create Date: 2026-10-18 00:00:00.000000
+
+"""
+
+import logging
+
+from alembic import op
+import sqlalchemy as sa
+import app.model_types
+
+
+# revision identifiers, used by Alembic.
+revision = "note_upload_refs_002"
+down_revision = "search_rank_001"
+branch_labels = None
+depends_on = None
+
+BATCH_SIZE = 500
+
+logger = logging.getLogger("alembic.runtime.migration")
+
+
+def upgrade():
+    with op.batch_alter_table("note", schema=None) as batch_op:
+        batch_op.add_column(
+            sa.Column("upload_refs_indexed", sa.Boolean(), nullable=True)
+        )
+        batch_op.create_index(
+            "ix_note_user_id_upload_refs_indexed",
+            ["user_id", "upload_refs_indexed"],
+            unique=False,
+        )
+
+    # Refs extracted so far kept whatever followed the path
+    # (/uploads/bob/a.png?w=640, /uploads/bob/a.png">), so no upload matched them
+    from app.models import aes_decrypt, extract_upload_paths
+
+    bind = op.get_bind()
+    note = sa.table(
+        "note",
+        sa.column("uuid", app.model_types.GUID()),
+        sa.column("user_id", app.model_types.GUID()),
+        sa.column("data", sa.LargeBinary()),
+        sa.column("upload_refs_indexed", sa.Boolean()),
+    )
+    ref = sa.table(
+        "note_upload_ref",
+        sa.column("note_id", app.model_types.GUID()),
+        sa.column("path", sa.String()),
+        sa.column("user_id", app.model_types.GUID()),
+    )
+    bind.execute(sa.delete(ref))
+
+    after = None
+    while True:
+        query = sa.select(note.c.uuid, note.c.user_id, note.c.data)
+        if after is not None:
+            query = query.where(note.c.uuid > after)
+        rows = bind.execute(query.order_by(note.c.uuid).limit(BATCH_SIZE)).all()
+        if not rows:
+            break
+
+        refs = []
+        indexed = []
+        for row in rows:
+            text = aes_decrypt(row.data) if row.data is not None else ""
+            if not isinstance(text, str):
+                # Left NULL: the GC keeps every upload of this user
+                logger.warning(
+                    f"Note {row.uuid} could not be decrypted; uploads of user "
+                    f"{row.user_id} are excluded from orphan collection"
+                )
+                continue
+            indexed.append(row.uuid)
+            for path in extract_upload_paths(text):
+                refs.append({"note_id": row.uuid, "path": path, "user_id": row.user_id})
+        if refs:
+            bind.execute(sa.insert(ref), refs)
+        if indexed:
+            bind.execute(
+                sa.update(note)
+                .where(note.c.uuid.in_(indexed))
+                .values(upload_refs_indexed=True)
+            )
+
+        after = rows[-1].uuid
+
+
+def downgrade():
+    with op.batch_alter_table("note", schema=None) as batch_op:
+        batch_op.drop_index("ix_note_user_id_upload_refs_indexed")
+        batch_op.drop_column("upload_refs_indexed")
@@ -0,0 +1,39 @@
+"""Add composite indexes for per-user note and meta lookups
+
+Revision ID: per_user_indexes_001
+Revises: note_title_index_001
+Create Date: 2026-10-18 00:00:00.000000
+
+"""
+
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision = "per_user_indexes_001"
+down_revision = "note_title_index_001"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # Daily notes vs. regular notes (calendar, sidebar, ICS feed)
+    with op.batch_alter_table("note", schema=None) as batch_op:
+        batch_op.create_index(
+            "ix_note_user_id_is_date", ["user_id", "is_date"], unique=False
+        )
+
+    # Tags/projects/tasks of a user (sidebar, search) and of a single note
+    # (note hooks, search results); note_id first also serves plain note_id lookups
+    with op.batch_alter_table("meta", schema=None) as batch_op:
+        batch_op.create_index("ix_meta_user_id_kind", ["user_id", "kind"], unique=False)
+        batch_op.create_index("ix_meta_note_id_kind", ["note_id", "kind"], unique=False)
+
+
+def downgrade():
+    with op.batch_alter_table("meta", schema=None) as batch_op:
+        batch_op.drop_index("ix_meta_note_id_kind")
+        batch_op.drop_index("ix_meta_user_id_kind")
+
+    with op.batch_alter_table("note", schema=None) as batch_op:
+        batch_op.drop_index("ix_note_user_id_is_date")
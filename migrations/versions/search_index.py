@@ -0,0 +1,65 @@
+"""Add note_token and search_term tables indexing the words of notes
+
+Revision ID: search_index_001
+Revises: freed_uploads_001
+Create Date: 2026-10-18 00:00:00.000000
+
+"""
+
+from alembic import op
+import sqlalchemy as sa
+import app.model_types
+
+
+# revision identifiers, used by Alembic.
+revision = "search_index_001"
+down_revision = "freed_uploads_001"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table(
+        "note_token",
+        sa.Column("note_id", app.model_types.GUID(), nullable=False),
+        sa.Column("token", sa.String(length=32), nullable=False),
+        sa.Column("user_id", app.model_types.GUID(), nullable=False),
+        sa.ForeignKeyConstraint(["note_id"], ["note.uuid"]),
+        sa.ForeignKeyConstraint(["user_id"], ["user.uuid"]),
+        sa.PrimaryKeyConstraint("note_id", "token"),
+    )
+    op.create_index(
+        "ix_note_token_user_id_token",
+        "note_token",
+        ["user_id", "token"],
+        unique=False,
+    )
+    op.create_table(
+        "search_term",
+        sa.Column("user_id", app.model_types.GUID(), nullable=False),
+        sa.Column("token", sa.String(length=32), nullable=False),
+        sa.Column("word", sa.LargeBinary(), nullable=False),
+        sa.ForeignKeyConstraint(["user_id"], ["user.uuid"]),
+        sa.PrimaryKeyConstraint("user_id", "token"),
+    )
+
+    # Left NULL for existing notes; the backfill job (SEARCH_INDEX_BACKFILL)
+    # or ./rebuild_search_index.py indexes them, and searches check them
+    # directly until then
+    with op.batch_alter_table("note", schema=None) as batch_op:
+        batch_op.add_column(sa.Column("tokens_indexed", sa.Boolean(), nullable=True))
+        batch_op.create_index(
+            "ix_note_user_id_tokens_indexed",
+            ["user_id", "tokens_indexed"],
+            unique=False,
+        )
+
+
+def downgrade():
+    with op.batch_alter_table("note", schema=None) as batch_op:
+        batch_op.drop_index("ix_note_user_id_tokens_indexed")
+        batch_op.drop_column("tokens_indexed")
+
+    op.drop_table("search_term")
+    op.drop_index("ix_note_token_user_id_token", table_name="note_token")
+    op.drop_table("note_token")
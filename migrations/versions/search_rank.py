@@ -0,0 +1,39 @@
+"""Add word counts to note_token and note for ranking search hits
+
+Revision ID: search_rank_001
+Revises: search_index_001
+Create Date: 2026-10-18 00:00:00.000000
+
+"""
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = "search_rank_001"
+down_revision = "search_index_001"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table("note_token", schema=None) as batch_op:
+        batch_op.add_column(
+            sa.Column("count", sa.Integer(), nullable=False, server_default="1")
+        )
+
+    with op.batch_alter_table("note", schema=None) as batch_op:
+        batch_op.add_column(sa.Column("word_count", sa.Integer(), nullable=True))
+
+    # Tokens indexed so far have no counts; the backfill job (or
+    # ./rebuild_search_index.py) indexes the notes again
+    op.execute("UPDATE note SET tokens_indexed = NULL")
+
+
+def downgrade():
+    with op.batch_alter_table("note", schema=None) as batch_op:
+        batch_op.drop_column("word_count")
+
+    with op.batch_alter_table("note_token", schema=None) as batch_op:
+        batch_op.drop_column("count")
@@ -0,0 +1,34 @@
+"""Add content_hash to upload for content-addressed storage
+
+Revision ID: upload_content_hash_001
+Revises: note_upload_refs_001
+Create Date: 2026-10-18 00:00:00.000000
+
+"""
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = "upload_content_hash_001"
+down_revision = "note_upload_refs_001"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # Existing uploads keep a NULL hash until dedupe_uploads.py has hashed them
+    with op.batch_alter_table("upload", schema=None) as batch_op:
+        batch_op.add_column(
+            sa.Column("content_hash", sa.String(length=64), nullable=True)
+        )
+        batch_op.create_index(
+            "ix_upload_user_id_content_hash", ["user_id", "content_hash"], unique=False
+        )
+
+
+def downgrade():
+    with op.batch_alter_table("upload", schema=None) as batch_op:
+        batch_op.drop_index("ix_upload_user_id_content_hash")
+        batch_op.drop_column("content_hash")
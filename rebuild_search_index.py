@@ -0,0 +1,51 @@
+#!/usr/bin/env python
+"""
+Write the search index (note_token and search_term rows) for existing notes.
+
+Notes saved since the index was added are indexed as they are saved, and
+the server indexes older notes in the background (SEARCH_INDEX_BACKFILL).
+This does the same in the foreground. With --all, every note is indexed
+again, e.g. after restoring the note table from a backup; searches stay
+correct meanwhile, only slower for the notes not yet done.
+
+Usage: ./rebuild_search_index.py [--all] [--batch-size N]
+"""
+
+import argparse
+import sys
+
+from sqlalchemy import update
+
+from app import db
+from app.jobs import index_notes_batch
+from app.models import Note
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument(
+        "--all", action="store_true", help="re-index every note, not just new ones"
+    )
+    parser.add_argument(
+        "--batch-size",
+        type=int,
+        default=500,
+        help="notes per transaction (default: %(default)s)",
+    )
+    args = parser.parse_args()
+
+    if args.all:
+        with db.engine.begin() as conn:
+            conn.execute(update(Note.__table__).values(tokens_indexed=None))
+
+    total = 0
+    more = True
+    while more:
+        indexed, _, more = index_notes_batch(args.batch_size)
+        total += indexed
+        print(f"{total} notes indexed", end="\r" if more else "\n")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
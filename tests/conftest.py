@@ -0,0 +1,138 @@
+"""
+Shared setup for the backend tests. The app reads its configuration when it
+is imported, so the environment is set up here first: a throwaway SQLite
+database built with `alembic upgrade head` (or TEST_DATABASE_URI pointing at
+a scratch database) and a temporary upload folder.
+"""
+
+import asyncio
+import io
+import itertools
+import os
+import sys
+import tempfile
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+_tmpdir = tempfile.mkdtemp()
+os.environ["API_SECRET_KEY"] = "test-secret"
+os.environ["DB_ENCRYPTION_KEY"] = "0123456789abcdef0123456789abcdef"
+os.environ["DATABASE_URI"] = os.environ.get(
+    "TEST_DATABASE_URI", "sqlite:///" + os.path.join(_tmpdir, "test.db")
+)
+os.environ["SEARCH_INDEX_BACKFILL"] = "false"
+
+from alembic import command  # noqa: E402
+from alembic.config import Config as AlembicConfig  # noqa: E402
+from quart.datastructures import FileStorage  # noqa: E402
+from sqlalchemy import event  # noqa: E402
+
+from app import app, db  # noqa: E402
+from app.models import User  # noqa: E402
+
+_usernames = itertools.count()
+
+
+@pytest.fixture(scope="session", autouse=True)
+def database():
+    alembic_config = AlembicConfig(os.path.join(ROOT, "migrations", "alembic.ini"))
+    alembic_config.set_main_option("script_location", os.path.join(ROOT, "migrations"))
+    command.upgrade(alembic_config, "head")
+    app.config["UPLOAD_FOLDER"] = os.path.join(_tmpdir, "uploads")
+    yield db
+    db.session.remove()
+
+
+@pytest.fixture(scope="session")
+def run():
+    """Run a coroutine on one loop shared by the session, like the server does"""
+    loop = asyncio.new_event_loop()
+    yield loop.run_until_complete
+    loop.close()
+
+
+@pytest.fixture
+def client():
+    return app.test_client()
+
+
+@pytest.fixture
+def sign_up(client, run):
+    """Create a user; returns (user uuid, auth headers)"""
+
+    def sign_up():
+        username = f"user{next(_usernames)}"
+
+        async def request():
+            response = await client.post(
+                "/api/sign-up", json={"username": username, "password": "password"}
+            )
+            return (await response.get_json())["access_token"]
+
+        token = run(request())
+        user_id = db.session.query(User.uuid).filter_by(username=username).scalar()
+        db.session.remove()
+        return user_id, {"Authorization": "Bearer " + token}
+
+    return sign_up
+
+
+@pytest.fixture
+def uploader(client, run, sign_up):
+    """Create a user; returns (user uuid, auth headers, upload(), create_note(data))"""
+
+    def uploader():
+        user_id, headers = sign_up()
+
+        def upload(data=None):
+            if data is None:
+                data = b"\x89PNG" + os.urandom(64)
+
+            async def request():
+                response = await client.post(
+                    "/api/upload",
+                    files={
+                        "file": FileStorage(
+                            io.BytesIO(data),
+                            filename="photo.png",
+                            content_type="image/png",
+                        )
+                    },
+                    headers=headers,
+                )
+                assert response.status_code == 200
+                return (await response.get_json())["path"]
+
+            return run(request())
+
+        def create_note(data):
+            async def request():
+                response = await client.post(
+                    "/api/create_note", json={"data": data}, headers=headers
+                )
+                assert response.status_code == 200
+
+            run(request())
+
+        return user_id, headers, upload, create_note
+
+    return uploader
+
+
+@pytest.fixture
+def statements():
+    """SQL statements sent to the database while the test runs"""
+    executed = []
+
+    def record(conn, cursor, statement, parameters, context, executemany):
+        executed.append(statement)
+
+    engines = (db.engine, db.async_engine.sync_engine)
+    for engine in engines:
+        event.listen(engine, "before_cursor_execute", record)
+    yield executed
+    for engine in engines:
+        event.remove(engine, "before_cursor_execute", record)
@@ -0,0 +1,121 @@
+"""
+Overlapping saves must all land, and autosaves racing on a daily note that
+doesn't exist yet must create it once: within a process through
+_get_day_note_lock, across processes through the unique index on daily notes.
+"""
+
+import asyncio
+
+from app import db, routes
+from app.models import Note
+
+
+async def _gather(requests):
+    return await asyncio.gather(*requests)
+
+
+async def _request(client, method, path, headers, **kwargs):
+    response = await getattr(client, method)(path, headers=headers, **kwargs)
+    assert response.status_code == 200, await response.get_data()
+    return await response.get_json()
+
+
+def _save_day_concurrently(client, run, sign_up, count):
+    user_id, headers = sign_up()
+    bodies = [f"autosave {i}" for i in range(count)]
+
+    run(
+        _gather(
+            _request(
+                client,
+                "put",
+                "/api/save_day",
+                headers,
+                json={"title": "03-14-2024", "data": body},
+            )
+            for body in bodies
+        )
+    )
+
+    notes = db.session.query(Note).filter_by(user_id=user_id, is_date=True).all()
+    assert len(notes) == 1
+    assert notes[0].text in bodies
+    db.session.remove()
+
+
+def test_concurrent_saves_of_a_new_day_create_one_note(client, run, sign_up):
+    _save_day_concurrently(client, run, sign_up, 300)
+
+
+def test_saves_of_a_new_day_from_other_processes_create_one_note(
+    client, run, sign_up, monkeypatch
+):
+    # As if every request were served by a different process: nothing shared
+    monkeypatch.setattr(routes, "_get_day_note_lock", lambda *_: asyncio.Lock())
+    _save_day_concurrently(client, run, sign_up, 100)
+
+
+def test_overlapping_saves_all_land(client, run, sign_up):
+    user_id, headers = sign_up()
+
+    seeded = []
+    for i in range(8):
+        data = f"---\ntags: seed\n---\n# Seed {i}\n- [ ] seed task {i}"
+        note = run(
+            _request(client, "post", "/api/create_note", headers, json={"data": data})
+        )
+        seeded.append(note["note"]["uuid"])
+    tasks = [
+        task["uuid"]
+        for task in run(_request(client, "get", "/api/sidebar", headers))["tasks"]
+    ]
+
+    expected_bodies = {}
+
+    def make_request(i):
+        kind = i % 4
+        if kind == 0:
+            return _request(
+                client,
+                "post",
+                "/api/create_note",
+                headers,
+                json={"data": f"# Created {i}\nbody {i}"},
+            )
+        if kind == 1:
+            note_uuid = seeded[i % len(seeded)]
+            body = f"---\ntags: seed, t{i}\n---\n# Seed {i % len(seeded)}\nsaved {i}"
+            expected_bodies.setdefault(note_uuid, set()).add(body)
+            return _request(
+                client,
+                "put",
+                "/api/save_note",
+                headers,
+                json={"uuid": note_uuid, "data": body},
+            )
+        if kind == 2:
+            return _request(
+                client,
+                "put",
+                "/api/save_day",
+                headers,
+                json={"title": f"01-{(i % 7) + 1:02d}-2024", "data": f"day {i}"},
+            )
+        return _request(
+            client,
+            "put",
+            "/api/task_column",
+            headers,
+            json={"uuid": tasks[i % len(tasks)], "column": f"col{i % 3}"},
+        )
+
+    request_count = 600
+    run(_gather(make_request(i) for i in range(request_count)))
+
+    db.session.remove()
+    notes = db.session.query(Note).filter_by(user_id=user_id)
+    assert notes.filter_by(is_date=False).count() == len(seeded) + request_count // 4
+    assert notes.filter_by(is_date=True).count() == 7
+    for note_uuid, bodies in expected_bodies.items():
+        assert db.session.get(Note, note_uuid).text in bodies
+    db.session.remove()
@@ -0,0 +1,30 @@
+"""
+The export archive holds the user's notes and, with ?uploads=1, the files of
+their own uploads that the notes embed.
+"""
+
+import io
+import zipfile
+
+
+def _export(client, run, headers):
+    async def request():
+        response = await client.get("/api/export?uploads=1", headers=headers)
+        assert response.status_code == 200
+        return await response.get_data()
+
+    return zipfile.ZipFile(io.BytesIO(run(request())))
+
+
+def test_export_includes_own_uploads_only(client, run, uploader):
+    _, _, alice_upload, _ = uploader()
+    theirs = alice_upload()
+
+    _, headers, upload, create_note = uploader()
+    mine = upload()
+    create_note(f"# Mine\n\n![photo]({mine})\n\n![theirs]({theirs})")
+
+    names = _export(client, run, headers).namelist()
+    assert "Mine.md" in names
+    assert "uploads/" + mine.replace("/uploads/", "", 1) in names
+    assert "uploads/" + theirs.replace("/uploads/", "", 1) not in names
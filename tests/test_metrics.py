@@ -0,0 +1,29 @@
+"""
+/api/metrics reports counters for the whole server, so only the users named
+in METRICS_USERS may read it.
+"""
+
+from app import app, db
+from app.models import User
+
+
+def _get_metrics(client, run, headers):
+    async def request():
+        response = await client.get("/api/metrics", headers=headers)
+        return response.status_code, await response.get_json()
+
+    return run(request())
+
+
+def test_metrics_are_restricted(client, run, sign_up, monkeypatch):
+    user_id, headers = sign_up()
+    username = db.session.get(User, user_id).username
+    db.session.remove()
+
+    status, _ = _get_metrics(client, run, headers)
+    assert status == 403
+
+    monkeypatch.setitem(app.config, "METRICS_USERS", {username.lower()})
+    status, body = _get_metrics(client, run, headers)
+    assert status == 200
+    assert "executors" in body and "upload_gc" in body
@@ -0,0 +1,157 @@
+"""
+The per-user queries the routes run must be answered from an index. Each
+query's plan (EXPLAIN QUERY PLAN on SQLite, EXPLAIN (FORMAT JSON) on
+PostgreSQL) is checked against the schema built by the migrations, with a
+few users worth of rows loaded in a transaction that is rolled back.
+"""
+
+import json
+import uuid
+
+import pytest
+from sqlalchemy import select, text
+from sqlalchemy.ext.compiler import compiles
+from sqlalchemy.sql.expression import ClauseElement, Executable
+
+from app import db
+from app.models import User, Note, Meta, make_title_index
+
+USERS = 20
+NOTES_PER_USER = 50
+
+
+class Explain(Executable, ClauseElement):
+    """EXPLAIN for an arbitrary select, with its bound parameters processed"""
+
+    inherit_cache = False
+
+    def __init__(self, statement):
+        self.statement = statement
+
+
+@compiles(Explain, "sqlite")
+def _explain_sqlite(element, compiler, **kw):
+    return "EXPLAIN QUERY PLAN " + compiler.process(element.statement, **kw)
+
+
+@compiles(Explain, "postgresql")
+def _explain_postgresql(element, compiler, **kw):
+    return "EXPLAIN (FORMAT JSON) " + compiler.process(element.statement, **kw)
+
+
+def _populate(conn):
+    users = [
+        {"uuid": uuid.uuid4(), "username": f"plans{i}", "password_hash": "x"}
+        for i in range(USERS)
+    ]
+    notes = []
+    metas = []
+    for user in users:
+        for i in range(NOTES_PER_USER):
+            note_id = uuid.uuid4()
+            notes.append(
+                {
+                    "uuid": note_id,
+                    "user_id": user["uuid"],
+                    "title": b"x",
+                    "title_index": make_title_index(user["uuid"], f"Note {i}"),
+                    "is_date": i % 2 == 0,
+                }
+            )
+            for kind in ("tag", "project", "task"):
+                metas.append(
+                    {
+                        "uuid": uuid.uuid4(),
+                        "user_id": user["uuid"],
+                        "note_id": note_id,
+                        "name": b"x",
+                        "kind": kind,
+                    }
+                )
+    conn.execute(User.__table__.insert(), users)
+    conn.execute(Note.__table__.insert(), notes)
+    conn.execute(Meta.__table__.insert(), metas)
+    conn.execute(text("ANALYZE"))
+    return users[0]["uuid"], notes[0]["uuid"]
+
+
+def _plan_indexes(conn, statement):
+    """Names of the indexes the plan for statement uses, and the plan"""
+    rows = conn.execute(Explain(statement)).all()
+
+    if conn.dialect.name == "sqlite":
+        # detail looks like "SEARCH note USING INDEX ix_note_user_id_is_date (...)"
+        details = [row[-1] for row in rows]
+        return {
+            detail.split(" INDEX ", 1)[1].split(" ")[0]
+            for detail in details
+            if " INDEX " in detail
+        }, details
+
+    plan = rows[0][0]
+    if isinstance(plan, str):
+        plan = json.loads(plan)
+    found = set()
+    pending = [plan[0]["Plan"]]
+    while pending:
+        node = pending.pop()
+        if "Index Name" in node:
+            found.add(node["Index Name"])
+        pending.extend(node.get("Plans", []))
+    return found, plan
+
+
+@pytest.fixture(scope="module")
+def populated():
+    with db.engine.connect() as conn:
+        transaction = conn.begin()
+        user_id, note_id = _populate(conn)
+        if conn.dialect.name == "postgresql":
+            # Tables this small would otherwise be scanned whatever the indexes
+            conn.execute(text("SET LOCAL enable_seqscan = off"))
+        yield conn, user_id, note_id
+        transaction.rollback()
+
+
+CHECKS = {
+    "daily notes of a user": (
+        lambda user_id, note_id: select(Note.title).filter_by(
+            user_id=user_id, is_date=True
+        ),
+        "ix_note_user_id_is_date",
+    ),
+    "regular notes of a user": (
+        lambda user_id, note_id: select(Note).filter_by(user_id=user_id, is_date=False),
+        "ix_note_user_id_is_date",
+    ),
+    "note by title": (
+        lambda user_id, note_id: select(Note).filter_by(
+            user_id=user_id, title_index=make_title_index(user_id, "Note 1")
+        ),
+        "ix_note_user_id_title_index",
+    ),
+    "tags of a user": (
+        lambda user_id, note_id: select(Meta.name_encrypted).filter_by(
+            user_id=user_id, kind="tag"
+        ),
+        "ix_meta_user_id_kind",
+    ),
+    "meta of a note": (
+        lambda user_id, note_id: select(Meta).filter_by(note_id=note_id),
+        "ix_meta_note_id_kind",
+    ),
+    "tags of a note": (
+        lambda user_id, note_id: select(Meta.name_encrypted).filter_by(
+            note_id=note_id, kind="tag"
+        ),
+        "ix_meta_note_id_kind",
+    ),
+}
+
+
+@pytest.mark.parametrize("label", CHECKS)
+def test_query_uses_index(populated, label):
+    conn, user_id, note_id = populated
+    statement, expected = CHECKS[label]
+    indexes, plan = _plan_indexes(conn, statement(user_id, note_id))
+    assert expected in indexes, f"expected {expected}, plan: {plan}"
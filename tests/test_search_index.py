@@ -0,0 +1,78 @@
+"""
+Searches answered from a cached vocabulary must find notes whose words
+another process (./rebuild_search_index.py, another server worker) indexed
+after the vocabulary was loaded.
+"""
+
+import uuid
+
+from sqlalchemy import select, update
+
+from app import db
+from app.jobs import index_notes_batch
+from app.models import Note, aes_encrypt, make_title_index
+
+
+def _search(client, run, headers, query):
+    async def request():
+        response = await client.post(
+            "/api/search", json={"query": query}, headers=headers
+        )
+        assert response.status_code == 200
+        return [hit["title"] for hit in (await response.get_json())["notes"]]
+
+    return run(request())
+
+
+def test_search_finds_notes_indexed_by_another_process(client, run, uploader):
+    user_id, headers, _, create_note = uploader()
+    create_note("# Harbour\n\nthe harbour at dawn")
+    assert _search(client, run, headers, "harbour") == ["Harbour"]
+
+    # As ./rebuild_search_index.py does it: notes written without the flush
+    # hooks, then indexed outside the server's session
+    with db.engine.begin() as conn:
+        for title, body in (
+            ("Zeppelin", "a zeppelin over the bay"),
+            ("Harbourmaster", "the harbourmaster waved"),
+        ):
+            conn.execute(
+                Note.__table__.insert(),
+                {
+                    "uuid": uuid.uuid4(),
+                    "user_id": user_id,
+                    "data": aes_encrypt(f"# {title}\n\n{body}"),
+                    "title": aes_encrypt(title),
+                    "is_date": False,
+                },
+            )
+    while index_notes_batch(500)[2]:
+        pass
+
+    assert _search(client, run, headers, "zeppelin") == ["Zeppelin"]
+    assert sorted(_search(client, run, headers, "harbour")) == [
+        "Harbour",
+        "Harbourmaster",
+    ]
+
+
+def test_search_skips_notes_that_cannot_be_decoded(client, run, uploader):
+    user_id, headers, _, create_note = uploader()
+    create_note("# Intact\n\nthe lighthouse keeper")
+    create_note("# Corrupt\n\nthe lighthouse lamp")
+
+    # A v3 body whose authentication tag no longer matches, not indexed yet so
+    # the search has to read it
+    notes = Note.__table__
+    corrupt = (notes.c.user_id == user_id) & (
+        notes.c.title_index == make_title_index(user_id, "Corrupt")
+    )
+    with db.engine.begin() as conn:
+        data = conn.execute(select(notes.c.data).where(corrupt)).scalar()
+        conn.execute(
+            update(notes)
+            .where(corrupt)
+            .values(data=data[:-1] + bytes([data[-1] ^ 1]), tokens_indexed=None)
+        )
+
+    assert _search(client, run, headers, "lighthouse") == ["Intact"]
@@ -0,0 +1,58 @@
+"""
+A page of /api/search results is loaded with a fixed number of queries: the
+titles, tags and projects of the hits are read in bulk, so asking for more
+hits must not send more statements to the database.
+"""
+
+import pytest
+
+NOTES = 60
+
+
+@pytest.fixture
+def headers(client, run, sign_up):
+    _, headers = sign_up()
+
+    async def create(i):
+        response = await client.post(
+            "/api/create_note",
+            json={
+                "data": f"---\ntags: shared, tag{i % 7}\nprojects: project{i % 3}\n---\n\n"
+                f"# Note {i}\n\nharbour lighthouse {'lighthouse ' * (i % 5)}",
+            },
+            headers=headers,
+        )
+        assert response.status_code == 200
+
+    for i in range(NOTES):
+        run(create(i))
+    return headers
+
+
+def _search(client, run, headers, query, limit):
+    async def request():
+        response = await client.post(
+            "/api/search", json={"query": query, "limit": limit}, headers=headers
+        )
+        assert response.status_code == 200
+        return (await response.get_json())["notes"]
+
+    return run(request())
+
+
+@pytest.mark.parametrize("query", ["lighthouse", "tag:shared", "tag:shared harbour"])
+def test_search_statements_do_not_grow_with_the_page(
+    client, run, headers, statements, query
+):
+    # Warm the vocabulary and label caches so both pages run the same way
+    _search(client, run, headers, query, 1)
+
+    counts = {}
+    for limit in (5, 50):
+        statements.clear()
+        hits = _search(client, run, headers, query, limit)
+        assert len(hits) == limit
+        assert all("shared" in hit["tags"] and hit["projects"] for hit in hits)
+        counts[limit] = len(statements)
+
+    assert counts[5] == counts[50], statements
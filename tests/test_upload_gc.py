@@ -0,0 +1,105 @@
+"""
+The upload garbage collector must only free uploads no note displays, however
+the note embeds them.
+"""
+
+import datetime
+import os
+
+import pytest
+from sqlalchemy import delete, update
+
+from app import app, db
+from app.jobs import collect_orphan_uploads
+from app.models import Note, NoteUploadRef, Upload, extract_upload_paths
+
+
+@pytest.mark.parametrize(
+    "text",
+    [
+        "![photo](/uploads/bob/abc.png)",
+        "![photo](/uploads/bob/abc.png?w=640)",
+        "![photo](/uploads/bob/abc.png#top)",
+        '<img src="/uploads/bob/abc.png">',
+        "<img src='/uploads/bob/abc.png?w=320'/>",
+        "see /uploads/bob/abc.png, then",
+        "see /uploads/bob/abc.png.",
+        "[/uploads/bob/abc.png]",
+        "<https://notes.example.com/uploads/bob/abc.png>",
+        "![photo](/uploads/bob/ab%63.png)",
+    ],
+)
+def test_extract_upload_paths(text):
+    assert extract_upload_paths(text) == {"/uploads/bob/abc.png"}
+
+
+def _collect(user_id):
+    """Run the collector as if every upload had been unreferenced for days"""
+    with db.engine.begin() as conn:
+        conn.execute(
+            update(Upload.__table__)
+            .where(Upload.__table__.c.user_id == user_id)
+            .values(
+                last_seen_at=datetime.datetime.utcnow() - datetime.timedelta(days=2)
+            )
+        )
+    freed = collect_orphan_uploads(user_id, datetime.datetime.utcnow(), None)
+    return {entry["path"] for entry in freed}
+
+
+def _exists(path):
+    return os.path.exists(
+        os.path.join(app.config["UPLOAD_FOLDER"], path.replace("/uploads/", "", 1))
+    )
+
+
+def test_embedded_uploads_survive_collection(uploader):
+    user_id, _, upload, create_note = uploader()
+    variant, img, bare, orphan = upload(), upload(), upload(), upload()
+
+    create_note(f"# Variant\n\n![photo]({variant}?w=640)")
+    create_note(f'# Html\n\n<img src="{img}" width="200">')
+    create_note(f"# Bare\n\nSee {bare}, it's great")
+
+    assert _collect(user_id) == {orphan}
+    assert all(_exists(path) for path in (variant, img, bare))
+    assert not _exists(orphan)
+
+
+def test_uploads_of_users_with_unindexed_notes_are_kept(uploader):
+    user_id, _, upload, create_note = uploader()
+    orphan = upload()
+    create_note("# Unreadable")
+
+    # As the migration leaves notes whose body could not be decrypted
+    with db.engine.begin() as conn:
+        conn.execute(
+            update(Note.__table__)
+            .where(Note.__table__.c.user_id == user_id)
+            .values(upload_refs_indexed=None)
+        )
+
+    assert _collect(user_id) == set()
+    assert _exists(orphan)
+
+
+def test_uploads_mentioned_without_a_ref_are_kept(uploader):
+    user_id, _, upload, create_note = uploader()
+    mentioned = upload()
+    create_note(f"# Photo\n\n![photo]({mentioned})")
+
+    # A reference lost to some extraction bug
+    with db.engine.begin() as conn:
+        conn.execute(
+            delete(NoteUploadRef.__table__).where(
+                NoteUploadRef.__table__.c.user_id == user_id
+            )
+        )
+
+    assert _collect(user_id) == set()
+    assert _exists(mentioned)
+    last_seen = db.session.query(Upload.last_seen_at).filter_by(path=mentioned).scalar()
+    db.session.remove()
+    assert datetime.datetime.utcnow() - last_seen.replace(
+        tzinfo=None
+    ) < datetime.timedelta(minutes=1)
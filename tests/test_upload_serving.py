@@ -0,0 +1,58 @@
+"""
+Uploads are served with byte ranges and immutable caching under a strong
+ETag, which has to change whenever the bytes served could.
+"""
+
+import io
+
+import pytest
+
+from app import app
+
+
+def _get(client, run, path, headers=None):
+    async def request():
+        response = await client.get(path, headers=headers or {})
+        return response.status_code, response.headers, await response.get_data()
+
+    return run(request())
+
+
+def test_range_requests(client, run, uploader):
+    _, _, upload, _ = uploader()
+    data = bytes(range(256)) * 4
+    path = upload(data)
+
+    status, headers, body = _get(client, run, path)
+    assert (status, body) == (200, data)
+    assert "immutable" in headers["Cache-Control"]
+
+    status, headers, body = _get(client, run, path, {"Range": "bytes=10-19"})
+    assert (status, body) == (206, data[10:20])
+    assert headers["Content-Range"] == f"bytes 10-19/{len(data)}"
+
+    status, _, body = _get(client, run, path, {"Range": "bytes=-100"})
+    assert (status, body) == (206, data[-100:])
+
+    status, _, _ = _get(client, run, path, {"Range": f"bytes={len(data)}-"})
+    assert status == 416
+
+    status, _, _ = _get(client, run, path, {"If-None-Match": headers["ETag"]})
+    assert status == 304
+
+
+def test_variant_etag_follows_quality(client, run, uploader, monkeypatch):
+    image = pytest.importorskip("PIL.Image")
+    buffer = io.BytesIO()
+    image.effect_noise((800, 600), 64).convert("RGB").save(buffer, "PNG")
+    _, _, upload, _ = uploader()
+    path = upload(buffer.getvalue())
+
+    status, headers, low = _get(client, run, path + "?w=640")
+    assert (status, headers["Content-Type"]) == (200, "image/webp")
+
+    monkeypatch.setitem(app.config, "IMAGE_VARIANT_QUALITY", 95)
+    status, other_headers, high = _get(client, run, path + "?w=640")
+    assert status == 200
+    assert other_headers["ETag"] != headers["ETag"]
+    assert high != low